@@ -1,7 +1,23 @@
 # ultrasonic.py
 # MicroPython HC-SR04 driver 
-import time, machine
-from machine import Pin
+import time
+import asyncio
+from array import array
+
+try:
+    import machine
+    from machine import Pin
+except ImportError:     # CPython / unix port: chỉ dùng với pulse_source (TraceSource)
+    machine = Pin = None
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:     # CPython: cùng miền 30 bit như MicroPython (vừa array "i" của bộ lọc)
+    def ticks_ms():
+        return int(time.monotonic() * 1000) & 0x3FFFFFFF
+
+    def ticks_diff(a, b):
+        return ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
 
 try:
     const
@@ -9,6 +25,8 @@ except NameError:  # CPython-type fallback (rare)
     def const(x): return x
 
 _MAX_DISTANCE_CM = const(200)  # clamp to 2m để tránh outlier
+_MAX_DISTANCE_MM = const(2000)
+_ECHO_START_MS = const(5)      # echo lên mức cao ~0.5ms sau xung trigger; chừa thêm cho chắc
 
 def _normalize_key(k: str) -> str:
     # Chuẩn hóa key pin cho lookup (không phân biệt hoa thường, bỏ khoảng trắng)
@@ -74,6 +92,19 @@ class HCSR04:
     Tùy chọn pull:
         sensor = HCSR04("TRIG", "ECHO", pinmap=pinmap,
                         trigger_pull=None, echo_pull=Pin.PULL_DOWN)
+
+    Bộ lọc: mẫu mới nếu lệch không quá `filter_gate_mm` so với trung vị của tối đa
+    `filter_size` mẫu trong `filter_window_ms` gần nhất, ngược lại là chính trung vị đó
+    (filter_gate_mm=0: luôn là trung vị).
+    Mẫu lưu dạng mm (int) trong vòng array cấp phát sẵn, mỗi lần đo chỉ tốn O(filter_size)
+    và không cấp phát, không đo bù chặn. legacy_filter=True dùng lại bộ lọc cũ
+    (chuỗi đơn điệu dài nhất, đo thêm 30 ms khi thiếu mẫu).
+
+    Đo không chặn (asyncio): cạnh echo được đóng dấu ticks_us bằng IRQ của chân,
+    task khác (kể cả BLE) vẫn chạy trong lúc chờ tiếng vọng:
+        d = await sensor.distance()
+        d = sensor.latest()             # giá trị lọc gần nhất, không đo
+    Nhiều cảm biến: xem SonarScheduler.
     """
     def __init__(
         self,
@@ -85,17 +116,48 @@ class HCSR04:
         pinmap=None,
         trigger_pull=None,          # None / Pin.PULL_UP / Pin.PULL_DOWN
         echo_pull=None,             # None / Pin.PULL_UP / Pin.PULL_DOWN
-        trigger_active_high=True    # Một số module cần đảo logic (hiếm)
+        trigger_active_high=True,   # Một số module cần đảo logic (hiếm)
+        filter_size=5,
+        filter_window_ms=500,
+        filter_gate_mm=100,
+        legacy_filter=False,
+        pulse_source=None           # thay phần cứng: đối tượng có pulse_us() (vd TraceSource)
     ):
         self.board = board
         self.pinmap = pinmap or {}
         self.echo_timeout_us = int(echo_timeout_us)
         self.trigger_active_high = bool(trigger_active_high)
 
-        # Lịch sử để lọc (giữ ổn định API cũ)
+        # Lịch sử cho bộ lọc cũ (legacy_filter=True)
+        self.legacy_filter = bool(legacy_filter)
         self._ars = []
         self._ats = []
 
+        # Bộ lọc trung vị: vòng theo thứ tự đến (mm, ticks_ms) + bản sao đã sắp xếp
+        self.filter_window_ms = int(filter_window_ms)
+        self.filter_gate_mm = int(filter_gate_mm)
+        self._size = max(1, int(filter_size))
+        self._ring = array("H", bytes(2 * self._size))
+        self._ts = array("i", bytes(4 * self._size))
+        self._sorted = array("H", bytes(2 * self._size))
+        self._head = 0
+        self._n = 0
+        self._last_mm = -1      # kết quả lọc gần nhất (latest())
+        self._last_ms = 0
+
+        # Đo bằng IRQ (distance()): khởi tạo ở lần dùng đầu
+        self._flag = None
+        self._rise = -1
+        self._pulse = 0
+
+        # Nguồn xung thay cho chân thật (phát lại vết đo, benchmark); đồng hồ của bộ lọc
+        # chạy theo nguồn nếu nó có ticks_ms()
+        self._source = pulse_source
+        self._ticks = getattr(pulse_source, "ticks_ms", ticks_ms)
+        if pulse_source is not None:
+            self.trigger = self.echo = None
+            return
+
         # Resolve pin id từ spec + pinmap
         trig_id = _resolve_pin_id(trigger_pin, self.pinmap)
         echo_id = _resolve_pin_id(echo_pin, self.pinmap)
@@ -106,11 +168,7 @@ class HCSR04:
         # Đặt mức nhàn rỗi cho trigger
         self.trigger.value(1 if not self.trigger_active_high else 0)
 
-    def _send_pulse_and_wait(self):
-        """
-        Gửi xung 10us lên chân trigger và đo thời gian xung phản hồi trên echo.
-        Dùng machine.time_pulse_us để đảm bảo chính xác micro giây.
-        """
+    def _trigger(self):
         # Ổn định cảm biến
         self.trigger.value(1 if not self.trigger_active_high else 0)
         time.sleep_us(5)
@@ -120,6 +178,14 @@ class HCSR04:
         time.sleep_us(10)
         self.trigger.value(1 if not self.trigger_active_high else 0)
 
+    def _send_pulse_and_wait(self):
+        """
+        Gửi xung 10us lên chân trigger và đo thời gian xung phản hồi trên echo.
+        Dùng machine.time_pulse_us để đảm bảo chính xác micro giây.
+        """
+        if self._source is not None:
+            return self._source.pulse_us()
+        self._trigger()
         try:
             pulse_time = machine.time_pulse_us(self.echo, 1, self.echo_timeout_us)
             return pulse_time
@@ -129,13 +195,129 @@ class HCSR04:
                 raise OSError("Out of range")
             raise
 
+    @staticmethod
+    def _to_mm(us):
+        # Âm thanh đi & về: cm = us / 58.2  =>  mm = us * 100 / 582 (làm tròn, chỉ số nguyên)
+        mm = (us * 100 + 291) // 582
+        if mm < 0 or mm > _MAX_DISTANCE_MM:
+            mm = _MAX_DISTANCE_MM
+        return mm
+
+    def _measure_mm(self):
+        return self._to_mm(self._send_pulse_and_wait())
+
+    def _drop(self, mm):
+        # bỏ một giá trị khỏi mảng đã sắp xếp (dồn trái)
+        srt, n = self._sorted, self._n
+        i = 0
+        while srt[i] != mm:
+            i += 1
+        while i < n - 1:
+            srt[i] = srt[i + 1]
+            i += 1
+
+    def _filter(self, mm):
+        """Thêm mẫu (mm), trả về trung vị các mẫu còn trong cửa sổ."""
+        now = self._ticks()
+        size, ring, ts, srt = self._size, self._ring, self._ts, self._sorted
+        # bỏ mẫu quá cửa sổ thời gian, hoặc mẫu cũ nhất khi vòng đã đầy
+        while self._n and (self._n == size or
+                           ticks_diff(now, ts[self._head]) > self.filter_window_ms):
+            self._drop(ring[self._head])
+            self._head = (self._head + 1) % size
+            self._n -= 1
+        i = (self._head + self._n) % size
+        ring[i] = mm
+        ts[i] = now
+        # chèn vào mảng đã sắp xếp
+        j = self._n
+        while j and srt[j - 1] > mm:
+            srt[j] = srt[j - 1]
+            j -= 1
+        srt[j] = mm
+        self._n += 1
+        n = self._n
+        if n & 1:
+            med = srt[n >> 1]
+        else:
+            med = (srt[(n >> 1) - 1] + srt[n >> 1] + 1) >> 1
+        # kiểu Hampel: mẫu mới gần trung vị thì dùng luôn (không trễ khi vật di chuyển),
+        # lệch xa (vọng sai, mất echo) thì thay bằng trung vị
+        if mm - med > self.filter_gate_mm or med - mm > self.filter_gate_mm:
+            mm = med
+        self._last_mm = mm
+        self._last_ms = now
+        return mm
+
+    def latest(self, max_age_ms=None):
+        """Khoảng cách lọc gần nhất (cm), không đo; None nếu chưa có hoặc cũ hơn max_age_ms."""
+        if self._last_mm < 0:
+            return None
+        if max_age_ms is not None and ticks_diff(self._ticks(), self._last_ms) > max_age_ms:
+            return None
+        return self._last_mm / 10
+
+    # ====== Đo không chặn bằng IRQ ======
+    def _on_echo(self, pin):
+        # IRQ cả hai cạnh của echo: chỉ ghi ticks_us, không cấp phát
+        t = time.ticks_us()
+        if pin.value():
+            self._rise = t
+        elif self._rise >= 0:
+            self._pulse = time.ticks_diff(t, self._rise)
+            self._rise = -1
+            self._flag.set()
+
+    def _irq_init(self):
+        self._flag = asyncio.ThreadSafeFlag()
+        trig = Pin.IRQ_RISING | Pin.IRQ_FALLING
+        try:
+            # hard IRQ: dấu thời gian không bị trễ theo hàng đợi schedule (BLE bận)
+            self.echo.irq(handler=self._on_echo, trigger=trig, hard=True)
+        except TypeError:
+            self.echo.irq(handler=self._on_echo, trigger=trig)
+
+    async def distance(self):
+        """
+        Đo không chặn: phát xung rồi chờ (await) IRQ cạnh xuống của echo.
+        Trả về cm đã lọc (bộ lọc trung vị, kể cả khi legacy_filter=True, vì bộ lọc cũ
+        có thể đo bù chặn); hết echo_timeout_us -> OSError("Out of range").
+        """
+        if self._source is not None:
+            return self._filter(self._measure_mm()) / 10
+        if self._flag is None:
+            self._irq_init()
+        self._flag.clear()      # bỏ cạnh muộn của lần đo trước
+        self._rise = -1
+        self._trigger()
+        try:
+            await asyncio.wait_for_ms(self._flag.wait(),
+                                      self.echo_timeout_us // 1000 + _ECHO_START_MS)
+        except asyncio.TimeoutError:
+            self._rise = -1
+            raise OSError("Out of range")
+        return self._filter(self._to_mm(self._pulse)) / 10
+
+    def reset_filter(self):
+        """Xóa lịch sử lọc (vd sau khi đổi hướng cảm biến)."""
+        self._n = 0
+        self._head = 0
+        self._ars = []
+        self._ats = []
+
     def distance_mm(self):
-        return int(self.distance_cm() * 10)
+        if self.legacy_filter:
+            return int(self.distance_cm() * 10)
+        return self._filter(self._measure_mm())
 
     def distance_cm(self, filter=True):
         """
-        Trả về khoảng cách (cm) dưới dạng float, có lọc nhiễu nhẹ theo cửa sổ thời gian.
+        Trả về khoảng cách (cm) dưới dạng float, có lọc nhiễu theo cửa sổ thời gian
+        (độ phân giải 0.1 cm). filter=False: giá trị thô của lần đo này.
         """
+        if filter and not self.legacy_filter:
+            return self._filter(self._measure_mm()) / 10
+
         pulse_time = self._send_pulse_and_wait()
 
         # Âm thanh đi & về: chia 2;  tốc độ âm thanh ~0.03432 cm/us => ~29.1 us/cm
@@ -147,28 +329,31 @@ class HCSR04:
 
         if not filter:
             return cms
+        return self._filter_legacy(cms)
 
-        # Bộ lọc ổn định (same as previous version, giữ tương thích)
+    def _filter_legacy(self, cms):
+        # Bộ lọc cũ (legacy_filter=True): giữ nguyên kết quả như các bản trước
         self._ars.append(cms)
-        self._ats.append(time.time_ns())
+        self._ats.append(self._ticks())
         if len(self._ars) > 5:
             self._ars.pop(0)
             self._ats.pop(0)
 
         # Giữ cửa sổ trong ~0.5s
-        while self._ats and (self._ats[-1] - self._ats[0] > 5e8):
+        while self._ats and ticks_diff(self._ats[-1], self._ats[0]) > 500:
             self._ars.pop(0)
             self._ats.pop(0)
 
         # Nếu chưa đủ mẫu, đo thêm một nhịp ngắn
         if len(self._ars) < 2:
-            time.sleep_ms(30)
+            if self._source is None:
+                time.sleep_ms(30)
             pulse_time = self._send_pulse_and_wait()
             cms2 = (pulse_time / 2.0) / 29.1
             if cms2 < 0 or cms2 > _MAX_DISTANCE_CM:
                 cms2 = _MAX_DISTANCE_CM
             self._ars.append(cms2)
-            self._ats.append(time.time_ns())
+            self._ats.append(self._ticks())
 
         # Chọn giá trị "ổn" (tương tự bản cũ)
         N = len(self._ars)
@@ -189,3 +374,103 @@ class HCSR04:
             vald = sum(self._ars) / N
 
         return round(vald * 10) / 10
+
+
+class TraceSource:
+    """
+    Nguồn xung phát lại một vết đo thay cho phần cứng (HCSR04(pulse_source=...)).
+    Vết là list (t_ms, us[, true_mm]): us < 0 = không có echo (OSError "Out of range"),
+    true_mm (nếu có) là khoảng cách thật để đánh giá bộ lọc. ticks_ms() trả t_ms của
+    mục vừa phát, nên cửa sổ thời gian của bộ lọc chạy theo vết chứ không theo đồng hồ.
+    Hết vết -> IndexError.
+    """
+    def __init__(self, trace):
+        self.trace = trace
+        self.i = 0
+        self.now = 0
+        self.truth = None       # true_mm của mục vừa phát
+
+    def pulse_us(self):
+        rec = self.trace[self.i]
+        self.i += 1
+        self.now = rec[0]
+        self.truth = rec[2] if len(rec) > 2 else None
+        if rec[1] < 0:
+            raise OSError("Out of range")
+        return rec[1]
+
+    def ticks_ms(self):
+        return self.now & 0x3FFFFFFF
+
+    @staticmethod
+    def load(path):
+        """Đọc vết dạng văn bản: mỗi dòng "t_ms us [true_mm]", '#' là chú thích."""
+        out = []
+        with open(path) as f:
+            for line in f:
+                line = line.split("#")[0].split()
+                if line:
+                    out.append(tuple(int(x) for x in line))
+        return out
+
+    @staticmethod
+    def save(path, trace):
+        with open(path, "w") as f:
+            for rec in trace:
+                f.write(" ".join(str(x) for x in rec) + "\n")
+
+
+def record(sensor, n, period_ms=60):
+    """Ghi vết từ cảm biến thật: n lần đo thô cách nhau period_ms -> [(t_ms, us)]."""
+    out = []
+    for _ in range(n):
+        t = ticks_ms()
+        try:
+            us = sensor._send_pulse_and_wait()
+        except OSError:
+            us = -1
+        out.append((t, us))
+        rest = period_ms - ticks_diff(ticks_ms(), t)
+        if rest > 0:
+            time.sleep_ms(rest)
+    return out
+
+
+class SonarScheduler:
+    """
+    Đọc lần lượt nhiều HCSR04 trong một task asyncio: mỗi lúc chỉ một cảm biến phát xung
+    và hai lần phát cách nhau ít nhất `spacing_ms` (HC-SR04 khuyên >= 60 ms để tiếng vọng
+    cũ tắt hẳn, tránh cảm biến này nghe nhầm xung của cảm biến kia).
+
+        sonar = SonarScheduler([front, left, right])
+        sonar.start()
+        ...
+        d = front.latest(max_age_ms=500)    # None nếu cảm biến không có echo gần đây
+    """
+    def __init__(self, sensors, spacing_ms=60):
+        self.sensors = list(sensors)
+        self.spacing_ms = int(spacing_ms)
+        self.misses = 0         # số lần đo không có echo (ngoài tầm)
+        self._task = None
+
+    async def run(self):
+        while True:
+            for s in self.sensors:
+                t0 = ticks_ms()
+                try:
+                    await s.distance()
+                except OSError:
+                    self.misses += 1
+                rest = self.spacing_ms - ticks_diff(ticks_ms(), t0)
+                await asyncio.sleep_ms(rest if rest > 0 else 0)
+
+    def start(self):
+        """Chạy run() như một task (cần vòng lặp asyncio đang chạy)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
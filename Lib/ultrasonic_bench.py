@@ -0,0 +1,274 @@
+# ultrasonic_bench.py — đo bộ lọc HCSR04 ngoài phần cứng bằng vết phát lại (TraceSource)
+#   python ultrasonic_bench.py                       (CPython)
+#   micropython ultrasonic_bench.py                  (MicroPython unix port)
+#   python ultrasonic_bench.py --trace log.txt       (vết ghi từ cảm biến thật, xem ultrasonic.record)
+#   python ultrasonic_bench.py --save base.json      (lưu số đo làm mốc)
+#   python ultrasonic_bench.py --baseline base.json  (so với mốc, exit 1 nếu tụt)
+#
+# Mỗi chế độ (raw / median / legacy) chạy trên vài vết tổng hợp: vật tiến lùi 20..150 cm,
+# kèm nhiễu, xung vọng sai (spike), mất echo trả về tối đa (dropout) và hết giờ (timeout).
+# Cột: thời gian mỗi lần gọi (us, p50/p99), cấp phát (MicroPython: B/lần gọi với gc tắt;
+# CPython: đỉnh tracemalloc, chỉ để so giữa các lần chạy), sai số tuyệt đối so với khoảng
+# cách thật (mm, trung bình/p95) và độ trễ ước lượng (ms) của đầu ra so với thật.
+import gc
+import sys
+import time
+from array import array
+
+from ultrasonic import HCSR04, TraceSource
+
+_MPY = sys.implementation.name == "micropython"
+
+# đồng hồ đo thời gian mỗi lần gọi: us trên MicroPython, ns trên CPython (gọi quá nhanh)
+if _MPY:
+    _now = time.ticks_us
+    _diff = time.ticks_diff
+    _PER_US = 1
+else:
+    import tracemalloc
+    _now = time.perf_counter_ns
+    _PER_US = 1000
+
+    def _diff(a, b):
+        return a - b
+
+# chỉ số so với mốc (càng nhỏ càng tốt) và độ chênh tuyệt đối bỏ qua (nhiễu đo).
+# "cost" = p50 mỗi lần gọi tính theo vòng chuẩn 1000 us đo sát lượt đó: bớt phụ thuộc tốc độ máy lúc đo
+_CHECKS = (("cost", 0.5), ("mae", 1.0))
+_MODES = ("raw", "median", "legacy")
+
+class _Rand:
+    # xorshift32: cùng một chuỗi trên CPython và MicroPython
+    def __init__(self, seed):
+        self.x = seed or 1
+
+    def next(self):
+        x = self.x
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self.x = x
+        return x
+
+    def below(self, n):
+        return self.next() % n
+
+    def chance(self, permille):
+        return self.next() % 1000 < permille
+
+def synth(n=2000, period_ms=20, seed=1, noise_mm=3, spikes=0, dropouts=0, timeouts=0):
+    """
+    Vết tổng hợp [(t_ms, us, true_mm)]: vật đi 200 -> 1500 -> 200 mm mỗi 4 s.
+    spikes/dropouts/timeouts: phần nghìn số lần đo bị vọng sai (khoảng cách ngẫu nhiên),
+    mất echo (đọc ra tối đa) hoặc hết giờ (us = -1).
+    """
+    r = _Rand(seed)
+    out = []
+    for i in range(n):
+        t = i * period_ms
+        ph = t % 4000
+        tri = ph if ph < 2000 else 4000 - ph
+        mm = 200 + 1300 * tri // 2000
+        if r.chance(timeouts):
+            us = -1
+        elif r.chance(dropouts):
+            us = 30000
+        elif r.chance(spikes):
+            us = r.below(2000) * 582 // 100
+        else:
+            us = (mm + r.below(2 * noise_mm + 1) - noise_mm) * 582 // 100
+        out.append((t, us, mm))
+    return out
+
+SCENARIOS = (
+    ("clean", dict()),
+    ("spiky", dict(spikes=50)),
+    ("lossy", dict(dropouts=50, timeouts=50)),
+    ("harsh", dict(noise_mm=10, spikes=50, dropouts=30, timeouts=30)),
+)
+
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return 0
+    k = min(len(sorted_vals) - 1, len(sorted_vals) * p // 100)
+    return sorted_vals[k]
+
+def calibrate(repeat=5):
+    """Thời gian (us) của một vòng tính cố định, lấy lần nhanh nhất: đơn vị cho "cost"."""
+    best = None
+    for _ in range(repeat):
+        r = _Rand(7)
+        t0 = _now()
+        for _ in range(2000):
+            r.below(1000)
+        t = _diff(_now(), t0) / _PER_US
+        if best is None or t < best:
+            best = t
+    return best
+
+def _pass(trace, mode, filter_size, filter_window_ms, trace_alloc):
+    # một lượt qua vết: (lat, got, truth, calls, missed, alloc)
+    n = len(trace)
+    src = TraceSource(trace)
+    s = HCSR04(0, 0, pulse_source=src, legacy_filter=(mode == "legacy"),
+               filter_size=filter_size, filter_window_ms=filter_window_ms)
+    lat = array("I", bytes(4 * n))
+    got = array("h", bytes(2 * n))
+    truth = array("h", bytes(2 * n))
+    calls = missed = 0
+    last = 0
+    alloc = 0
+    gc.collect()
+    if _MPY:
+        gc.disable()
+        a0 = gc.mem_alloc()
+    elif trace_alloc:
+        tracemalloc.start()
+    try:
+        while src.i < n:
+            t0 = _now()
+            try:
+                if mode == "raw":
+                    v = s._measure_mm()
+                elif mode == "legacy":
+                    v = int(s.distance_cm() * 10)
+                else:
+                    v = s.distance_mm()
+            except OSError:
+                v = last
+                missed += 1
+            except IndexError:
+                break       # bộ lọc cũ đo bù và đọc quá cuối vết
+            lat[calls] = _diff(_now(), t0)
+            got[calls] = v
+            truth[calls] = src.truth
+            last = v
+            calls += 1
+    finally:
+        if _MPY:
+            alloc = (gc.mem_alloc() - a0) // max(1, calls)
+            gc.enable()
+        elif trace_alloc:
+            alloc = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return lat, got, truth, calls, missed, alloc
+
+def run(trace, mode, filter_size=5, filter_window_ms=500, repeat=5):
+    """
+    Chạy một chế độ trên một vết; trả về dict số đo. Thời gian lấy lượt nhanh nhất trong
+    `repeat` lượt sau một lượt làm nóng; trên CPython cấp phát đo ở một lượt riêng (tracemalloc làm chậm).
+    """
+    _pass(trace, mode, filter_size, filter_window_ms, False)     # làm nóng (cache, JIT của CPython)
+    us = cost = None
+    for _ in range(repeat):
+        # vòng chuẩn đo sát từng lượt: máy ảo/CPU đổi xung nhịp giữa chừng vẫn so được
+        unit = calibrate(2)
+        lat, got, truth, calls, missed, alloc = _pass(trace, mode, filter_size,
+                                                      filter_window_ms, False)
+        unit = min(unit, calibrate(2))
+        cur = sorted(lat[i] for i in range(calls))
+        c = _pct(cur, 50) / _PER_US * 1000 / unit
+        if us is None or _pct(cur, 50) < _pct(us, 50):
+            us = cur
+        if cost is None or c < cost:
+            cost = c
+    if not _MPY:
+        alloc = _pass(trace, mode, filter_size, filter_window_ms, True)[5]
+    errs = sorted(abs(got[i] - truth[i]) for i in range(calls))
+    return {
+        "mode": mode,
+        "calls": calls,
+        "missed": missed,
+        "us_p50": _pct(us, 50) / _PER_US,
+        "us_p99": _pct(us, 99) / _PER_US,
+        "cost": cost,
+        "alloc": alloc,
+        "mae": sum(errs) / calls if calls else 0,
+        "err_p95": _pct(errs, 95),
+        "lag_ms": _lag(got, truth, calls, trace),
+    }
+
+def _lag(got, truth, calls, trace, max_shift=25):
+    # độ dịch k (mẫu) làm đầu ra khớp nhất với khoảng cách thật trễ k mẫu
+    if calls < 2 * max_shift:
+        return 0
+    best, best_k = None, 0
+    for k in range(max_shift):
+        e = 0
+        for i in range(max_shift, calls):
+            e += abs(got[i] - truth[i - k])
+        if best is None or e < best:
+            best, best_k = e, k
+    return best_k * (trace[1][0] - trace[0][0])
+
+def _print(rows):
+    head = "%-6s %-7s %6s %6s %7s %7s %8s %7s %7s %6s" % (
+        "trace", "mode", "calls", "miss", "us_p50", "us_p99",
+        "alloc" if _MPY else "peak_B", "mae_mm", "p95_mm", "lag_ms")
+    print(head)
+    print("-" * len(head))
+    for r in rows:
+        print("%-6s %-7s %6d %6d %7.1f %7.1f %8d %7.1f %7d %6d" % (
+            r["trace"], r["mode"], r["calls"], r["missed"], r["us_p50"], r["us_p99"],
+            r["alloc"], r["mae"], r["err_p95"], r["lag_ms"]))
+
+def compare(rows, baseline, tolerance):
+    """Mô tả các chỉ số tệ hơn mốc quá `tolerance` (tỉ lệ)."""
+    base = {}
+    for b in baseline:
+        base[b["trace"] + "/" + b["mode"]] = b
+    out = []
+    for r in rows:
+        b = base.get(r["trace"] + "/" + r["mode"])
+        if not b:
+            continue
+        for name, slack in _CHECKS:
+            old, new = b[name], r[name]
+            if new - old > slack and (not old or (new - old) / old > tolerance):
+                out.append("%s/%s %s: %.3g -> %.3g" % (r["trace"], r["mode"], name, old, new))
+    return out
+
+def main(argv):
+    opts = {}
+    i = 0
+    while i < len(argv):
+        if argv[i].startswith("--") and i + 1 < len(argv):
+            opts[argv[i][2:]] = argv[i + 1]
+            i += 2
+        else:
+            raise SystemExit("usage: ultrasonic_bench.py [--trace F] [--n N] [--modes raw,median,legacy]"
+                             " [--save F] [--baseline F] [--tolerance 0.25]")
+    n = int(opts.get("n", 2000))
+    if "trace" in opts:
+        traces = (("file", TraceSource.load(opts["trace"])),)
+    else:
+        traces = tuple((name, synth(n, **kw)) for name, kw in SCENARIOS)
+    modes = opts["modes"].split(",") if "modes" in opts else _MODES
+    rows = []
+    for name, trace in traces:
+        if len(trace[0]) < 3:
+            # vết thật không có khoảng cách thật: so với chính giá trị thô
+            trace = [(t, us, us * 100 // 582 if 0 <= us * 100 // 582 <= 2000 else 2000)
+                     for t, us in trace]
+        for mode in modes:
+            r = run(trace, mode)
+            r["trace"] = name
+            rows.append(r)
+    print("[BENCH] %s %s, calibration loop %.0f us" % (
+        sys.implementation.name, sys.version.split()[0], calibrate()))
+    _print(rows)
+    import json
+    if "save" in opts:
+        with open(opts["save"], "w") as f:
+            json.dump(rows, f)
+    if "baseline" in opts:
+        with open(opts["baseline"]) as f:
+            bad = compare(rows, json.load(f), float(opts.get("tolerance", 0.25)))
+        for line in bad:
+            print("[BENCH] REGRESSION", line)
+        if bad:
+            sys.exit(1)
+        print("[BENCH] OK vs", opts["baseline"])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,141 +1,921 @@
 # ble.py — BLE wrapper + PUT/DATA/DONE (patched: no slice deletion on bytearray)
 from machine import reset
+from micropython import schedule
 import os
 import ubinascii
+import bytecache
 from bleuart import BLEUART
+from upload import UploadWriter, load_state, block_crcs
+from time import ticks_us, ticks_diff
+from utility import (log, log_debug, log_error, logs, mem_sample, stats, stats_reset,
+                     safe_decode, arg_text,
+                     LOG_LEVEL, LOG_DEBUG, STATS, RX_BYTES, RX_WRITES, RX_LINES, RX_FRAMES,
+                     RX_OVERFLOW, RX_WRAPS, RX_PEAK, CHUNKS, DECODE_US, NAKS, DUPS)
 
 try:
     from setting import BLE_NAME
 except Exception:
     BLE_NAME = "ESP32-BLE-OTA"
 
-def _safe_decode(b):
-    # MicroPython không hỗ trợ errors="ignore" trong .decode()
-    try:
-        return b.decode()
-    except Exception:
-        try:
-            return b.decode("latin-1")
-        except Exception:
-            # thay byte lạ bằng '.'
-            return "".join(chr(x) if 32 <= x < 127 else "." for x in b)
+try:
+    from setting import BLE_WINDOW
+except Exception:
+    BLE_WINDOW = 8
+
+try:
+    from setting import BLE_RX_BUF
+except Exception:
+    BLE_RX_BUF = 2048
+
+try:
+    from setting import BLE_TX_BUF
+except Exception:
+    BLE_TX_BUF = 2048
+
+try:
+    from setting import BLE_BLOCK_SIZE
+except Exception:
+    BLE_BLOCK_SIZE = 4096
+
+try:
+    from setting import BLE_RX_BUDGET
+except Exception:
+    BLE_RX_BUDGET = 8
+
+try:
+    _ilistdir = os.ilistdir
+except AttributeError:
+    # CPython (trình giả lập): cùng dạng (name, type, inode, size) như MicroPython
+    def _ilistdir(path="."):
+        with os.scandir(path) as it:
+            for e in it:
+                d = e.is_dir()
+                yield e.name, 0x4000 if d else 0x8000, 0, 0 if d else e.stat().st_size
+
+def _parse_opts(tokens):
+    """Tùy chọn sau PUT: 'BIN' -> {'BIN': True}, 'K=V' -> {'K': 'V'}."""
+    opts = {}
+    for t in tokens:
+        k, sep, v = t.partition("=")
+        opts[k.upper()] = v if sep else True
+    return opts
+
+def _hex_opt(v):
+    # CRC dạng hex trong tùy chọn; cờ trần (True) hoặc thiếu -> không kiểm tra
+    return int(v, 16) if isinstance(v, str) else None
+
+# log từng dòng lệnh nhận được chỉ khi LOG_LEVEL = LOG_DEBUG (không bao giờ log DATA)
+_LOG_RX = LOG_LEVEL >= LOG_DEBUG
+
+# Chế độ nhị phân: mỗi frame = <len:u16 LE><seq:u16 LE><payload>; len = 0 -> về text
+# len = 0xFFFF: frame COPY (DELTA), payload = <offset:u32 LE><count:u32 LE> trong file cũ
+_FRAME_HDR = 4
+_FRAME_MAX = 1024
+_FRAME_COPY = 0xFFFF
+_COPY_LEN = 8
+
+# GET: frame thiết bị -> host = <0x01><len:u16 LE><seq:u16 LE><payload>, xen giữa các dòng text
+# (0x01 không bao giờ mở đầu dòng text; 0x00 là frame telemetry)
+_GET_MARK = 0x01
+_GET_HDR = 5
+# Terminal (blerepl.py), cả hai chiều, chỉ ở chế độ text: <0x02><len:u8><byte...>
+_TERM_MARK = 0x02
+_TX_RESERVE = 128   # chừa chỗ trong hàng đợi TX cho dòng phản hồi cuối (LS MORE, EOF...)
+_LS_PAGE = 32
 
 class BLEMain:
     def __init__(self, name=BLE_NAME):
         self.name = name
         self.uart = None
-        self._rx_buf = bytearray()
+        # RX: vòng đệm cấp phát sẵn + vùng tạm để nối dòng/frame vắt qua cuối vòng.
+        # Một bên ghi (IRQ: _rx_write, _rx_drop) và một bên đọc (_rx_process), mỗi chỉ số chỉ
+        # do một bên đổi; chỉ số chạy trong 0..2*size để phân biệt vòng đầy với vòng rỗng.
+        self._rx = bytearray(BLE_RX_BUF)
+        self._rx_mv = memoryview(self._rx)
+        self._rx_lin = memoryview(bytearray(BLE_RX_BUF))
+        self._rx_head = 0           # bên đọc: byte chưa xử lý đầu tiên
+        self._rx_len = 0            # bên đọc: số byte có sẵn, chụp lại mỗi mục (_rx_fill)
+        self._rx_tail = 0           # IRQ: chỗ ghi tiếp theo
+        self._rx_cut = 0            # IRQ: bỏ mọi byte trước mốc này (tràn, mất kết nối)...
+        self._rx_ovf = 0            # ... do lần ghi tràn n byte (0: mất kết nối)
+        self._rx_drops = 0          # IRQ: đếm số lần đánh dấu bỏ
+        self._rx_dropped = 0        # bên đọc: số lần bỏ đã áp dụng
+        self._rx_lost = 0           # IRQ: đếm số lần mất kết nối
+        self._rx_closed = 0         # bên đọc: số lần mất kết nối đã dọn phiên
+        self._rx_skip = False
+        self._rx_hold = 0           # bên đọc: byte đã tiêu thụ nhưng mục đang xử lý còn dùng
+        self._rx_busy = False       # _rx_process đang chạy
+        self._rx_pending = False    # đã hẹn _rx_run, chưa chạy
+        self._rx_run_cb = self._rx_run  # giữ bound method, tránh cấp phát khi schedule
         self._put = None
+        self._bundle = None         # BUNDLE: {"count", "files": [UploadWriter đã đủ], "seq"}
+        self._get = None            # GET đang gửi: file, cửa sổ, CRC (xem _cmd_get)
+        self._blk = None            # block ghi flash (và bộ đệm đọc của HASH/GET), cấp phát một lần
+        self._bin = False
         self._started = False
+        self.term_rx = None         # handler(memoryview) cho frame terminal từ host, xem blerepl.py
+        # opcode (chữ hoa) -> handler(arg); thêm lệnh mới bằng register()
+        self._cmds = {
+            "DATA": self._on_data,
+            "PING": self._cmd_ping,
+            "ECHO": self._cmd_echo,
+            "LS": self._cmd_ls,
+            "STAT": self._cmd_stat,
+            "GET": self._cmd_get,
+            "ACK": self._cmd_ack,
+            "NAK": self._cmd_nak,
+            "STATS": self._cmd_stats,
+            "LOGS": self._cmd_logs,
+            "RESET": self._cmd_reset,
+            "HASH": self._cmd_hash,
+            "COPY": self._cmd_copy,
+            "RESUME": self._cmd_resume,
+            "PUT": self._cmd_put,
+            "BUNDLE": self._cmd_bundle,
+            "FILE": self._cmd_file,
+            "DONE": self._cmd_done,
+        }
+
+    def _on_conn(self, connected):
+        # Gọi từ IRQ BLE: chỉ bỏ dữ liệu RX dở và đánh dấu mất kết nối. Phiên upload/GET và
+        # trạng thái bên đọc do _rx_fill() dọn ở lượt xử lý kế tiếp (ghi flash/NVS ngoài IRQ);
+        # hàng đợi schedule đầy thì lượt đó là lần nhận đầu tiên sau khi kết nối lại
+        if connected:
+            return
+        self._rx_drop(0)
+        self._rx_lost = (self._rx_lost + 1) & 0xFFFF
+        self._rx_defer()
+
+    def _close_session(self):
+        # bên đọc, sau khi mất kết nối giữa chừng: giữ phần upload đã nhận để RESUME
+        self._rx_skip = False
+        self._bin = False
+        self._get_close()
+        if self._bundle is not None:
+            self._abort_bundle()
+        if self._put:
+            try:
+                self._put["w"].suspend()
+                log("[BLE] Upload suspended at", self._put["w"].committed)
+            except Exception as e:
+                log_error("[BLE] Upload suspend error:", e)
+            self._put = None
 
     def _on_rx(self, data):
+        # Gọi từ IRQ BLE: chỉ chép vào vòng đệm rồi hẹn xử lý (giải mã, ghi flash, ACK)
+        # ra ngoài IRQ, để stack BLE nhận tiếp trong lúc flash đang bận
         if not data:
             return
-        # Ghép buffer, tách theo \n — KHÔNG dùng `del` trên bytearray
-        self._rx_buf.extend(data)
-        # Cắt lần lượt từng dòng kết thúc bằng '\n'
-        while True:
-            i = self._rx_buf.find(b"\n")
+        STATS[RX_WRITES] += 1
+        STATS[RX_BYTES] += len(data)
+        self._rx_write(data)
+        if not self._rx_defer():
+            # hàng đợi schedule đầy: xử lý luôn tại chỗ, trừ khi IRQ này cắt ngang đúng
+            # lượt xử lý đang chạy (lượt đó đọc lại _rx_tail nên vẫn thấy dữ liệu mới)
+            self._rx_process()
+
+    def _rx_defer(self):
+        """Hẹn _rx_run chạy ngoài IRQ; False nếu hàng đợi schedule đầy."""
+        if self._rx_pending:
+            return True
+        self._rx_pending = True
+        try:
+            schedule(self._rx_run_cb, None)
+        except RuntimeError:
+            self._rx_pending = False
+            return False
+        return True
+
+    def _rx_run(self, _):
+        self._rx_pending = False
+        self._rx_process()
+
+    def _rx_process(self):
+        if self._rx_busy:
+            return
+        self._rx_busy = True
+        # Gom mọi phản hồi của lượt này thành ít notify nhất có thể
+        self.uart.cork()
+        try:
+            # Tách theo \n (text) hoặc theo frame (BIN), tiêu thụ dần từ đầu vòng;
+            # tối đa BLE_RX_BUDGET mục mỗi lượt rồi nhường cho IRQ/chương trình chính
+            k = BLE_RX_BUDGET
+            while self._rx_fill():
+                if not k:
+                    if self._rx_defer():
+                        break
+                    k = BLE_RX_BUDGET
+                if self._bin:
+                    n = self._take_frame()
+                elif self._rx_byte(0) == _TERM_MARK and not self._rx_skip:
+                    n = self._take_term()
+                else:
+                    n = self._take_line()
+                if not n:
+                    break
+                self._rx_hold = 0
+                k -= 1
+        finally:
+            self._rx_hold = 0
+            self.uart.uncork()
+            self._rx_busy = False
+
+    # ====== Vòng đệm RX ======
+    def _rx_used(self):
+        # phía IRQ: số byte đang chiếm vòng (phần đã đánh dấu bỏ coi như đã trống)
+        head = self._rx_cut if self._rx_drops != self._rx_dropped else self._rx_head
+        return (self._rx_tail - head) % (2 * len(self._rx)) + self._rx_hold
+
+    def _rx_write(self, data):
+        # phía IRQ: chỉ đổi _rx_tail (và mốc bỏ khi tràn), không đụng trạng thái bên đọc
+        size = len(self._rx)
+        n = len(data)
+        if n > size - self._rx_used():
+            # Dòng/frame dài hơn vòng đệm, hoặc host gửi vượt cửa sổ khi bên xử lý
+            # chưa kịp: bỏ hết và báo rõ cho host thay vì cắt ngầm
+            STATS[RX_OVERFLOW] += 1
+            self._rx_drop(n)
+            return False
+        src = memoryview(data)
+        tail = self._rx_tail % size
+        first = min(n, size - tail)
+        self._rx_mv[tail:tail + first] = src[:first]
+        if n > first:
+            self._rx_mv[:n - first] = src[first:]
+        self._rx_tail = (self._rx_tail + n) % (2 * size)
+        n = self._rx_used()
+        if n > STATS[RX_PEAK]:
+            STATS[RX_PEAK] = n
+        return True
+
+    def _rx_drop(self, n):
+        # phía IRQ: bỏ mọi byte đã ghi; bên đọc dời _rx_head tới mốc này ở _rx_fill()
+        self._rx_cut = self._rx_tail
+        self._rx_ovf = n
+        self._rx_drops = (self._rx_drops + 1) & 0xFFFF
+
+    def _rx_fill(self):
+        # phía đọc: áp dụng mốc bỏ của IRQ (nếu có), chụp số byte đang có vào _rx_len.
+        # Đọc _rx_lost trước _rx_drops: IRQ đánh dấu bỏ trước khi đếm mất kết nối, nên khi
+        # dọn phiên thì mốc bỏ của lần mất kết nối đó chắc chắn đã được áp dụng
+        lost = self._rx_lost
+        d = self._rx_drops
+        if d != self._rx_dropped:
+            self._rx_head = self._rx_cut
+            self._rx_dropped = d
+            n = self._rx_ovf
+            if n:
+                log_error("[BLE] RX overflow", n)
+                self._rx_skip = not self._bin   # text: bỏ nốt phần còn lại của dòng hỏng
+                self._bin = False               # BIN: mất đồng bộ frame, host phải PUT lại
+                self.uart.send("ERR OVERFLOW %d\n" % n)
+        if lost != self._rx_closed:
+            self._rx_closed = lost
+            self._close_session()
+        self._rx_len = (self._rx_tail - self._rx_head) % (2 * len(self._rx))
+        return self._rx_len
+
+    def _rx_consume(self, n):
+        # phía đọc: chỉ dời _rx_head (không quay về đầu vòng khi rỗng: _rx_tail là của IRQ)
+        self._rx_len -= n
+        self._rx_head = (self._rx_head + n) % (2 * len(self._rx))
+
+    def _rx_take(self, n):
+        # phía đọc: tiêu thụ mục n byte TRƯỚC khi xử lý, để handler lỗi không làm nó bị xử lý
+        # lại mãi; _rx_hold giữ chỗ tới hết mục để IRQ không ghi đè view handler đang đọc
+        self._rx_hold += n
+        self._rx_consume(n)
+        return n
+
+    def _rx_byte(self, off):
+        return self._rx[(self._rx_head + off) % len(self._rx)]
+
+    def _rx_find(self, ch):
+        """Vị trí (tính từ đầu vòng) của byte `ch` đầu tiên, -1 nếu chưa có."""
+        size = len(self._rx)
+        head = self._rx_head % size
+        end = head + self._rx_len
+        i = self._rx.find(ch, head, min(end, size))
+        if i >= 0:
+            return i - head
+        if end > size:
+            i = self._rx.find(ch, 0, end - size)
+            if i >= 0:
+                return size - head + i
+        return -1
+
+    def _rx_view(self, off, n):
+        """memoryview n byte từ vị trí off; chỉ chép khi đoạn vắt qua cuối vòng."""
+        size = len(self._rx)
+        start = (self._rx_head + off) % size
+        if start + n <= size:
+            return self._rx_mv[start:start + n]
+        first = size - start
+        lin = self._rx_lin
+        lin[:first] = self._rx_mv[start:]
+        lin[first:n] = self._rx_mv[:n - first]
+        STATS[RX_WRAPS] += 1
+        return lin[:n]
+
+    def _take_line(self):
+        # Trả về số byte đã tiêu thụ (0 nếu chưa đủ một dòng)
+        i = self._rx_find(b"\n")
+        if self._rx_skip:
             if i < 0:
-                break
-            line_b = bytes(self._rx_buf[:i])    # copy phần dòng ra bytes
-            self._rx_buf = self._rx_buf[i+1:]   # gán lại phần còn lại (không xóa slice)
-            line = _safe_decode(line_b).strip()
-            self._handle_line(line)
-
-        # Chặn trường hợp peer gửi quá dài mà không có '\n'
-        if len(self._rx_buf) > 4096:
-            # tránh chiếm RAM vô hạn
-            self._rx_buf = self._rx_buf[-1024:]
-
-    def _handle_line(self, line):
-        print("[BLE][RX]:", line)
-        low = line.lower()
-
-        # 1) ECHO/PING
-        if low == "ping":
-            self.uart.send("PONG\n"); return
-        if low.startswith("echo "):
-            self.uart.send(line[5:] + "\n"); return
-
-        # 2) LS
-        if low == "ls":
-            try:
-                self.uart.send("FILES " + ",".join(os.listdir()) + "\n")
-            except Exception as e:
-                self.uart.send("ERR LS %s\n" % e)
+                # vẫn trong dòng hỏng: bỏ ngay, không để vòng đầy lại
+                return self._rx_take(self._rx_len)
+            self._rx_skip = False
+            return self._rx_take(i + 1)
+        if i < 0:
+            return 0
+        STATS[RX_LINES] += 1
+        line = self._rx_view(0, i)
+        self._rx_take(i + 1)
+        self._dispatch(line)
+        return i + 1
+
+    def _take_term(self):
+        # frame terminal giữa các dòng lệnh; không có REPL gắn vào thì bỏ qua
+        if self._rx_len < 2:
+            return 0
+        n = self._rx_byte(1)
+        if self._rx_len < 2 + n:
+            return 0
+        data = self._rx_view(2, n)
+        self._rx_take(2 + n)
+        if self.term_rx is not None:
+            self.term_rx(data)
+        return 2 + n
+
+    def _dispatch(self, line):
+        # Chỉ tách token lệnh đầu dòng; phần sau được chuyển nguyên dạng (memoryview,
+        # không decode/lower/chép) -> chi phí mỗi dòng không phụ thuộc độ dài payload
+        n = len(line)
+        s = 0
+        while s < n and line[s] in b" \t\r":
+            s += 1
+        e = s
+        while e < n and line[e] not in b" \t\r":
+            e += 1
+        op = safe_decode(bytes(line[s:e])).upper()
+        arg = line[e + 1:] if e < n else line[n:]
+        if _LOG_RX and op != "DATA":
+            log_debug("[BLE][RX]:", op, bytes(arg[:40]))
+        h = self._cmds.get(op)
+        if h is None:
+            self.uart.send("ERR UNKNOWN\n")
             return
+        try:
+            h(arg)
+        except Exception as e:
+            # handler (nhất là lệnh đăng ký qua register()) lỗi: báo host, dòng đã được tiêu thụ
+            log_error("[BLE] command error:", op, e)
+            self.uart.send("ERR %s %s\n" % (op, e))
 
-        # 3) RESET
-        if low == "reset":
-            self.uart.send("OK RESET\n"); reset(); return
+    def register(self, op, handler):
+        """
+        Thêm (hoặc thay) lệnh text `op`. handler(arg) nhận phần sau opcode dưới
+        dạng memoryview trỏ vào vòng đệm RX: chỉ hợp lệ trong lúc gọi, cần giữ thì chép.
+        """
+        self._cmds[op.upper()] = handler
 
-        # 4) PUT <name> <size>
-        if low.startswith("put "):
-            try:
-                _, name, size_s = line.split(None, 2)
-                size = int(size_s)
-                # đóng phiên cũ nếu còn
-                if self._put and self._put.get("fp"):
-                    try: self._put["fp"].close()
-                    except: pass
-                self._put = {"name": name, "left": size, "fp": open(name, "wb")}
-                self.uart.send("OK PUT %s %d\n" % (name, size))
-            except Exception as e:
+    def _take_frame(self):
+        if self._rx_len < _FRAME_HDR:
+            return 0
+        n = self._rx_byte(0) | (self._rx_byte(1) << 8)
+        seq = self._rx_byte(2) | (self._rx_byte(3) << 8)
+        if n == 0:
+            # frame rỗng: host chủ động quay về chế độ text
+            self._bin = False
+            return self._rx_take(_FRAME_HDR)
+        if n == _FRAME_COPY and self._put:
+            if self._rx_len < _FRAME_HDR + _COPY_LEN:
+                return 0
+            off = cnt = 0
+            for i in range(3, -1, -1):
+                off = (off << 8) | self._rx_byte(_FRAME_HDR + i)
+                cnt = (cnt << 8) | self._rx_byte(_FRAME_HDR + 4 + i)
+            self._rx_take(_FRAME_HDR + _COPY_LEN)
+            if self._accept(seq):
+                self._write_chunk(cnt, off)
+            if self._put and self._put["w"].left == 0:
+                self._bin = False
+            return _FRAME_HDR + _COPY_LEN
+        if n > _FRAME_MAX or not self._put or n > self._put["w"].left:
+            self._bin = False
+            self.uart.send("ERR DATA FRAME %d\n" % n)
+            return self._rx_take(self._rx_len)  # bỏ toàn bộ phần còn lại, host phải PUT lại
+        if self._rx_len < _FRAME_HDR + n:
+            return 0
+        STATS[RX_FRAMES] += 1
+        data = self._rx_view(_FRAME_HDR, n)
+        self._rx_take(_FRAME_HDR + n)
+        if self._accept(seq):
+            self._write_chunk(data)
+        if self._put and self._put["w"].left == 0:
+            # đủ dữ liệu -> tự quay về text để nhận DONE
+            self._bin = False
+        return _FRAME_HDR + n
+
+    def _on_data(self, payload):
+        # DATA [<seq>] <base64>  (seq bắt buộc khi PUT có WIN)
+        if not self._put:
+            self.uart.send("ERR DATA NOSESSION\n"); return
+        n = len(payload)
+        while n and payload[n - 1] in b" \r\t":
+            n -= 1
+        seq = None
+        i = 0
+        if self._put["win"]:
+            seq = 0
+            while i < n and 0x30 <= payload[i] <= 0x39:
+                seq = seq * 10 + payload[i] - 0x30
+                i += 1
+            if not i or i >= n or payload[i] != 0x20:
+                self.uart.send("ERR DATA SEQ\n"); return
+            i += 1
+        t = ticks_us()
+        try:
+            b = ubinascii.a2b_base64(payload[i:n])
+        except Exception as e:
+            self.uart.send("ERR DATA %s\n" % e); return
+        STATS[DECODE_US] += ticks_diff(ticks_us(), t)
+        if self._accept(seq):
+            self._write_chunk(b)
+
+    def _accept(self, seq):
+        """Kiểm tra số thứ tự chunk; False nếu là bản trùng hoặc có khoảng hở."""
+        put = self._put
+        if seq is None or seq == put["seq"]:
+            put["nak"] = False
+            return True
+        if (put["seq"] - seq) & 0xFFFF < 0x8000:
+            # chunk đã nhận (host gửi lại do timeout) -> báo lại mốc hiện tại
+            STATS[DUPS] += 1
+            self._ack()
+        elif not put["nak"]:
+            # hở: báo chunk đầu tiên bị thiếu một lần, host gửi lại từ đó (go-back-N)
+            put["nak"] = True
+            STATS[NAKS] += 1
+            self.uart.send("NAK %d\n" % put["seq"])
+        return False
+
+    def _ack(self):
+        put = self._put
+        put["unacked"] = 0
+        if put["win"]:
+            self.uart.send("ACK %d %d\n" % (put["seq"], put["w"].left))
+        else:
+            self.uart.send("OK %d\n" % put["w"].left)
+
+    def _write_chunk(self, b, base_off=-1):
+        """Ghi payload `b`; base_off >= 0: chép `b` byte từ file cũ tại base_off (DELTA)."""
+        put = self._put
+        try:
+            if base_off < 0:
+                put["w"].write(b)
+            else:
+                put["w"].copy(base_off, b)
+            put["seq"] = (put["seq"] + 1) & 0xFFFF
+            put["unacked"] += 1
+            STATS[CHUNKS] += 1
+            # QUAN TRỌNG: phản hồi ACK để PC cập nhật tiến trình
+            # (có cửa sổ: ACK gộp mỗi nửa cửa sổ hoặc khi đã đủ dữ liệu)
+            if not put["win"] or put["unacked"] >= put["ack_every"] or put["w"].left == 0:
+                self._ack()
+        except Exception as e:
+            self._bin = False
+            log_error("[BLE] write error:", e)
+            self.uart.send("ERR DATA %s\n" % e)
+
+    # ====== Phiên upload ======
+    def _open_put(self, args, cmd):
+        try:
+            parts = args.split()
+            name, size = parts[0], int(parts[1])
+            opts = _parse_opts(parts[2:])
+            offset = int(opts.get("OFFSET", 0))
+            if size < 0 or offset < 0:
+                raise ValueError("SIZE")
+            bytecache.check_name(name)
+            bundle = self._bundle is not None
+            # hủy phiên cũ nếu còn (file đích không bị đụng tới)
+            if self._put:
+                self._put["w"].abort()
                 self._put = None
-                self.uart.send("ERR PUT %s\n" % e)
+            if offset:
+                # chỉ tiếp tục được phiên dở cùng tên/kích thước, tối đa tới phần đã ghi
+                st = None if bundle else load_state()
+                if not st or st[0] != name or st[1] != size or offset > st[2]:
+                    self.uart.send("ERR %s OFFSET %d\n" % (cmd, st[2] if st and st[0] == name else 0))
+                    return
+            # block được dùng làm bộ đệm ghi: GET (nếu đang gửi) dừng lại
+            self._get_close()
+            if self._blk is None:
+                self._blk = bytearray(BLE_BLOCK_SIZE)
+            # WIN: host được gửi tối đa `win` chunk chưa ACK; 0 = dừng-chờ như cũ.
+            # Chunk được xử lý sau IRQ nên cả cửa sổ (mỗi chunk một lần ghi GATT)
+            # phải vừa vòng đệm RX: đó là giới hạn backpressure cho host.
+            win = max(0, min(int(opts.get("WIN", 0)), BLE_WINDOW,
+                             len(self._rx) // self.uart.payload_size()))
+            sha = opts.get("SHA256")
+            # ENC=zlib: size là số byte nén truyền qua BLE, giải nén lúc commit
+            enc = opts.get("ENC")
+            if enc and (enc != "zlib" or opts.get("DELTA")):
+                raise ValueError("ENC")
+            raw = int(opts["RAW"]) if "RAW" in opts else None
+            # DELTA: file đích hiện tại làm nguồn cho các lệnh COPY
+            # (file trong BUNDLE không lưu trạng thái resume)
+            self._put = {"w": UploadWriter(name, size, self._blk, offset, sha=bool(sha),
+                                           base=bool(opts.get("DELTA")), enc=enc, raw=raw,
+                                           persist=not bundle),
+                         "win": win, "ack_every": max(1, win // 2),
+                         "seq": self._bundle["seq"] if bundle else 0,
+                         "unacked": 0, "nak": False,
+                         "crc": _hex_opt(opts.get("CRC")), "sha": sha}
+            # BIN: các byte tiếp theo trên RX là frame nhị phân, không còn base64
+            self._bin = bool(opts.get("BIN")) and size > offset
+            # BLOCK: cỡ block cho DONE BLOCKS= (chỉ PUT; lỗi block trong BUNDLE hủy cả phiên)
+            self.uart.send("OK %s %s %d%s%s%s%s%s%s\n" % (cmd, name, size,
+                " BIN" if self._bin else "", " WIN=%d" % win if win else "",
+                " OFFSET=%d" % offset if offset else "",
+                " DELTA" if opts.get("DELTA") else "",
+                " ENC=zlib" if enc else "",
+                "" if bundle else " BLOCK=%d" % len(self._blk)))
+        except Exception as e:
+            self._put = None
+            self._bin = False
+            if self._bundle is not None:
+                self._abort_bundle()
+            self.uart.send("ERR %s %s\n" % (cmd, e))
+
+    def _check_put(self, opts):
+        """Đóng file đang nhận, kiểm tra đủ byte và digest; False (đã báo lỗi, đã hủy) nếu hỏng."""
+        put = self._put
+        w = put["w"]
+        self._put = None
+        self._bin = False
+        try:
+            # chỉ thay file đích khi nhận đủ byte; thiếu -> bỏ file tạm
+            if w.left:
+                w.abort()
+                self.uart.send("ERR DONE LEFT %d\n" % w.left); return False
+            crc = _hex_opt(opts.get("CRC")) if "CRC" in opts else put["crc"]
+            sha = opts.get("SHA256", put["sha"])
+            blocks = opts.get("BLOCKS")
+            if isinstance(blocks, str):
+                blocks = [int(x, 16) for x in blocks.split(",") if x]
+            w.finish()
+            bad = w.verify(crc, sha if isinstance(sha, str) else None, blocks)
+            if bad is None:
+                if not w.enc:
+                    # bytecode sai phiên bản: báo ngay, trước khi BUNDLE thay file nào
+                    bytecache.check(w.name, w.tmp)
+                return True
+            if bad >= 0 and self._bundle is None:
+                # giữ file tạm, host gửi lại từ block lỗi bằng PUT ... OFFSET=<off>
+                w.rewind(bad)
+                self.uart.send("ERR CRC BLOCK %d %d\n" % (bad, bad * len(self._blk)))
+                return False
+            w.abort()
+            log_error("[BLE] CRC mismatch", w.name)
+            self.uart.send("ERR CRC %s %08x\n" % (w.name, w.crc) if self._bundle is not None
+                           else "ERR CRC %08x\n" % w.crc)
+        except Exception as e:
+            w.abort()
+            self.uart.send("ERR DONE %s\n" % e)
+        return False
+
+    def _bundle_next(self):
+        # file hiện tại của BUNDLE đã đủ: kiểm tra rồi xếp hàng chờ commit chung
+        w = self._put["w"]
+        self._bundle["seq"] = self._put["seq"]
+        if not self._check_put({}):
+            self._abort_bundle()
+            return False
+        self._bundle["files"].append(w)
+        return True
+
+    def _done_bundle(self):
+        if self._put and not self._bundle_next():
             return
+        files = self._bundle["files"]
+        count = self._bundle["count"]
+        if len(files) != count:
+            self._abort_bundle()
+            self.uart.send("ERR BUNDLE COUNT %d\n" % len(files)); return
+        self._bundle = None
+        # mọi file đã đủ, đúng digest và giải nén/kiểm tra xong -> mới bắt đầu thay các file đích
+        try:
+            for w in files:
+                if not w.prepare():
+                    raise ValueError("LEFT " + w.name)
+            for w in files:
+                w.rename()
+            log("[BLE] Bundle saved", count)
+            self.uart.send("OK SAVED %d\n" % count)
+        except Exception as e:
+            for w in files:
+                w.abort()
+            self.uart.send("ERR DONE %s\n" % e)
 
-        # 5) DATA <base64>
-        if low.startswith("data "):
-            if not self._put or not self._put.get("fp"):
-                self.uart.send("ERR DATA NOSESSION\n"); return
-            try:
-                b = ubinascii.a2b_base64(line[5:])
-                self._put["fp"].write(b)
-                self._put["left"] -= len(b)
-                if self._put["left"] < 0:
-                    self._put["left"] = 0
-                # QUAN TRỌNG: phản hồi ACK để PC cập nhật tiến trình
-                self.uart.send("OK %d\n" % self._put["left"])
-            except Exception as e:
-                self.uart.send("ERR DATA %s\n" % e)
+    def _abort_bundle(self):
+        if self._bundle is None:
             return
+        if self._put:
+            self._put["w"].abort()
+            self._put = None
+        for w in self._bundle["files"]:
+            w.abort()
+        self._bundle = None
+        self._bin = False
 
-        # 6) DONE
-        if low == "done":
-            if self._put and self._put.get("fp"):
-                try:
-                    self._put["fp"].close()
-                    name, left = self._put["name"], self._put["left"]
-                    self._put = None
-                    if left == 0:
-                        self.uart.send("OK SAVED\n")
-                    else:
-                        self.uart.send("WARN LEFT %d\n" % left)
-                except Exception as e:
-                    self.uart.send("ERR DONE %s\n" % e)
-            else:
-                self.uart.send("ERR DONE NOSESSION\n")
+    # ====== Lệnh text: handler(arg), arg = memoryview phần sau opcode ======
+    def _cmd_ping(self, arg):
+        self.uart.send("PONG\n")
+
+    def _cmd_echo(self, arg):
+        self.uart.send(arg_text(arg) + "\n")
+
+    def _cmd_ls(self, arg):
+        # LS [path] [START=<n>] [N=<n>] -> mỗi mục một dòng "F <size> <name>" / "D 0 <name>",
+        # rồi "LS END <số mục>" hoặc "LS MORE <START trang sau>" khi đủ N mục hoặc hàng đợi
+        # TX gần đầy. Duyệt bằng ilistdir: không dựng danh sách, bộ nhớ không phụ thuộc số file.
+        try:
+            parts = arg_text(arg).split()
+            opts = _parse_opts(t for t in parts if "=" in t)
+            path = ([t for t in parts if "=" not in t] or ["."])[0]
+            start = int(opts.get("START", 0))
+            count = int(opts.get("N", _LS_PAGE))
+            i = sent = 0
+            for e in _ilistdir(path):
+                if i >= start:
+                    d = e[1] & 0x4000
+                    line = "%s %d %s\n" % ("D" if d else "F", 0 if d or len(e) < 4 else e[3], e[0])
+                    if sent >= count or self.uart.tx_room() < len(line) + _TX_RESERVE:
+                        self.uart.send("LS MORE %d\n" % i)
+                        return
+                    self.uart.send(line)
+                    sent += 1
+                i += 1
+            self.uart.send("LS END %d\n" % sent)
+        except Exception as e:
+            self.uart.send("ERR LS %s\n" % e)
+
+    def _cmd_stat(self, arg):
+        # STAT <path> -> "STAT F|D <size> <path>"
+        try:
+            name = arg_text(arg)
+            st = os.stat(name)
+            d = st[0] & 0x4000
+            self.uart.send("STAT %s %d %s\n" % ("D" if d else "F", 0 if d else st[6], name))
+        except Exception as e:
+            self.uart.send("ERR STAT %s\n" % e)
+
+    # ====== Đọc file (GET): cửa sổ trượt như upload, host ACK/NAK ======
+    def _cmd_get(self, arg):
+        # GET <name> [offset] [len] [WIN=<n>] -> "OK GET <name> <size> <offset> <len> WIN=<w> CHUNK=<c>",
+        # các frame GET (mỗi frame vừa một notify), cuối cùng "EOF <len> <crc32>"
+        self._get_close()
+        try:
+            if self._put:
+                raise OSError("BUSY")
+            parts = arg_text(arg).split()
+            name = parts[0]
+            opts = _parse_opts(t for t in parts[1:] if "=" in t)
+            nums = [int(t) for t in parts[1:] if "=" not in t]
+            size = os.stat(name)[6]
+            off = min(nums[0], size) if nums else 0
+            n = size - off
+            if len(nums) > 1:
+                n = min(n, nums[1])
+            if self._blk is None:
+                self._blk = bytearray(BLE_BLOCK_SIZE)
+            chunk = min(_FRAME_MAX, len(self._blk), self.uart.payload_size()) - _GET_HDR
+            # cả cửa sổ phải vừa hàng đợi TX (frame chưa ACK có thể còn nằm ở đó)
+            win = max(1, min(int(opts.get("WIN", BLE_WINDOW)), BLE_WINDOW,
+                             (BLE_TX_BUF - _TX_RESERVE) // (chunk + _GET_HDR)))
+            f = open(name, "rb")
+            f.seek(off)
+        except Exception as e:
+            self.uart.send("ERR GET %s\n" % e)
+            return
+        self._get = {"f": f, "off": off, "pos": off, "len": n, "chunk": chunk, "win": win,
+                     "n": (n + chunk - 1) // chunk, "base": 0, "nxt": 0, "hi": 0, "crc": 0}
+        self.uart.send("OK GET %s %d %d %d WIN=%d CHUNK=%d\n" % (name, size, off, n, win, chunk))
+        self._get_pump()
+
+    def _get_abs(self, arg):
+        # seq u16 trong ACK/NAK -> chỉ số frame tuyệt đối gần base nhất (không lùi)
+        g = self._get
+        return g["base"] + ((int(arg_text(arg)) - g["base"]) & 0xFFFF)
+
+    def _cmd_ack(self, arg):
+        # ACK <seq>: host đã nhận đủ các frame GET trước seq
+        if self._get is None:
+            return      # ACK muộn của GET đã xong/hủy
+        try:
+            a = self._get_abs(arg)
+        except ValueError:
+            return
+        if a <= self._get["nxt"]:
+            self._get["base"] = a
+        self._get_pump()
+
+    def _cmd_nak(self, arg):
+        # NAK <seq>: host thiếu frame seq (hở hoặc hết giờ chờ) -> gửi lại từ đó (go-back-N)
+        g = self._get
+        if g is None:
+            return
+        try:
+            a = self._get_abs(arg)
+        except ValueError:
+            return
+        if a <= g["nxt"]:
+            g["base"] = g["nxt"] = a
+        self._get_pump()
+
+    def _get_pump(self):
+        try:
+            self._get_send()
+        except Exception as e:
+            self._get_close()
+            self.uart.send("ERR GET %s\n" % e)
+
+    def _get_send(self):
+        # gửi tiếp các frame trong cửa sổ; hàng đợi TX không đủ chỗ -> dừng, ACK/NAK sau gửi tiếp
+        g = self._get
+        f = g["f"]
+        chunk = g["chunk"]
+        mv = memoryview(self._blk)
+        while g["nxt"] < g["n"] and g["nxt"] - g["base"] < g["win"]:
+            i = g["nxt"]
+            pos = g["off"] + i * chunk
+            n = min(chunk, g["off"] + g["len"] - pos)
+            if self.uart.tx_room() < _GET_HDR + n + _TX_RESERVE:
+                return
+            if g["pos"] != pos:
+                f.seek(pos)
+            body = mv[_GET_HDR:_GET_HDR + n]
+            if f.readinto(body) != n:
+                raise OSError("SHORT")      # file bị ghi đè/cắt ngắn trong lúc đọc
+            g["pos"] = pos + n
+            if i == g["hi"]:
+                # CRC của cả đoạn, tính một lần theo thứ tự (frame gửi lại không tính lại)
+                g["crc"] = ubinascii.crc32(body, g["crc"])
+                g["hi"] = i + 1
+            mv[0] = _GET_MARK
+            mv[1] = n & 0xFF
+            mv[2] = n >> 8
+            mv[3] = i & 0xFF
+            mv[4] = (i >> 8) & 0xFF
+            self.uart.send(mv[:_GET_HDR + n])
+            g["nxt"] = i + 1
+        if g["base"] >= g["n"]:
+            self._get_close()
+            self.uart.send("EOF %d %08x\n" % (g["len"], g["crc"]))
+
+    def _get_close(self):
+        g, self._get = self._get, None
+        if g is not None:
+            try:
+                g["f"].close()
+            except Exception:
+                pass
+
+    def _cmd_stats(self, arg):
+        # STATS [RESET] -> bộ đếm dạng k=v
+        mem_sample()
+        self.uart.send("STATS " + " ".join("%s=%d" % kv for kv in stats()) + "\n")
+        if arg_text(arg).upper() == "RESET":
+            stats_reset()
+
+    def _cmd_logs(self, arg):
+        # LOGS [n] -> n sự kiện gần nhất, mỗi dòng "<ms> <text>"
+        try:
+            n = int(arg_text(arg) or 16)
+        except Exception:
+            n = 16
+        ev = logs(n)
+        self.uart.send("LOGS %d\n" % len(ev))
+        for ts, text in ev:
+            # cắt ngắn để cả loạt vừa hàng đợi TX
+            self.uart.send("%d %s\n" % (ts, text[:80]))
+
+    def _cmd_reset(self, arg):
+        # đang cork: đẩy phản hồi ra trước khi reset
+        self.uart.send("OK RESET\n"); self.uart.flush(); reset()
+
+    def _cmd_hash(self, arg):
+        # HASH <name> [block] [START=<n>] -> "HASH <size> <block> <start> <crc>,<crc>..." với CRC32
+        # từng block của file hiện có (cho upload DELTA), từ block START; thêm " MORE <START trang
+        # sau>" khi dòng không còn vừa hàng đợi TX (file lớn: danh sách CRC dài hơn BLE_TX_BUF)
+        try:
+            parts = arg_text(arg).split()
+            opts = _parse_opts(t for t in parts if "=" in t)
+            parts = [t for t in parts if "=" not in t]
+            if self._put:
+                raise OSError("BUSY")
+            if self._blk is None:
+                self._blk = bytearray(BLE_BLOCK_SIZE)
+            blk = min(int(parts[1]), BLE_BLOCK_SIZE) if len(parts) > 1 else BLE_BLOCK_SIZE
+            start = int(opts.get("START", 0))
+            if blk <= 0 or start < 0:
+                self.uart.send("ERR HASH BLK\n"); return
+            size = os.stat(parts[0])[6]
+            total = (size + blk - 1) // blk
+            head = "HASH %d %d %d " % (size, blk, start)
+            # mỗi CRC 9 ký tự ("%08x,"); chừa chỗ cho " MORE <n>" và phần dự trữ
+            count = max(1, (self.uart.tx_room() - len(head) - _TX_RESERVE) // 9)
+            crcs = block_crcs(parts[0], memoryview(self._blk)[:blk], start, count)
+            line = head + ",".join("%08x" % c for c in crcs)
+            nxt = start + len(crcs)
+            self.uart.send(line + (" MORE %d\n" % nxt if nxt < total else "\n"))
+        except Exception as e:
+            self.uart.send("ERR HASH %s\n" % e)
+
+    def _cmd_copy(self, arg):
+        # COPY [<seq>] <offset> <count> -> chép từ file cũ trong phiên PUT ... DELTA
+        put = self._put
+        if not put:
+            self.uart.send("ERR COPY NOSESSION\n"); return
+        try:
+            args = [int(x) for x in arg_text(arg).split()]
+            seq = args.pop(0) if put["win"] else None
+            off, cnt = args
+        except Exception as e:
+            self.uart.send("ERR COPY %s\n" % e); return
+        if self._accept(seq):
+            self._write_chunk(cnt, off)
+
+    def _cmd_resume(self, arg):
+        # RESUME -> phiên upload dở (nếu có) để host gửi tiếp bằng PUT ... OFFSET=<n>
+        st = load_state()
+        if st:
+            self.uart.send("RESUME %s %d %d\n" % st)
+        else:
+            self.uart.send("RESUME NONE\n")
+
+    def _cmd_put(self, arg):
+        # PUT <name> <size> [BIN] [WIN=<n>] [OFFSET=<n>] [CRC=<hex>] [SHA256[=<hex>]] [DELTA] [ENC=zlib [RAW=<n>]]
+        if self._bundle is not None:
+            self._abort_bundle()
+        self._open_put(arg_text(arg), "PUT")
+
+    def _cmd_bundle(self, arg):
+        # BUNDLE <count> -> nhiều FILE trong một phiên, chỉ commit tất cả ở DONE
+        self._abort_bundle()
+        if self._put:
+            self._put["w"].abort()
+            self._put = None
+        try:
+            self._bundle = {"count": int(arg_text(arg)), "files": [], "seq": 0}
+            self.uart.send("OK BUNDLE %d\n" % self._bundle["count"])
+        except Exception as e:
+            self.uart.send("ERR BUNDLE %s\n" % e)
+
+    def _cmd_file(self, arg):
+        # FILE <path> <size> [tùy chọn như PUT, trừ OFFSET] -> file kế tiếp trong BUNDLE
+        if self._bundle is None:
+            self.uart.send("ERR FILE NOSESSION\n"); return
+        if self._put and not self._bundle_next():
             return
+        self._open_put(arg_text(arg), "FILE")
 
-        self.uart.send("ERR UNKNOWN\n")
+    def _cmd_done(self, arg):
+        # DONE [CRC=<hex>] [SHA256=<hex>] [BLOCKS=<hex>,<hex>,...]
+        self._bin = False
+        if self._bundle is not None:
+            self._done_bundle()
+            return
+        if not self._put:
+            self.uart.send("ERR DONE NOSESSION\n"); return
+        w = self._put["w"]
+        if self._check_put(_parse_opts(arg_text(arg).split())):
+            try:
+                w.commit()
+                log("[BLE] Saved", w.name, w.size)
+                self.uart.send("OK SAVED\n")
+            except Exception as e:
+                w.abort()
+                self.uart.send("ERR DONE %s\n" % e)
 
     def start(self):
         if self._started:
-            print("[BLE] Started.")
+            log("[BLE] Started.")
             return
         try:
             import ubluetooth  # đảm bảo FW có BLE
         except Exception as e:
-            print("[BLE] Firmware missing ubluetooth:", e)
+            log_error("[BLE] Firmware missing ubluetooth:", e)
             return
         try:
-            self.uart = BLEUART(name=self.name, rx_callback=self._on_rx)
+            self.uart = BLEUART(name=self.name, rx_callback=self._on_rx,
+                                conn_callback=self._on_conn, txq_size=BLE_TX_BUF)
             self._started = True
-            print("[BLE] Started.")
+            log("[BLE] Started.")
         except Exception as e:
-            print("[BLE] Start error:", e)
+            log_error("[BLE] Start error:", e)
 
 ble_o = BLEMain()
 ble   = ble_o
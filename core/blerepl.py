@@ -1,4 +1,236 @@
-# blerepl.py — placeholder (không chiếm quyền REPL), chỉ để boot.py "run('blerepl')" không lỗi
+# blerepl.py — REPL qua BLE: os.dupterm với luồng BLETerm trên BLEUART, dùng chung kết nối
+# với giao thức file (ble.py). Host gửi "REPL" -> "OK REPL <byte vòng nhập>", sau đó byte
+# terminal đi hai chiều trong frame xen giữa các dòng lệnh/phản hồi:
+#   0x02 <len u8> <byte...>
+# 0x02 không bao giờ mở đầu một dòng text (0x00 telemetry, 0x01 GET) nên hai bên tách được.
+# "REPL OFF" -> "OK REPL OFF <byte ra bị bỏ>"; mất kết nối cũng gỡ REPL.
+#
+# Đầu ra (print, echo của REPL) chỉ được chép vào vòng cấp phát sẵn, không bao giờ chặn
+# chương trình: đầy một notify thì gửi ngay, phần lẻ gửi khi đường truyền đã rảnh
+# _IDLE_MS (nhịp timer) chứ không mỗi print một notify. Hàng đợi TX gần đầy thì chờ nhịp
+# sau (phản hồi upload được ưu tiên); vòng ra đầy thì bỏ phần dư và đếm.
+#
+# Đầu vào đi qua stdin của MicroPython nên Ctrl-C, raw REPL (Ctrl-A) và raw-paste (Ctrl-E A
+# Ctrl-A, có điều tiết cửa sổ) dùng được như qua cáp, khi REPL đang ở tiền cảnh
+# (APP_RUNNER=False, hoặc sau Ctrl-C dừng vòng lặp của runner). Host: Client.exec().
+import io
+import os
+from time import ticks_ms, ticks_diff
+from micropython import schedule, const
+from utility import log, log_error, arg_switch
+
+try:
+    from setting import BLE_REPL_TIMER
+except Exception:
+    BLE_REPL_TIMER = 3
+
+_MARK       = const(2)
+_OUT_SIZE   = const(1024)
+_IN_SIZE    = const(512)    # >= cửa sổ raw-paste của MicroPython (MICROPY_REPL_STDIN_BUFFER_MAX)
+_IDLE_MS    = const(20)
+_TX_RESERVE = const(256)    # chừa chỗ trong hàng đợi TX cho phản hồi giao thức (ACK upload...)
+_SLOT       = const(0)
+_POLL       = const(3)      # MP_STREAM_POLL
+_RD         = const(1)
+_WR         = const(4)
+
+_dupterm = getattr(os, "dupterm", None)
+_notify = getattr(os, "dupterm_notify", None)
+
+class BLETerm(io.IOBase):
+    """Luồng cho os.dupterm: ghi vào vòng ra (gửi theo lô), đọc từ vòng nhập (frame từ host)."""
+    def __init__(self, uart, out_size=_OUT_SIZE, in_size=_IN_SIZE):
+        self._uart = uart
+        self._out = bytearray(out_size)
+        self._out_mv = memoryview(self._out)
+        self._out_head = 0
+        self._out_len = 0
+        self._in = bytearray(in_size)
+        self._in_mv = memoryview(self._in)
+        self._in_head = 0
+        self._in_len = 0
+        self._frame = bytearray(257)
+        self._frame_mv = memoryview(self._frame)
+        self._chunk = 20            # byte mỗi frame (một notify), cập nhật theo MTU khi gửi
+        self._sent_ms = ticks_ms()
+        self._pending = False       # đã schedule _send, chưa chạy
+        self._send_cb = self._send  # giữ bound method, tránh cấp phát khi schedule
+        self.dropped = 0            # byte ra bị bỏ vì vòng ra đầy
+        self.in_dropped = 0         # byte vào bị bỏ vì vòng nhập đầy
+
+    # ====== Đầu ra ======
+    def write(self, buf):
+        # gọi cho mọi print/echo của REPL: chỉ chép, gửi để sau
+        mv = memoryview(buf)
+        n = len(mv)
+        size = len(self._out)
+        room = size - self._out_len
+        if n > room:
+            self.dropped += n - room
+            n = room
+        if n:
+            tail = (self._out_head + self._out_len) % size
+            first = min(n, size - tail)
+            self._out_mv[tail:tail + first] = mv[:first]
+            if n > first:
+                self._out_mv[:n - first] = mv[first:n]
+            self._out_len += n
+        if self._out_len >= self._chunk or ticks_diff(ticks_ms(), self._sent_ms) >= _IDLE_MS:
+            self.kick()
+        return len(mv)
+
+    def kick(self):
+        """Hẹn gửi phần đang chờ ra ngoài ngữ cảnh hiện tại (print có thể ở giữa BLEUART.send)."""
+        if self._pending:
+            return
+        try:
+            schedule(self._send_cb, None)
+            self._pending = True
+        except RuntimeError:
+            pass    # hàng đợi schedule đầy: nhịp timer sau
+
+    def _send(self, _):
+        self._pending = False
+        u = self._uart
+        if not u.is_connected():
+            stop()
+            log("[REPL] detached: disconnected")
+            return
+        self._chunk = min(255, u.payload_size() - 2)
+        size = len(self._out)
+        f = self._frame
+        u.cork()
+        try:
+            while self._out_len:
+                n = min(self._out_len, self._chunk, size - self._out_head)
+                if u.tx_room() < n + 2 + _TX_RESERVE:
+                    break
+                f[0] = _MARK
+                f[1] = n
+                self._frame_mv[2:2 + n] = self._out_mv[self._out_head:self._out_head + n]
+                u.send(self._frame_mv[:2 + n])
+                self._out_len -= n
+                self._out_head = 0 if not self._out_len else (self._out_head + n) % size
+        finally:
+            u.uncork()
+        self._sent_ms = ticks_ms()
+
+    # ====== Đầu vào ======
+    def feed(self, data):
+        """Byte terminal từ host (BLEMain.term_rx): vào vòng nhập rồi báo cho dupterm."""
+        n = len(data)
+        size = len(self._in)
+        room = size - self._in_len
+        if n > room:
+            self.in_dropped += n - room
+            n = room
+        tail = (self._in_head + self._in_len) % size
+        first = min(n, size - tail)
+        self._in_mv[tail:tail + first] = data[:first]
+        if n > first:
+            self._in_mv[:n - first] = data[first:n]
+        self._in_len += n
+        if _notify:
+            try:
+                _notify(None)   # MicroPython chép sang stdin ngay (Ctrl-C được xử lý ở đây)
+            except Exception as e:
+                log_error("[REPL] notify:", e)
+
+    def readinto(self, buf):
+        if not self._in_len:
+            return None     # chưa có gì (0 nghĩa là EOF: dupterm sẽ gỡ luồng)
+        size = len(self._in)
+        n = min(len(buf), self._in_len, size - self._in_head)
+        buf[:n] = self._in_mv[self._in_head:self._in_head + n]
+        self._in_len -= n
+        self._in_head = 0 if not self._in_len else (self._in_head + n) % size
+        return n
+
+    def ioctl(self, op, arg):
+        if op == _POLL:
+            return (arg & _RD if self._in_len else 0) | (arg & _WR)
+        return 0
+
+_ble = None
+_uart = None
+_term = None
+_prev = None        # luồng dupterm cũ (vd WebREPL), trả lại khi gỡ
+_timer = None
+
+def _isr(t):
+    # timer: gửi phần lẻ đã chờ quá _IDLE_MS; phát hiện mất kết nối khi không có gì để in
+    term = _term
+    if term is not None and (term._out_len or not _uart.is_connected()):
+        term.kick()
+
+def attached():
+    return _term is not None
+
 def start():
-    # Nếu sau này muốn chuyển REPL qua BLE, triển khai tại đây.
-    return
+    """Gắn REPL vào BLE (os.dupterm); trả về BLETerm. Gọi được từ REPL qua cáp."""
+    global _term, _prev, _timer
+    if _term is not None:
+        return _term
+    if _ble is None:
+        from ble import ble
+        attach(ble)
+    if _dupterm is None:
+        raise OSError("no dupterm")
+    if _uart is None:
+        raise OSError("no BLE")
+    term = BLETerm(_uart)
+    _prev = _dupterm(term, _SLOT)
+    _term = term
+    _ble.term_rx = term.feed
+    from machine import Timer
+    for tid in (BLE_REPL_TIMER, -1):
+        try:
+            t = Timer(tid)
+            t.init(mode=Timer.PERIODIC, period=_IDLE_MS, callback=_isr)
+            _timer = t
+            break
+        except Exception as e:
+            log_error("[REPL] Timer(%d) init failed:" % tid, e)
+    log("[REPL] attached")
+    return term
+
+def stop():
+    """Gỡ REPL khỏi BLE, gửi nốt đầu ra đang chờ; trả về BLETerm đã gỡ (hoặc None)."""
+    global _term, _prev, _timer
+    term, _term = _term, None
+    if term is None:
+        return None
+    t, _timer = _timer, None
+    if t is not None:
+        try:
+            t.deinit()
+        except Exception:
+            pass
+    _ble.term_rx = None
+    try:
+        _dupterm(_prev, _SLOT)
+    except Exception as e:
+        log_error("[REPL] dupterm restore:", e)
+    _prev = None
+    if term._out_len and _uart.is_connected():
+        term._send(None)
+    return term
+
+def _cmd_repl(arg):
+    if arg_switch(arg) is None:
+        term = stop()
+        _uart.send("OK REPL OFF %d\n" % (term.dropped if term else 0))
+        return
+    try:
+        term = start()
+    except Exception as e:
+        _uart.send("ERR REPL %s\n" % e)
+        return
+    _uart.send("OK REPL %d\n" % len(term._in))
+
+def attach(ble):
+    """Đăng ký lệnh REPL [OFF] vào dịch vụ BLE."""
+    global _ble, _uart
+    _ble = ble
+    _uart = ble.uart
+    ble.register("REPL", _cmd_repl)
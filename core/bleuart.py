@@ -2,6 +2,9 @@
 import struct
 import bluetooth
 import time
+from machine import Timer
+from micropython import schedule
+from utility import log, log_error, STATS, TX_BYTES, NOTIFY_FAIL, TX_DROPPED
 
 # UUID Nordic UART Service
 _UUID_NUS    = bluetooth.UUID("6E400001-B5A3-F393-E0A9-E50E24DCCA9E")
@@ -16,6 +19,17 @@ _FLAG_NOTIFY    = bluetooth.FLAG_NOTIFY
 _IRQ_CENTRAL_CONNECT    = 1
 _IRQ_CENTRAL_DISCONNECT = 2
 _IRQ_GATTS_WRITE        = 3
+_IRQ_MTU_EXCHANGED      = 21
+
+_ATT_MTU_DEFAULT = 23   # MTU mặc định trước khi trao đổi; payload notify = MTU - 3
+_TX_RETRY_MAX    = 25   # số lần thử lại nhanh liên tiếp khi controller báo đầy hàng đợi
+_TX_RETRY_MS     = 2
+_TX_POLL_MS      = 20   # hết lượt thử nhanh: timer thử tiếp chừng nào hàng đợi còn dữ liệu
+
+try:
+    from setting import BLE_TX_TIMER
+except Exception:
+    BLE_TX_TIMER = 0
 
 def _adv_payload(name=None, services=None):
     """Tạo payload Advertising/Scan Response tối giản, tránh vượt 31B."""
@@ -33,14 +47,38 @@ def _adv_payload(name=None, services=None):
     return payload
 
 class BLEUART:
-    def __init__(self, name="MEBLOCK-TOPKID", rx_callback=None):
+    def __init__(self, name="MEBLOCK-TOPKID", rx_callback=None, mtu=247, txq_size=1024,
+                 conn_callback=None):
         self._ble = bluetooth.BLE()
         self._ble.active(True)
         self._ble.irq(self._irq)
 
         self._name = name
         self._rx_cb = rx_callback
+        self._conn_cb = conn_callback   # gọi với True/False khi central kết nối/ngắt
         self._conn = None
+        self._mtu = {}          # conn_handle -> MTU đã thỏa thuận
+
+        # Hàng đợi TX vòng, cấp phát sẵn: send() chỉ chép vào đây, flush() cắt theo MTU.
+        # send() chỉ đổi _tx_tail, flush() (cả khi chạy từ IRQ) chỉ đổi _tx_head; chỉ số
+        # chạy trong 0..2*size để phân biệt hàng đợi đầy với rỗng.
+        self._txq = bytearray(txq_size)
+        self._txq_mv = memoryview(self._txq)
+        self._tx_head = 0
+        self._tx_tail = 0
+        self._tx_busy = False   # flush() đang chạy (IRQ cắt ngang thì không flush chồng)
+        self._tx_cork = 0
+        self._tx_retry = 0
+        self._tx_retry_pending = False
+        self._tx_retry_cb = self._tx_retry_run   # giữ bound method, tránh cấp phát khi schedule
+        self._tx_poll_cb = self._tx_poll
+        self._tx_timer = None
+
+        # Đề nghị MTU lớn; central quyết định giá trị cuối qua _IRQ_MTU_EXCHANGED
+        try:
+            self._ble.config(mtu=mtu)
+        except Exception as e:
+            log_error("[BLEUART] mtu config error:", e)
 
         # GATT: NUS service với 2 đặc tính (TX notify, RX write)
         tx_char = (_UUID_NUS_TX, _FLAG_NOTIFY)
@@ -53,7 +91,7 @@ class BLEUART:
             self._ble.gatts_set_buffer(self._tx_handle, 512, True)
             self._ble.gatts_set_buffer(self._rx_handle, 512, True)
         except Exception as e:
-            print("[BLEUART] set_buffer error:", e)
+            log_error("[BLEUART] set_buffer error:", e)
 
         self.advertise(True)
 
@@ -61,12 +99,21 @@ class BLEUART:
     def _irq(self, event, data):
         if event == _IRQ_CENTRAL_CONNECT:
             self._conn, addr_type, addr = data
-            print("[BLEUART] Connected:", self._conn)
+            log("[BLEUART] Connected:", self._conn)
+            self._notify_conn(True)
         elif event == _IRQ_CENTRAL_DISCONNECT:
             ch, addr_type, addr = data
-            print("[BLEUART] Disconnected:", ch)
-            self._conn = None
+            log("[BLEUART] Disconnected:", ch)
+            self._mtu.pop(ch, None)
+            if ch == self._conn:
+                self._conn = None
+                self.flush()    # không còn kết nối: flush() bỏ dữ liệu chờ gửi
+                self._notify_conn(False)
             self.advertise(True)
+        elif event == _IRQ_MTU_EXCHANGED:
+            ch, mtu = data
+            self._mtu[ch] = mtu
+            log("[BLEUART] MTU:", mtu)
         elif event == _IRQ_GATTS_WRITE:
             ch, attr = data
             if attr == self._rx_handle:
@@ -75,7 +122,17 @@ class BLEUART:
                     try:
                         self._rx_cb(buf)
                     except Exception as e:
-                        print("[BLEUART] RX callback error:", e)
+                        log_error("[BLEUART] RX callback error:", e)
+                # host vừa ghi -> cơ hội tốt để đẩy tiếp phần TX còn kẹt
+                if self._tx_used():
+                    self.flush()
+
+    def _notify_conn(self, connected):
+        if self._conn_cb:
+            try:
+                self._conn_cb(connected)
+            except Exception as e:
+                log_error("[BLEUART] conn callback error:", e)
 
     # ====== GAP advertise (đã vá: chia adv & scan response) ======
     def advertise(self, enable=True, interval_us=500000):
@@ -86,36 +143,153 @@ class BLEUART:
         sr  = _adv_payload(name=self._name, services=None)    # chỉ name
         try:
             self._ble.gap_advertise(interval_us, adv_data=adv, resp_data=sr)
-            print("[BLEUART] Advertising as:", self._name)
+            log("[BLEUART] Advertising as:", self._name)
         except Exception as e:
-            print("[BLEUART] advertise error:", e)
+            log_error("[BLEUART] advertise error:", e)
             # Fallback: chỉ name (đảm bảo vẫn phát sóng)
             try:
                 only_name = _adv_payload(name=self._name, services=None)
                 self._ble.gap_advertise(interval_us, adv_data=only_name)
-                print("[BLEUART] Advertising (name only).")
+                log("[BLEUART] Advertising (name only).")
             except Exception as e2:
-                print("[BLEUART] advertise fallback error:", e2)
+                log_error("[BLEUART] advertise fallback error:", e2)
 
     # ====== Helpers ======
     def is_connected(self):
         return self._conn is not None
 
+    def payload_size(self):
+        """Số byte tối đa trong một notify với MTU hiện tại."""
+        return self._mtu.get(self._conn, _ATT_MTU_DEFAULT) - 3
+
+    def _tx_used(self):
+        return (self._tx_tail - self._tx_head) % (2 * len(self._txq))
+
+    def tx_room(self):
+        """Số byte còn trống trong hàng đợi TX."""
+        return len(self._txq) - self._tx_used()
+
+    def cork(self):
+        """Gom các send() tiếp theo, chỉ notify khi uncork() (ghép nhiều ACK nhỏ)."""
+        self._tx_cork += 1
+
+    def uncork(self):
+        if self._tx_cork:
+            self._tx_cork -= 1
+        if not self._tx_cork:
+            self.flush()
+
     def send(self, data):
-        """Notify TX; cắt nhỏ <= 20B cho an toàn."""
+        """Đưa dữ liệu vào hàng đợi TX rồi notify; trả về số byte đã nhận vào hàng đợi."""
         if not self.is_connected():
             return 0
         if isinstance(data, str):
             data = data.encode()
-        sent = 0
-        for i in range(0, len(data), 20):
-            chunk = data[i:i+20]
-            try:
-                self._ble.gatts_notify(self._conn, self._tx_handle, chunk)
-                sent += len(chunk)
-                # nghỉ nhẹ để tránh nghẽn (tùy FW)
-                # time.sleep_ms(1)
-            except Exception as e:
-                print("[BLEUART] notify error:", e)
+        data = memoryview(data)
+        self._tx_retry = 0      # có dữ liệu mới -> cấp lại lượt thử lại
+        size = len(self._txq)
+        n = len(data)
+        if n > size - self._tx_used():
+            self.flush()
+        if n > size - self._tx_used():
+            # hàng đợi đầy dù đã thử đẩy: bỏ cả thông điệp (cắt giữa chừng làm hỏng dòng/frame)
+            log_error("[BLEUART] TX queue full, drop:", n)
+            STATS[TX_DROPPED] += n
+            return 0
+        # chép vào vòng (tối đa 2 đoạn), xong mới dời _tx_tail cho flush() thấy
+        tail = self._tx_tail % size
+        first = min(n, size - tail)
+        self._txq_mv[tail:tail + first] = data[:first]
+        if n > first:
+            self._txq_mv[:n - first] = data[first:n]
+        self._tx_tail = (self._tx_tail + n) % (2 * size)
+        if not self._tx_cork:
+            self.flush()
+        return n
+
+    def flush(self):
+        """
+        Notify hết hàng đợi theo MTU-3; True nếu đã rỗng, False nếu còn kẹt (sẽ thử lại).
+        Không còn kết nối: bỏ dữ liệu chờ gửi.
+        """
+        if self._tx_busy:
+            # IRQ cắt ngang một lượt flush(): lượt đó đọc lại _tx_tail nên tự đẩy nốt
+            return False
+        self._tx_busy = True
+        try:
+            return self._flush()
+        finally:
+            self._tx_busy = False
+
+    def _flush(self):
+        size = len(self._txq)
+        step = self.payload_size()
+        while True:
+            used = self._tx_used()
+            if not used:
                 break
-        return sent
+            if self._conn is None:
+                self._tx_head = self._tx_tail
+                return False
+            # không vắt qua cuối vòng để khỏi phải chép sang buffer tạm
+            head = self._tx_head % size
+            n = min(used, step, size - head)
+            try:
+                self._ble.gatts_notify(self._conn, self._tx_handle, self._txq_mv[head:head + n])
+            except Exception:
+                # thường là ENOMEM khi hàng đợi controller đầy: giữ lại, thử lại sau
+                STATS[NOTIFY_FAIL] += 1
+                self._schedule_retry()
+                return False
+            self._tx_head = (self._tx_head + n) % (2 * size)
+            self._tx_retry = 0      # controller vừa nhận thêm: cấp lại lượt thử nhanh
+            STATS[TX_BYTES] += n
+        self._tx_retry = 0
+        return True
+
+    def _schedule_retry(self):
+        if self._tx_retry_pending:
+            return
+        if self._tx_retry >= _TX_RETRY_MAX:
+            self._arm_poll()
+            return
+        try:
+            schedule(self._tx_retry_cb, None)
+            self._tx_retry_pending = True
+        except RuntimeError:
+            self._arm_poll()    # hàng đợi schedule đầy: để timer thử lại
+
+    def _arm_poll(self):
+        # controller chậm nhả buffer (hoặc host không đọc): thử lại thưa hơn, không bỏ cuộc.
+        # BLE_TX_TIMER = None: không giữ timer, lần host ghi kế tiếp (_IRQ_GATTS_WRITE) đẩy tiếp
+        if BLE_TX_TIMER is None:
+            return
+        t = self._tx_timer
+        if t is None:
+            for tid in (BLE_TX_TIMER, -1):
+                try:
+                    t = Timer(tid)
+                    break
+                except Exception as e:
+                    log_error("[BLEUART] Timer(%d) init failed:" % tid, e)
+            if t is None:
+                return
+            self._tx_timer = t
+        t.init(mode=Timer.ONE_SHOT, period=_TX_POLL_MS, callback=self._tx_poll_cb)
+
+    def _tx_poll(self, t):
+        # callback timer: chỉ schedule, flush chạy ở luồng chính
+        if not self._tx_used() or self._tx_retry_pending:
+            return
+        try:
+            schedule(self._tx_retry_cb, None)
+            self._tx_retry_pending = True
+        except RuntimeError:
+            self._arm_poll()
+
+    def _tx_retry_run(self, _):
+        self._tx_retry_pending = False
+        self._tx_retry += 1
+        # nghỉ nhẹ để controller kịp giải phóng buffer (tùy FW)
+        time.sleep_ms(_TX_RETRY_MS)
+        self.flush()
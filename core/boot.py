@@ -1,38 +1,71 @@
 # boot.py — ESP32-WROOM-32 (MicroPython 1.26.x)
-# - Double-Reset: bấm RESET 2 lần trong 5 giây => xóa main.py
-# - Không dùng LED/NeoPixel, chỉ in log
-# - Khởi động BLE (nếu DEV_VERSION >= 4)
+# - Khởi động BLE trước tiên: thời gian tới lúc quảng bá (kết nối được) là quan trọng nhất
+# - Double-Reset: bấm RESET 2 lần trong 5 giây => xóa main.py (và bytecode của nó; không bao giờ chờ chặn)
+# - Không dùng LED/NeoPixel, chỉ ghi log (utility.log, xem bằng lệnh BLE LOGS)
+# - Mỗi giai đoạn được ghi mốc ticks_ms từ lúc reset (lệnh BLE STATS: boot_*_ms)
 # - main.py sẽ tự chạy sau khi boot.py kết thúc
+import time
 
-import os, time, gc, sys
-import esp
-from machine import Timer
-from micropython import schedule
-from setting import *
-from utility import *
+_T0 = time.ticks_ms()
 
 # ===== Cấu hình (có thể override qua setting.py) =====
 DRD_TIMEOUT_MS = 5000
+DRD_TIMER = 1
 DEV_VERSION = 0
 VERSION = "0.0.0"
+APP_RUNNER = False
+TELEMETRY = False
+BLE_REPL = False
 
-# Giảm log ROM
-try:
-    esp.osdebug(None)
-except Exception:
-    pass
-
-# ===== Import setting/utility nếu có =====
+# ===== Import setting/utility (mỗi module đúng một lần) =====
 try:
     from setting import *  # DEV_VERSION, VERSION, ...
 except Exception as e:
     print("[BOOT] setting.py not loaded:", e)
 
 try:
-    from utility import *
+    from utility import log, log_error, boot_mark
 except Exception as e:
     print("[BOOT] utility.py not loaded:", e)
 
+    def log(*args):
+        print(*args)
+
+    log_error = log
+
+    def boot_mark(name, t=None):
+        pass
+
+boot_mark("start", _T0)
+
+# Giảm log ROM
+try:
+    import esp
+    esp.osdebug(None)
+except Exception:
+    pass
+
+# ===== Khởi động BLE (nếu hỗ trợ) =====
+def _start_ble():
+    if DEV_VERSION < 4:
+        log("[BLE] This device does not support Bluetooth.")
+        return None
+    try:
+        from ble import ble     # kéo theo bleuart, upload; import một lần, không nạp lại
+        ble.start()
+        return ble
+    except Exception as err:
+        log_error("[BLE] Failed to start:", err)
+        return None
+
+while True:
+    try:
+        ble_o = ble = _start_ble()
+        break
+    except KeyboardInterrupt:
+        print("[BOOT] Device is booting...")
+boot_mark("ble")
+
 # ===== Double-Reset Detector với NVS =====
 try:
     from esp32 import NVS
@@ -55,7 +88,7 @@ def _arm():
         _nvs.set_i32("armed", 1)
         _nvs.commit()
     except Exception as e:
-        print("[DRD] arm failed:", e)
+        log_error("[DRD] arm failed:", e)
 
 def _disarm():
     if _nvs is None:
@@ -64,86 +97,148 @@ def _disarm():
         _nvs.erase_key("armed")
         _nvs.commit()
     except Exception as e:
-        print("[DRD] disarm failed:", e)
+        log_error("[DRD] disarm failed:", e)
 
-# ===== Xử lý DRD =====
-if _is_armed():
-    print("[DRD] Double-reset detected -> RECOVERY")
-    print("[DRD] Remove main.py if exists ...")
-    try:
-        os.remove("main.py")
-        print("[DRD] main.py removed.")
-    except OSError:
-        print("[DRD] main.py not found (skip).")
-    _disarm()
-else:
-    _arm()
-    print("[DRD] Armed. Press RESET again within %.1f s for recovery..." % (DRD_TIMEOUT_MS / 1000))
+_t = None
+_armed_at = 0
 
+def _drd_check(_):
+    # Chạy ở context an toàn (không phải ISR). So bằng ticks nên timer báo sớm cũng không sai.
+    global _t
+    if time.ticks_diff(time.ticks_ms(), _armed_at) < DRD_TIMEOUT_MS:
+        return
+    log("[DRD] Window expired -> disarmed.")
+    _disarm()
+    try:
+        if _t:
+            _t.deinit()
+    except Exception:
+        pass
     _t = None
-    def _disarm_scheduled(_):
-        # Hàm chạy ở context an toàn (không phải ISR)
-        print("[DRD] Window expired -> disarmed.")
-        _disarm()
-        try:
-            if _t:
-                _t.deinit()
-        except Exception:
-            pass
 
-    def _timer_isr(t):
-        # ISR: chỉ schedule công việc nặng ra thread chính
+def _timer_isr(t):
+    # ISR: chỉ schedule công việc nặng ra thread chính
+    try:
+        from micropython import schedule
+        schedule(_drd_check, 0)
+    except Exception:
+        pass
+
+def _start_drd_timer():
+    from machine import Timer
+    for tid in (DRD_TIMER, -1):
         try:
-            schedule(_disarm_scheduled, 0)
-        except Exception:
-            pass
+            t = Timer(tid)
+            t.init(mode=Timer.PERIODIC, period=DRD_TIMEOUT_MS, callback=_timer_isr)
+            return t
+        except Exception as e:
+            log_error("[DRD] Timer(%d) init failed:" % tid, e)
+    return None
 
-    try:
-        # ESP32: dùng timer phần cứng 0..3. Chọn 1 để tránh va chạm.
-        _t = Timer(1)
-        _t.init(mode=Timer.ONE_SHOT, period=DRD_TIMEOUT_MS, callback=_timer_isr)
-    except Exception as e:
-        # Fallback: nếu Timer còn lỗi (ValueError...), chờ blocking rồi disarm
-        print("[DRD] HW Timer init failed:", e)
-        time.sleep_ms(DRD_TIMEOUT_MS)
+if _is_armed():
+    log("[DRD] Double-reset detected -> RECOVERY")
+    import os
+    # bytecode (__mpy__/main.mpy, xem bytecache.py) được ưu tiên hơn main.py: xóa cả hai
+    for _f in ("main.py", "__mpy__/main.mpy"):
+        try:
+            os.remove(_f)
+            log("[DRD] %s removed." % _f)
+        except OSError:
+            log("[DRD] %s not found (skip)." % _f)
+    _disarm()
+else:
+    _arm()
+    _armed_at = time.ticks_ms()
+    log("[DRD] Armed. Press RESET again within %.1f s for recovery..." % (DRD_TIMEOUT_MS / 1000))
+    _t = _start_drd_timer()
+    if _t is None:
+        # Không có timer: gỡ ngay thay vì chờ chặn (mất tính năng DRD lần này, BLE vẫn chạy)
         _disarm()
-        print("[DRD] Window expired -> disarmed. (blocking fallback)")
+        log("[DRD] No timer -> disarmed now.")
+boot_mark("drd")
+
+# ===== Bytecode (.mpy) biên dịch trên host: cache vào sys.path, bỏ bản cũ hơn mã nguồn =====
+bytecache = None    # import hỏng: run() nạp thẳng mã nguồn
+try:
+    import bytecache
+    bytecache.install()
+    bytecache.sweep()
+except Exception as e:
+    log_error("[BOOT] bytecache failed:", e)
+boot_mark("mpy")
 
-# ===== Tiện ích load module =====
+# ===== Tiện ích load module (dùng từ REPL) =====
 def stop_all():
     pass
 
 def run(mod):
+    # nạp lại module từ đầu (bỏ bản cũ trong sys.modules); bytecode còn mới được ưu tiên
+    import sys
     if mod in sys.modules:
         del sys.modules[mod]
-    __import__(mod)
+    if bytecache:
+        bytecache.load(mod)
+    else:
+        __import__(mod)
 
-# ===== Khởi động BLE (nếu hỗ trợ) =====
-while True:
+# ===== Thông báo về main.py =====
+import gc
+gc.collect()
+log("[BOOT] Firmware version:", VERSION)
+import os
+
+def _exists(path):
     try:
-        if DEV_VERSION >= 4:
-            try:
-                run("bleuart")
-                run("blerepl")
-                run("ble")
-                from ble import ble_o, ble
-                ble.start()
-                print("[BLE] Started.")
-            except Exception as err:
-                print("[BLE] Failed to start:", err)
-        else:
-            print("[BLE] This device does not support Bluetooth.")
-        gc.collect()
-        print("[BOOT] Firmware version:", VERSION)
-        break
-    except KeyboardInterrupt:
-        print("[BOOT] Device is booting...")
+        os.stat(path)
+        return True
+    except OSError:
+        return False
 
-# ===== Thông báo về main.py =====
-try:
-    os.stat("main.py")
-    print("[BOOT] main.py found -> it will run after boot.py exits.")
-except OSError:
-    print("[BOOT] No main.py -> no user program to run.")
+_main_py = _exists("main.py")
+_main_mpy = _exists("__mpy__/main.mpy")
+if APP_RUNNER and ble and (_main_py or _main_mpy):
+    log("[BOOT] %s found -> runs as a task (RUN/STOP over BLE)." % (
+        "__mpy__/main.mpy" if _main_mpy else "main.py"))
+elif _main_py:
+    # firmware chỉ tự chạy main.py (mã nguồn); bytecode của main cần APP_RUNNER
+    log("[BOOT] main.py found -> it will run after boot.py exits.")
+elif _main_mpy:
+    log("[BOOT] __mpy__/main.mpy found -> boot.py runs it.")
+else:
+    log("[BOOT] No main.py -> no user program to run.")
+
+boot_mark("done")
+
+# ===== Luồng số đo (TELEMETRY): lệnh STREAM, nạp trước chương trình người dùng =====
+if TELEMETRY and ble:
+    try:
+        import telemetry
+        telemetry.attach(ble)
+    except Exception as e:
+        log_error("[BOOT] telemetry failed:", e)
 
-print("[BOOT] Done.")
+# ===== REPL qua BLE (BLE_REPL): lệnh REPL / REPL OFF gắn/gỡ os.dupterm =====
+if BLE_REPL and ble:
+    try:
+        import blerepl
+        blerepl.attach(ble)
+    except Exception as e:
+        log_error("[BOOT] blerepl failed:", e)
+
+# ===== Chương trình người dùng chạy cạnh BLE (APP_RUNNER) =====
+# boot.py không kết thúc: runner chạy main.py như task asyncio và thay nó khi có RUN/STOP.
+# Ctrl-C trên serial thoát vòng lặp về REPL như bình thường.
+if APP_RUNNER and ble:
+    try:
+        import runner
+        runner.attach(ble)
+        runner.serve()
+    except Exception as e:
+        log_error("[BOOT] runner failed:", e)
+
+# ===== Chỉ có bytecode của main (không có main.py): firmware không tự chạy, boot.py chạy thay =====
+if not (APP_RUNNER and ble) and _main_mpy and not _main_py:
+    try:
+        run("main")
+    except Exception as e:
+        log_error("[BOOT] main failed:", e)
@@ -0,0 +1,207 @@
+# bytecache.py — bytecode (.mpy) biên dịch sẵn trên host, được ưu tiên hơn mã nguồn .py
+# Host (meblock put --mpy) chạy mpy-cross rồi upload bytecode của `P.py` thành `__mpy__/P.mpy`
+# (giống __pycache__ của CPython): không phải biên dịch trên chip mỗi lần boot/import, ít heap
+# hơn và file gửi qua BLE nhỏ hơn. Mã nguồn (nếu có) vẫn giữ nguyên để rơi về khi cần.
+#
+# MicroPython ưu tiên .py hơn .mpy trong cùng thư mục, nên cache là thư mục riêng đứng trước
+# thư mục nguồn trong sys.path ("" -> "__mpy__", "/lib" -> "/__mpy__/lib"). Chỉ nhận module
+# nằm thẳng trong một thư mục của sys.path: gói trong cache sẽ che phần còn lại của gói.
+#
+# Bytecode cũ (stale): lúc commit bytecode, mốc (size, mtime) của file nguồn đang có (-1 nếu
+# không có) được ghi vào __mpy__/stamps. Upload .py mới xóa bytecode của nó ngay; sửa ngoài
+# giao thức (REPL, mpremote) được sweep() phát hiện lúc boot và trước mỗi lần chạy chương trình.
+# Bytecode không hợp firmware (sau khi nâng cấp MicroPython) cũng bị xóa để rơi về .py.
+import os
+import sys
+from utility import log, log_error
+
+try:
+    from setting import APP_RUNNER
+except Exception:
+    APP_RUNNER = False
+
+CACHE = "__mpy__"
+_STAMPS = CACHE + "/stamps"
+_PREFIX = CACHE + "/"
+_MAIN = _PREFIX + "main.mpy"
+# version | (sub-version | arch << 2) << 8; không có (CPython/trình giả lập): chỉ kiểm tra 'M'
+_MPY = getattr(sys.implementation, "_mpy", None)
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+def _stat(path):
+    # mốc của file nguồn như trong stamps: "size mtime", "-1 0" nếu không có
+    try:
+        st = os.stat(path)
+        return "%d %d" % (st[6], st[8])
+    except OSError:
+        return "-1 0"
+
+def cached(src):
+    """Đường dẫn bytecode của file nguồn: "lib/x.py" -> "__mpy__/lib/x.mpy"."""
+    return _PREFIX + src.lstrip("/")[:-3] + ".mpy"
+
+def source(name):
+    """Ngược lại với cached(): "__mpy__/lib/x.mpy" -> "lib/x.py"."""
+    return name[len(_PREFIX):-4] + ".py"
+
+def is_cached(name):
+    return name.startswith(_PREFIX) and name.endswith(".mpy") and name != _STAMPS
+
+def _on_path(src):
+    d = src.rpartition("/")[0]
+    return not d or d in sys.path or "/" + d in sys.path
+
+def check_header(b):
+    """Lỗi ValueError nếu 4 byte đầu của file .mpy không nạp được trên firmware này."""
+    if len(b) < 4 or b[0] != 0x4D:     # 'M'
+        raise ValueError("not mpy")
+    if _MPY is None:
+        return
+    arch = b[2] >> 2
+    if b[1] != _MPY & 0xFF or (arch and b[2] != (_MPY >> 8) & 0xFF):
+        raise ValueError("mpy v%d.%d arch %d, need v%d.%d arch %d" % (
+            b[1], b[2] & 3, arch, _MPY & 0xFF, (_MPY >> 8) & 3, _MPY >> 10))
+
+def _header_ok(path):
+    try:
+        with open(path, "rb") as f:
+            check_header(f.read(4))
+        return True
+    except (OSError, ValueError):
+        return False
+
+def _load_stamps():
+    stamps = {}
+    try:
+        with open(_STAMPS) as f:
+            for line in f:
+                src, _, st = line.strip().partition(" ")
+                if src:
+                    stamps[src] = st
+    except OSError:
+        pass
+    return stamps
+
+def _save_stamps(stamps):
+    if not stamps:
+        _remove(_STAMPS)
+        return
+    with open(_STAMPS, "w") as f:
+        for src, st in stamps.items():
+            f.write("%s %s\n" % (src, st))
+
+def check_name(name):
+    """
+    ValueError nếu `name` là bytecode không bao giờ được chạy: module nằm trong gói (import
+    không tìm tới), hoặc main khi không có APP_RUNNER mà main.py vẫn còn (firmware tự chạy
+    main.py sau boot.py, boot.py chỉ chạy __mpy__/main.mpy khi không có main.py).
+    Lỗi có chữ "mpy": host (Client.put_module) gửi lại mã nguồn thay cho bytecode.
+    """
+    if not is_cached(name):
+        return
+    if not _on_path(source(name)):
+        raise ValueError("mpy not on sys.path")
+    if name == _MAIN and not APP_RUNNER and _stat("main.py") != "-1 0":
+        raise ValueError("mpy main needs APP_RUNNER while main.py exists")
+
+def check(name, path):
+    """
+    Bước commit upload, trước khi rename `path` thành `name`: ValueError nếu `name` là bytecode
+    không dùng được (sai phiên bản/kiến trúc, module trong gói), file đích giữ nguyên.
+    """
+    if not is_cached(name):
+        return
+    check_name(name)
+    with open(path, "rb") as f:
+        check_header(f.read(4))
+
+def committed(name):
+    """Sau commit upload: ghi mốc cho bytecode mới, hoặc bỏ bytecode đã cũ của file .py mới."""
+    try:
+        if is_cached(name):
+            stamps = _load_stamps()
+            src = source(name)
+            stamps[src] = _stat(src)
+            _save_stamps(stamps)
+            install()
+        elif name.endswith(".py") and not name.startswith(_PREFIX):
+            drop(name)
+    except Exception as e:
+        log_error("[MPY] commit", name, e)
+
+def drop(src):
+    """Xóa bytecode của file nguồn `src` (nếu có); True nếu đã có để xóa."""
+    src = src.lstrip("/")
+    found = _remove(cached(src))
+    stamps = _load_stamps()
+    if stamps.pop(src, None) is not None:
+        _save_stamps(stamps)
+    if found:
+        log("[MPY] dropped", cached(src))
+    return found
+
+def sweep():
+    """Xóa bytecode cũ hơn mã nguồn hoặc không hợp firmware; trả về số file đã xóa."""
+    stamps = _load_stamps()
+    stale = 0
+    changed = False
+    for src in list(stamps):
+        mpy = cached(src)
+        try:
+            os.stat(mpy)
+        except OSError:
+            del stamps[src]     # bytecode đã bị xóa tay
+            changed = True
+            continue
+        if stamps[src] != _stat(src) or not _header_ok(mpy):
+            _remove(mpy)
+            del stamps[src]
+            stale += 1
+            changed = True
+            log("[MPY] stale:", mpy)
+    if changed:
+        _save_stamps(stamps)
+    return stale
+
+def install():
+    """Đặt thư mục cache (nếu đã có) ngay trước thư mục nguồn tương ứng trong sys.path."""
+    for p in list(sys.path):
+        if p == ".frozen" or p.startswith(CACHE) or p.startswith("/" + CACHE):
+            continue
+        c = CACHE if not p else (("/" + CACHE + p) if p[0] == "/" else _PREFIX + p)
+        if c in sys.path:
+            continue
+        try:
+            os.stat(c)
+        except OSError:
+            continue
+        sys.path.insert(sys.path.index(p), c)
+
+def load(name):
+    """
+    __import__(name) cho trình chạy chương trình (boot.run, runner): dọn bytecode cũ trước;
+    nếu bytecode vẫn không nạp được thì xóa nó và nạp lại từ .py.
+    """
+    sweep()
+    try:
+        return __import__(name)
+    except ValueError as e:
+        if "mpy" not in str(e):
+            raise
+        rel = name.replace(".", "/") + ".py"
+        found = drop(rel)
+        for p in sys.path:
+            if p and p[0] == "/" and not p.startswith("/" + CACHE):
+                found = drop(p[1:] + "/" + rel) or found
+        if not found:
+            raise
+        log_error("[MPY] bytecode rejected, using source:", name, e)
+        if name in sys.modules:
+            del sys.modules[name]
+        return __import__(name)
@@ -1,11 +1,12 @@
+# hello_app.py — chương trình mẫu; với APP_RUNNER, runner gọi main() như một task asyncio
+import asyncio
 
-# hello_app.py
-import time
-def run():
+async def main():
     i = 0
     while True:
         print("Hello from BLE app:", i)
         i += 1
-        time.sleep(1)
+        await asyncio.sleep(1)
+
 if __name__ == "__main__":
-    run()
+    asyncio.run(main())
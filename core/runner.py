@@ -0,0 +1,193 @@
+# runner.py — chạy chương trình người dùng (main.py) như một task asyncio cạnh dịch vụ BLE.
+# Lệnh BLE RUN/STOP hủy chương trình cũ, dọn module của nó khỏi sys.modules rồi chạy bản
+# mới ngay, không reset chip nên kết nối BLE vẫn giữ nguyên.
+#
+# Chương trình cần có `async def main()` và nhường CPU bằng `await asyncio.sleep...`.
+# Module không có main() (vd main.py kiểu cũ: def run() + if __name__ == "__main__") bị
+# dọn lại và báo ERR RUN NOMAIN, vì dưới runner __name__ không phải "__main__"; vòng lặp
+# chặn kiểu `while True: time.sleep(1)` sẽ chặn luôn RUN/STOP cho tới khi reset.
+import sys
+import asyncio
+import bytecache
+from micropython import schedule
+from utility import log, log_error, arg_text
+
+try:
+    from setting import APP_MAIN
+except Exception:
+    APP_MAIN = "main"
+
+try:
+    _Flag = asyncio.ThreadSafeFlag
+except AttributeError:
+    # CPython (trình giả lập): cùng một luồng nên Event là đủ
+    class _Flag(asyncio.Event):
+        async def wait(self):
+            await super().wait()
+            self.clear()
+
+_flag = None        # supervisor chờ trên cờ này; None = chưa chạy
+_req = None         # yêu cầu đang chờ: ("run", module) hoặc ("stop", None)
+_reply = None       # gửi phản hồi về host (qua schedule, cùng ngữ cảnh với BLE)
+_task = None        # task của chương trình đang chạy
+_name = None        # tên module đang chạy
+_mods = None        # các module có sẵn trước khi nạp chương trình
+
+def _module(arg):
+    # "main.py" / "apps/blink.py" -> "main" / "apps.blink"
+    name = arg.strip() or APP_MAIN
+    if name.endswith(".py"):
+        name = name[:-3]
+    return name.replace("/", ".")
+
+def running():
+    """Tên module đang chạy, hoặc None."""
+    return _name if _task is not None and not _task.done() else None
+
+def _send(msg):
+    if _reply:
+        _reply(msg)
+
+def _respond(msg):
+    # supervisor chạy ở luồng chính: gửi qua schedule để không chen ngang BLEUART
+    try:
+        schedule(_send, msg)
+    except RuntimeError:
+        _send(msg)
+
+def request(op, name=None):
+    """Giao việc cho supervisor (gọi từ handler BLE); False nếu runner chưa chạy."""
+    global _req
+    if _flag is None:
+        return False
+    _req = (op, name)
+    _flag.set()
+    return True
+
+def _load(name):
+    # nạp mới chương trình; trả về coroutine main() hoặc None nếu main() không phải async
+    global _mods, _name
+    _mods = set(sys.modules)
+    if name in sys.modules:
+        del sys.modules[name]
+    _name = name
+    try:
+        m = bytecache.load(name)     # bytecode (__mpy__/...) nếu còn mới, không thì .py
+        for part in name.split(".")[1:]:
+            m = getattr(m, part)
+        fn = getattr(m, "main", None)
+        if fn is None:
+            raise ValueError("NOMAIN")
+        coro = fn()
+        # main() thường (không async) đã chạy xong ngay trong lúc gọi
+        return coro if hasattr(coro, "send") else None
+    except BaseException:
+        _unload()
+        raise
+
+def _unload():
+    # bỏ mọi module được nạp từ lúc chạy chương trình (chính nó và thư viện riêng của nó)
+    global _mods, _name
+    if _mods is not None:
+        for k in list(sys.modules):
+            if k not in _mods:
+                del sys.modules[k]
+    _mods = None
+    _name = None
+    import gc
+    gc.collect()
+
+async def _guard(coro, name):
+    try:
+        await coro
+        log("[APP] finished:", name)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log_error("[APP] crashed:", name, e)
+
+async def _stop():
+    global _task
+    t, _task = _task, None
+    if t is not None:
+        t.cancel()
+        try:
+            await t
+        except BaseException:
+            pass
+        log("[APP] stopped:", _name)
+    _unload()
+
+async def _start(name):
+    global _task
+    coro = _load(name)
+    if coro is not None:
+        _task = asyncio.create_task(_guard(coro, name))
+    log("[APP] started:", name)
+
+def _detach():
+    # vòng lặp supervisor đã dừng (Ctrl-C, task bị hủy): request() trả False -> ERR NORUNNER
+    # thay vì nhận RUN/STOP rồi không bao giờ trả lời
+    global _flag, _req, _task
+    _flag = _req = _task = None
+
+async def supervisor(first=APP_MAIN):
+    """Chạy `first` (nếu có) rồi phục vụ các yêu cầu RUN/STOP mãi mãi."""
+    global _flag
+    _flag = _Flag()
+    try:
+        await _serve(first)
+    finally:
+        _detach()
+
+async def _serve(first):
+    global _req
+    if first:
+        try:
+            await _start(first)
+        except ImportError:
+            log("[APP] no", first)
+        except Exception as e:
+            # NOMAIN: chương trình không có main() nên không có gì chạy (xem đầu file)
+            log_error("[APP] start failed:", first, e)
+    while True:
+        await _flag.wait()
+        req, _req = _req, None
+        if req is None:
+            continue
+        op, name = req
+        old = _name
+        await _stop()
+        if op == "stop":
+            _respond("OK STOP %s\n" % (old or "NONE"))
+            continue
+        try:
+            await _start(name)
+            _respond("OK RUN %s\n" % name)
+        except Exception as e:
+            log_error("[APP] start failed:", name, e)
+            _respond("ERR RUN %s\n" % e)
+
+def _cmd_run(arg):
+    if not request("run", _module(arg_text(arg))):
+        _send("ERR RUN NORUNNER\n")
+
+def _cmd_stop(arg):
+    if not request("stop"):
+        _send("ERR STOP NORUNNER\n")
+
+def attach(ble):
+    """Đăng ký lệnh RUN [module] / STOP vào dịch vụ BLE."""
+    global _reply
+    _reply = ble.uart.send if ble.uart else None
+    ble.register("RUN", _cmd_run)
+    ble.register("STOP", _cmd_stop)
+
+def serve(first=APP_MAIN):
+    """Vòng lặp asyncio với supervisor; chỉ trả về khi Ctrl-C dừng vòng lặp."""
+    try:
+        asyncio.run(supervisor(first))
+    finally:
+        # Ctrl-C (serial, hoặc Client.exec qua REPL BLE) dừng vòng lặp ngay khi đang chờ,
+        # finally của supervisor() có thể không kịp chạy
+        _detach()
@@ -5,3 +5,47 @@ VERSION = "1.0.0"
 
 # Tùy chọn: tên quảng bá BLE (ble.py đang mặc định là 'ESP32-BLE-OTA')
 BLE_NAME = "MEBLOCK-TOPKID"
+
+# Cửa sổ truyền file: số chunk tối đa host được gửi trước khi chờ ACK
+BLE_WINDOW = 8
+
+# Vòng đệm nhận BLE (byte): phải lớn hơn một dòng DATA/frame dài nhất
+BLE_RX_BUF = 2048
+
+# Hàng đợi gửi BLE (byte): cả cửa sổ GET (BLE_WINDOW frame, mỗi frame một notify) phải vừa ở đây
+BLE_TX_BUF = 2048
+
+# Block ghi flash khi upload (byte), nên bằng kích thước sector xóa (ESP32: 4096)
+BLE_BLOCK_SIZE = 4096
+
+# Vòng sự kiện log trong RAM (lệnh LOGS): số mục giữ lại
+LOG_SIZE = 32
+
+# True: log() in thêm ra console (khi debug qua cổng serial)
+LOG_PRINT = False
+
+# Mức log: 0 tắt, 1 lỗi, 2 sự kiện (mặc định), 3 debug (thêm từng lệnh BLE nhận được)
+LOG_LEVEL = 2
+
+# Số dòng/frame tối đa xử lý mỗi lượt (ngoài IRQ) trước khi nhường cho BLE và chương trình chính
+BLE_RX_BUDGET = 8
+
+# True: boot.py chạy main.py như task asyncio cạnh BLE; RUN/STOP thay chương trình không cần reset.
+# main.py phải có `async def main()`: main.py kiểu cũ (def run() + if __name__ == "__main__")
+# không chạy gì dưới runner (RUN trả ERR RUN NOMAIN), nên mặc định tắt
+APP_RUNNER = False
+APP_MAIN = "main"
+
+# True: lệnh BLE STREAM <hz> / STREAM OFF gửi số đo của các nguồn đăng ký bằng telemetry.add()
+TELEMETRY = True
+
+# True: lệnh BLE REPL / REPL OFF gắn REPL vào kết nối BLE (os.dupterm), dùng chung với giao thức file
+BLE_REPL = True
+
+# Timer phần cứng ESP32 (0..3) của firmware, mỗi phần một timer riêng; timer không khởi tạo được
+# thì thử timer ảo (-1) nếu FW hỗ trợ. Chương trình người dùng cần timer phần cứng: đổi số ở đây
+# hoặc đặt BLE_TX_TIMER = None (hàng đợi TX kẹt chỉ được đẩy lại khi host ghi: lệnh, ACK, NAK).
+BLE_TX_TIMER = 0        # bleuart.py: thử notify lại khi controller đầy (one-shot, chỉ lúc kẹt)
+DRD_TIMER = 1           # boot.py: hết cửa sổ double-reset
+TELEMETRY_TIMER = 2     # telemetry.py: nhịp lấy mẫu khi STREAM
+BLE_REPL_TIMER = 3      # blerepl.py: đẩy đầu ra REPL khi đường truyền rảnh
@@ -0,0 +1,181 @@
+# telemetry.py — luồng số đo nhị phân qua BLE UART (lệnh STREAM <hz> / STREAM OFF)
+# Chương trình người dùng đăng ký nguồn đo: hàm không đối số, trả về số (hoặc None), KHÔNG
+# được chặn (chạy trong callback timer). Với HCSR04 dùng SonarScheduler + latest():
+#     import telemetry
+#     telemetry.add("front", front.latest, 10)      # cm -> mm (int16)
+#
+# Host gửi "STREAM 50" -> "OK STREAM 50 front,left"; sau đó thiết bị gửi các frame xen giữa
+# các dòng text, mỗi frame gom nhiều mẫu cho đầy một notify:
+#   0x00 <len u8> <seq u8> <nsrc u8> <t0 ms u32> { <dt ms u16> <v i16> * nsrc } *
+# len = số byte sau chính nó. 0x00 không bao giờ mở đầu một dòng text nên host tách được.
+# Dừng khi "STREAM OFF" (-> "OK STREAM OFF <mẫu> <frame bỏ>") hoặc mất kết nối.
+import struct
+import time
+from micropython import schedule, const
+from utility import log, log_error, arg_switch
+
+try:
+    from setting import TELEMETRY_TIMER
+except Exception:
+    TELEMETRY_TIMER = 2
+
+_MARK      = const(0)
+_HDR       = const(8)
+_MISSING   = const(-32768)  # nguồn trả None/lỗi
+_MAX_HZ    = const(200)
+_MAX_SRC   = const(16)
+_FLUSH_MS  = const(200)     # frame chưa đầy vẫn được gửi sau chừng này (tần số thấp)
+_TX_RESERVE = const(256)    # chừa chỗ trong hàng đợi TX cho phản hồi giao thức (ACK upload...)
+
+_names = []
+_fns = []
+_scales = []
+
+_uart = None
+_timer = None
+_frame = None       # bytearray cấp phát khi STREAM, dùng lại cho mọi frame
+_cap = 0            # byte tối đa mỗi frame (một notify)
+_n = 0              # byte đã dùng trong frame hiện tại (0 = chưa mở)
+_t0 = 0
+_seq = 0
+_pending = False    # đã schedule _sample, chưa chạy
+samples = 0
+dropped = 0         # frame bỏ vì hàng đợi TX gần đầy (upload được ưu tiên)
+
+def add(name, fn, scale=1):
+    """Đăng ký (hoặc thay) nguồn `name`: giá trị gửi đi là int(fn() * scale), kẹp vào int16."""
+    if name in _names:
+        i = _names.index(name)
+        _fns[i] = fn
+        _scales[i] = scale
+        return
+    if len(_names) >= _MAX_SRC or _timer is not None:
+        raise ValueError("telemetry: too many sources or streaming")
+    _names.append(name)
+    _fns.append(fn)
+    _scales.append(scale)
+
+def remove(name):
+    if name in _names and _timer is None:
+        i = _names.index(name)
+        del _names[i], _fns[i], _scales[i]
+
+def streaming():
+    return _timer is not None
+
+def _isr(t):
+    # timer: chỉ hẹn lấy mẫu ra ngoài ngắt
+    global _pending
+    if _pending:
+        return
+    try:
+        schedule(_sample, None)
+        _pending = True
+    except RuntimeError:
+        pass    # hàng đợi schedule đầy: bỏ nhịp này
+
+def _flush():
+    global _n, _seq, dropped
+    _frame[1] = _n - 2
+    if _uart.tx_room() < _n + _TX_RESERVE:
+        dropped += 1
+    else:
+        _uart.send(memoryview(_frame)[:_n])
+    _seq = (_seq + 1) & 0xFF
+    _n = 0
+
+def _sample(_):
+    global _pending, _n, _t0, samples
+    _pending = False
+    if _timer is None:
+        return
+    if not _uart.is_connected():
+        stop()
+        log("[TLM] stopped: disconnected")
+        return
+    now = time.ticks_ms()
+    rec = 2 + 2 * len(_fns)
+    if not _n:
+        _t0 = now
+        struct.pack_into("<BBBBI", _frame, 0, _MARK, 0, _seq, len(_fns), now & 0xFFFFFFFF)
+        _n = _HDR
+    struct.pack_into("<H", _frame, _n, time.ticks_diff(now, _t0))
+    _n += 2
+    for i in range(len(_fns)):
+        try:
+            v = _fns[i]()
+            if v is None:
+                v = _MISSING
+            else:
+                v = int(v * _scales[i])
+                if v > 32767:
+                    v = 32767
+                elif v < -32767:
+                    v = -32767
+        except Exception:
+            v = _MISSING
+        struct.pack_into("<h", _frame, _n, v)
+        _n += 2
+    samples += 1
+    if _n + rec > _cap or time.ticks_diff(now, _t0) >= _FLUSH_MS:
+        _flush()
+
+def start(hz):
+    """Bắt đầu lấy mẫu `hz` lần/giây; trả về tần số thật (chu kỳ ms nguyên)."""
+    global _timer, _frame, _cap, _n, _seq, samples, dropped
+    stop()
+    period = max(1000 // _MAX_HZ, 1000 // max(1, hz))
+    _cap = min(255, _uart.payload_size())
+    if _cap < _HDR + 2 + 2 * len(_fns):
+        raise ValueError("MTU too small")
+    if _frame is None or len(_frame) < _cap:
+        _frame = bytearray(_cap)
+    _n = _seq = samples = dropped = 0
+    from machine import Timer
+    for tid in (TELEMETRY_TIMER, -1):
+        try:
+            t = Timer(tid)
+            t.init(mode=Timer.PERIODIC, period=period, callback=_isr)
+            _timer = t
+            break
+        except Exception as e:
+            log_error("[TLM] Timer(%d) init failed:" % tid, e)
+    if _timer is None:
+        raise OSError("no timer")
+    log("[TLM] streaming", ",".join(_names), "every", period, "ms")
+    return 1000 // period
+
+def stop():
+    """Dừng luồng, gửi nốt frame dở."""
+    global _timer
+    t, _timer = _timer, None
+    if t is None:
+        return
+    try:
+        t.deinit()
+    except Exception:
+        pass
+    if _n and _uart.is_connected():
+        _flush()
+
+def _cmd_stream(arg):
+    a = arg_switch(arg)
+    if a is None:
+        stop()
+        _uart.send("OK STREAM OFF %d %d\n" % (samples, dropped))
+        return
+    if not _names:
+        _uart.send("ERR STREAM NOSOURCES\n")
+        return
+    try:
+        hz = start(int(a) if a else 10)
+    except Exception as e:
+        _uart.send("ERR STREAM %s\n" % e)
+        return
+    _uart.send("OK STREAM %d %s\n" % (hz, ",".join(_names)))
+
+def attach(ble):
+    """Đăng ký lệnh STREAM vào dịch vụ BLE."""
+    global _uart
+    _uart = ble.uart
+    ble.register("STREAM", _cmd_stream)
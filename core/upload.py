@@ -0,0 +1,346 @@
+# upload.py — ghi file upload theo block vào file tạm, commit bằng rename
+import os
+import ubinascii
+import bytecache
+from time import ticks_us, ticks_diff
+from utility import log_error, mem_sample, STATS, FLASH_WRITES, FLASH_US, FLASH_MAX_US
+
+_TMP_SUFFIX = ".part"
+_INZ_SUFFIX = ".inz"    # file đang giải nén (ENC=zlib) trước khi rename
+
+# ===== Trạng thái phiên upload dở, lưu NVS (giống DRD trong boot.py) để resume =====
+try:
+    from esp32 import NVS
+    _nvs = NVS("upload")
+except Exception:
+    _nvs = None
+_mem_state = None       # dự phòng khi không có NVS: chỉ resume được trong cùng lần boot
+_name_buf = bytearray(128)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def save_state(name, size, committed):
+    global _mem_state
+    if _nvs is None:
+        _mem_state = (name, size, committed)
+        return
+    try:
+        _nvs.set_blob("name", name)
+        _nvs.set_i32("size", size)
+        _nvs.set_i32("done", committed)
+        _nvs.commit()
+    except Exception as e:
+        log_error("[UPLOAD] save state failed:", e)
+
+def load_state():
+    """(name, size, committed) của phiên dở gần nhất, hoặc None."""
+    if _nvs is None:
+        st = _mem_state
+    else:
+        try:
+            n = _nvs.get_blob("name", _name_buf)
+            st = (bytes(_name_buf[:n]).decode(), _nvs.get_i32("size"), _nvs.get_i32("done"))
+        except OSError:
+            return None
+    if not st:
+        return None
+    # file tạm phải còn và chứa ít nhất phần đã ghi nhận
+    try:
+        if os.stat(st[0] + _TMP_SUFFIX)[6] < st[2]:
+            return None
+    except OSError:
+        return None
+    return st
+
+def _inflater(f):
+    # MicroPython >= 1.21: deflate.DeflateIO; bản cũ hơn: uzlib.DecompIO.
+    # Cửa sổ giải nén lấy theo header zlib -> host nên nén với wbits nhỏ (vd 10 = 1KB).
+    try:
+        import deflate
+        return deflate.DeflateIO(f, deflate.ZLIB)
+    except ImportError:
+        import uzlib
+        return uzlib.DecompIO(f)
+
+def _makedirs(path):
+    # tạo các thư mục cha còn thiếu ('Lib/x.py' -> 'Lib')
+    i = path.find("/", 1)
+    while i > 0:
+        try:
+            os.mkdir(path[:i])
+        except OSError:
+            pass
+        i = path.find("/", i + 1)
+
+def block_crcs(name, buf, start=0, count=-1):
+    """[crc32 từng block] của file `name` từ block `start`, tối đa `count` block, đọc vào `buf`."""
+    crcs = []
+    with open(name, "rb") as f:
+        f.seek(start * len(buf))
+        while count:
+            n = f.readinto(buf)
+            if not n:
+                break
+            crcs.append(ubinascii.crc32(buf[:n]))
+            count -= 1
+    return crcs
+
+def clear_state():
+    global _mem_state
+    _mem_state = None
+    if _nvs is None:
+        return
+    try:
+        _nvs.erase_key("name")
+        _nvs.commit()
+    except OSError:
+        pass
+
+class UploadWriter:
+    """
+    Gom các chunk nhỏ vào một block cấp phát sẵn (cỡ sector xóa flash), chỉ ghi
+    nguyên block xuống file tạm `<name>.part`. commit() đổi tên đè lên file đích
+    khi đã nhận đủ `size` byte; nếu không, file đích giữ nguyên như trước khi upload.
+
+    Sau mỗi block, số byte đã ghi được lưu lại (save_state) để phiên có thể
+    tiếp tục từ `offset` sau khi mất kết nối hoặc khởi động lại.
+
+    CRC32 (từng block và cả file) và SHA-256 (nếu bật) được cập nhật ngay khi
+    block được ghi, nên kiểm tra lúc DONE không phải đọc lại file từ flash.
+
+    base=True (upload DELTA): giữ file đích cũ mở để copy() chép các đoạn không
+    đổi thẳng vào block, host chỉ cần gửi phần đã sửa.
+
+    enc="zlib": `size`, digest và resume đều tính trên dữ liệu nén như đã truyền;
+    prepare() giải nén dần (từng block) ra file tạm, kiểm tra `raw` nếu có.
+
+    commit() = prepare() + rename(): mọi bước có thể hỏng nằm trong prepare(), nên
+    BUNDLE chuẩn bị hết các file rồi mới thay file đích nào.
+
+    persist=False: không lưu trạng thái resume (file trong BUNDLE).
+    """
+    def __init__(self, name, size, buf, offset=0, sha=False, base=False, enc=None, raw=None,
+                 persist=True):
+        self.name = name
+        self.size = size
+        self.persist = persist
+        self.enc = enc
+        self.raw = raw
+        self.tmp = name + _TMP_SUFFIX
+        self._ready = None      # file sẵn sàng thay file đích sau prepare() (tmp hoặc .inz)
+        self.written = 0        # số byte đã nhận
+        self.committed = 0      # số byte đã thực sự ghi xuống flash
+        self.crc = 0            # CRC32 của phần đã ghi
+        self.blocks = []        # CRC32 từng block đã ghi
+        self._sha = None
+        if sha:
+            import hashlib
+            self._sha = hashlib.sha256()
+        self._buf = buf
+        self._mv = memoryview(buf)
+        self._fill = 0
+        self._base = open(name, "rb") if base else None
+        if offset:
+            self._fp = open(self.tmp, "r+b")
+            self._reload(offset)
+        else:
+            _makedirs(name)
+            self._fp = open(self.tmp, "wb")
+        self._save(offset)
+
+    def _reload(self, offset):
+        # Resume: băm lại phần đã có trên flash theo đúng ranh giới block,
+        # block dở cuối cùng được nạp lại vào buffer để ghi lại nguyên block.
+        blk = len(self._buf)
+        aligned = offset - offset % blk
+        while self.committed < aligned:
+            self._fp.readinto(self._mv)
+            self._hash_block(self._mv)
+            self.committed += blk
+        self._fill = offset - aligned
+        if self._fill:
+            self._fp.readinto(self._mv[:self._fill])
+        self._fp.seek(aligned)
+        self.written = offset
+
+    @property
+    def left(self):
+        return self.size - self.written
+
+    def write(self, b):
+        n = len(b)
+        if n > self.left:
+            raise ValueError("overrun")
+        src = memoryview(b)
+        blk = len(self._buf)
+        i = 0
+        while i < n:
+            k = min(n - i, blk - self._fill)
+            self._mv[self._fill:self._fill + k] = src[i:i + k]
+            self._fill += k
+            i += k
+            if self._fill == blk:
+                self._flush()
+        self.written += n
+        return n
+
+    def copy(self, off, n):
+        """Chép n byte từ file cũ (vị trí off) vào cuối phần đã nhận."""
+        if not self._base:
+            raise ValueError("no base")
+        if n > self.left:
+            raise ValueError("overrun")
+        self._base.seek(off)
+        blk = len(self._buf)
+        while n:
+            k = self._base.readinto(self._mv[self._fill:min(blk, self._fill + n)])
+            if not k:
+                raise ValueError("base eof")
+            self._fill += k
+            self.written += k
+            n -= k
+            if self._fill == blk:
+                self._flush()
+
+    def _close_base(self):
+        if self._base:
+            self._base.close()
+            self._base = None
+
+    def _hash_block(self, mv):
+        c = ubinascii.crc32(mv)
+        self.blocks.append(c)
+        self.crc = ubinascii.crc32(mv, self.crc)
+        if self._sha:
+            self._sha.update(mv)
+
+    def _flush(self):
+        if self._fill:
+            mv = self._mv[:self._fill]
+            t = ticks_us()
+            self._fp.write(mv)
+            self._fp.flush()
+            t = ticks_diff(ticks_us(), t)
+            STATS[FLASH_WRITES] += 1
+            STATS[FLASH_US] += t
+            if t > STATS[FLASH_MAX_US]:
+                STATS[FLASH_MAX_US] = t
+            mem_sample()
+            self._hash_block(mv)
+            self.committed += self._fill
+            self._fill = 0
+            self._save(self.committed)
+
+    def _save(self, committed):
+        if self.persist:
+            save_state(self.name, self.size, committed)
+
+    def sha256(self):
+        return ubinascii.hexlify(self._sha.digest()).decode() if self._sha else None
+
+    def verify(self, crc=None, sha=None, blocks=None):
+        """
+        So với digest host gửi (sau finish()). None nếu khớp; nếu sai trả về
+        chỉ số block đầu tiên lệch (khi có danh sách CRC từng block), ngược lại -1.
+        """
+        if blocks:
+            for i in range(min(len(blocks), len(self.blocks))):
+                if blocks[i] != self.blocks[i]:
+                    return i
+        if crc is not None and crc != self.crc:
+            return -1
+        if sha is not None and sha.lower() != self.sha256():
+            return -1
+        return None
+
+    def finish(self):
+        """Ghi nốt block cuối và đóng file tạm (digest đã đầy đủ)."""
+        self._close_base()
+        if self._fp:
+            self._flush()
+            self._fp.close()
+            self._fp = None
+
+    def rewind(self, block):
+        """Giữ file tạm nhưng lùi mốc resume về đầu `block` để host gửi lại từ đó."""
+        self.finish()
+        self._save(block * len(self._buf))
+
+    def suspend(self):
+        """Ghi nốt phần đang gom, đóng file tạm và giữ trạng thái để resume."""
+        self.finish()
+
+    def prepare(self):
+        """
+        Mọi bước có thể hỏng của commit, chưa đụng tới file đích: ghi nốt block cuối, giải nén
+        (ENC) ra file tạm, kiểm tra bytecode. False (và hủy file tạm) nếu thiếu dữ liệu; lỗi thì
+        ném ra, abort() dọn các file tạm. BUNDLE prepare() mọi file trước khi rename() file nào.
+        """
+        if self.left:
+            self.abort()
+            return False
+        self.finish()
+        if self._ready is None:
+            src = self._inflate() if self.enc else self.tmp
+            bytecache.check(self.name, src)
+            self._ready = src
+        return True
+
+    def rename(self):
+        """Thay file đích bằng file đã prepare()."""
+        src, self._ready = self._ready, None
+        try:
+            os.rename(src, self.name)
+        except OSError:
+            # FAT không cho rename đè: xóa file đích trước
+            _remove(self.name)
+            os.rename(src, self.name)
+        _remove(self.tmp)
+        if self.persist:
+            clear_state()
+        bytecache.committed(self.name)
+
+    def commit(self):
+        """prepare() rồi rename(); False (và hủy file tạm) nếu thiếu dữ liệu."""
+        if not self.prepare():
+            return False
+        self.rename()
+        return True
+
+    def _inflate(self):
+        # Giải nén luồng: mỗi lần một block vào buffer sẵn có, RAM không phụ thuộc kích thước file
+        out = self.name + _INZ_SUFFIX
+        total = 0
+        try:
+            with open(self.tmp, "rb") as f, open(out, "wb") as g:
+                d = _inflater(f)
+                while True:
+                    n = d.readinto(self._mv)
+                    if not n:
+                        break
+                    g.write(self._mv[:n])
+                    total += n
+            if self.raw is not None and total != self.raw:
+                raise ValueError("raw size %d" % total)
+        except Exception:
+            _remove(out)
+            raise
+        return out
+
+    def abort(self):
+        self._close_base()
+        if self._fp:
+            try:
+                self._fp.close()
+            except Exception:
+                pass
+            self._fp = None
+        self._ready = None
+        _remove(self.tmp)
+        _remove(self.name + _INZ_SUFFIX)
+        if self.persist:
+            clear_state()
@@ -1,10 +1,145 @@
-# utility.py — tối thiểu, không bắt buộc nhưng để boot.py import cho sạch log
+# utility.py — log vào vòng sự kiện trong RAM + bộ đếm thống kê (lệnh BLE LOGS/STATS)
 import time
+from micropython import const
 
-def log(*args):
-    # In kèm timestamp ms cho dễ đọc log
+try:
+    from setting import LOG_SIZE
+except Exception:
+    LOG_SIZE = 32
+
+try:
+    from setting import LOG_PRINT
+except Exception:
+    LOG_PRINT = False
+
+# Mức log: chỉ sự kiện có mức <= LOG_LEVEL được ghi
+LOG_OFF   = const(0)
+LOG_ERROR = const(1)
+LOG_INFO  = const(2)
+LOG_DEBUG = const(3)    # thêm từng dòng lệnh BLE nhận được (không gồm DATA)
+
+try:
+    from setting import LOG_LEVEL
+except Exception:
+    LOG_LEVEL = LOG_INFO
+
+try:
+    from gc import mem_free as _mem_free
+except ImportError:
+    _mem_free = None    # CPython (trình giả lập)
+
+# ===== Bộ đếm =====
+# Đường nóng chỉ làm STATS[X] += n trên list cấp phát sẵn: không cấp phát, không gọi hàm.
+RX_BYTES     = const(0)     # byte nhận qua BLE
+RX_WRITES    = const(1)     # số lần ghi GATT từ host
+RX_LINES     = const(2)     # dòng lệnh text
+RX_FRAMES    = const(3)     # frame nhị phân
+RX_OVERFLOW  = const(4)     # tràn vòng đệm RX (đã báo ERR OVERFLOW)
+RX_WRAPS     = const(5)     # dòng/frame vắt qua cuối vòng phải chép sang vùng tạm
+CHUNKS       = const(6)     # chunk DATA/frame/COPY đã ghi vào file upload
+DECODE_US    = const(7)     # tổng thời gian giải base64
+FLASH_WRITES = const(8)     # số block ghi xuống flash
+FLASH_US     = const(9)     # tổng thời gian ghi flash
+FLASH_MAX_US = const(10)    # lần ghi block lâu nhất
+NAKS         = const(11)    # số NAK đã gửi (khoảng hở seq)
+DUPS         = const(12)    # chunk trùng (host gửi lại)
+TX_BYTES     = const(13)    # byte đã notify
+NOTIFY_FAIL  = const(14)    # gatts_notify lỗi (thường ENOMEM, sẽ thử lại)
+TX_DROPPED   = const(15)    # byte bỏ vì hàng đợi TX đầy
+MEM_LOW      = const(16)    # gc.mem_free() thấp nhất đã thấy (0 = chưa đo)
+RX_PEAK      = const(17)    # số byte chờ xử lý cao nhất trong vòng đệm RX
+
+_STAT_NAMES = ("rx_bytes", "rx_writes", "rx_lines", "rx_frames", "rx_overflow", "rx_wraps",
+               "chunks", "decode_us", "flash_writes", "flash_us", "flash_max_us", "naks",
+               "dups", "tx_bytes", "notify_fail", "tx_dropped", "mem_low", "rx_peak")
+
+STATS = [0] * len(_STAT_NAMES)
+
+def mem_sample():
+    """Cập nhật mức RAM trống thấp nhất (gọi thưa: mỗi block flash, mỗi lệnh)."""
+    if _mem_free is None:
+        return
+    f = _mem_free()
+    if not STATS[MEM_LOW] or f < STATS[MEM_LOW]:
+        STATS[MEM_LOW] = f
+
+def stats():
+    """[(tên, giá trị)] của mọi bộ đếm, kèm mốc thời gian các giai đoạn boot."""
+    return list(zip(_STAT_NAMES, STATS)) + _boot
+
+def stats_reset():
+    for i in range(len(STATS)):
+        STATS[i] = 0
+
+# ===== Vòng sự kiện =====
+# Mỗi mục chỉ giữ (ticks_ms, args): chuỗi chỉ được ghép khi đọc (LOGS), không phải lúc ghi.
+_log = [None] * LOG_SIZE
+_log_i = 0
+_log_n = 0
+
+def _record(args):
+    global _log_i, _log_n
     ts = time.ticks_ms()
-    print("[%.3fs]" % (ts / 1000), *args)
+    _log[_log_i] = (ts, args)
+    _log_i = (_log_i + 1) % LOG_SIZE
+    if _log_n < LOG_SIZE:
+        _log_n += 1
+    if LOG_PRINT:
+        # In kèm timestamp ms cho dễ đọc log
+        print("[%.3fs]" % (ts / 1000), *args)
+
+def log(*args):
+    if LOG_LEVEL >= LOG_INFO:
+        _record(args)
+
+def log_error(*args):
+    if LOG_LEVEL >= LOG_ERROR:
+        _record(args)
+
+def log_debug(*args):
+    # đường nóng nên tự kiểm tra LOG_LEVEL trước khi gọi để khỏi tạo tuple args
+    if LOG_LEVEL >= LOG_DEBUG:
+        _record(args)
+
+def logs(n=None):
+    """n sự kiện gần nhất (cũ -> mới) dạng (ticks_ms, chuỗi)."""
+    n = _log_n if n is None else min(n, _log_n)
+    out = []
+    for k in range(n):
+        ts, args = _log[(_log_i - n + k) % LOG_SIZE]
+        out.append((ts, " ".join(str(a) for a in args)))
+    return out
+
+# ===== Tham số lệnh BLE =====
+def safe_decode(b):
+    # MicroPython không hỗ trợ errors="ignore" trong .decode()
+    try:
+        return b.decode()
+    except Exception:
+        try:
+            return b.decode("latin-1")
+        except Exception:
+            # thay byte lạ bằng '.'
+            return "".join(chr(x) if 32 <= x < 127 else "." for x in b)
+
+def arg_text(arg):
+    # tham số lệnh (memoryview) -> str đã strip; chỉ dùng cho lệnh ngắn, không cho DATA
+    return safe_decode(bytes(arg)).strip()
+
+def arg_switch(arg):
+    """Tham số của lệnh bật/tắt (STREAM, REPL): None nếu là OFF/0, ngược lại chuỗi viết hoa."""
+    a = arg_text(arg).upper()
+    return None if a in ("OFF", "0") else a
+
+# ===== Mốc boot =====
+# (tên, ticks_ms tính từ lúc reset) của từng giai đoạn trong boot.py, vd boot_ble_ms
+_boot = []
+
+def boot_mark(name, t=None):
+    if t is None:
+        t = time.ticks_ms()
+    _boot.append(("boot_%s_ms" % name, t))
+    log("[BOOT]", name, "at", t, "ms")
 
 def get_ble_name(default="MEBLOCK-TOPKID"):
     # Nếu muốn dùng BLE_NAME trong setting.py cho ble.py sau này
@@ -0,0 +1,8 @@
+# meblock — công cụ phía host cho dịch vụ file BLE của MEBLOCK (core/ble.py)
+from .client import Client, ProtocolError, TransferStats, decode_frame
+from .transport import Transport, BleakTransport, LoopbackTransport, SimTransport
+
+__all__ = [
+    "Client", "ProtocolError", "TransferStats", "decode_frame",
+    "Transport", "BleakTransport", "LoopbackTransport", "SimTransport",
+]
@@ -0,0 +1,225 @@
+# python -m meblock — CLI upload/quản lý file qua BLE
+#   python -m meblock -n MEBLOCK-TOPKID put main.py
+#   python -m meblock -l ./devroot put main.py        (loopback, không cần phần cứng)
+#   python -m meblock -s ./devroot put main.py        (thiết bị giả lập: boot.py + BLEUART)
+#   python -m meblock -s ./devroot --set APP_RUNNER=True put main.py --run
+#                                                     (nạp rồi chạy lại ngay, không reset)
+#   python -m meblock -n MEBLOCK-TOPKID put ultrasonic.py --mpy  (gửi bytecode, cần mpy-cross)
+#   python -m meblock -n MEBLOCK-TOPKID put main.py --delta      (chỉ gửi các block đã sửa)
+#   python -m meblock -n MEBLOCK-TOPKID get log.txt    (đọc file về, kiểm tra CRC32)
+#   python -m meblock -n MEBLOCK-TOPKID repl           (REPL qua BLE, Ctrl-] để thoát)
+#   python -m meblock -n MEBLOCK-TOPKID exec -f t.py   (chạy đoạn mã bằng raw-paste)
+import argparse
+import ast
+import asyncio
+import os
+import sys
+import time
+
+from .client import Client, ProtocolError, deflate
+from . import mpycross
+from .transport import BleakTransport, LoopbackTransport, SimTransport
+
+def _transport(args):
+    if args.loopback:
+        return LoopbackTransport(args.loopback, mtu=args.mtu)
+    if args.sim:
+        settings = {}
+        for kv in args.set or ():
+            k, _, v = kv.partition("=")
+            settings[k] = ast.literal_eval(v)
+        return SimTransport(args.sim, mtu=args.mtu, settings=settings)
+    if not (args.name or args.address):
+        raise SystemExit("need --name, --address, --loopback or --sim")
+    return BleakTransport(address=args.address, name=args.name)
+
+def _progress(stats, tag="PUT"):
+    sys.stdout.write("\r[%s] %d/%d B  %.1f KB/s " % (tag, stats.sent, stats.size, stats.rate / 1024))
+    sys.stdout.flush()
+
+async def _terminal(c):
+    # stdin ở chế độ raw: mọi phím (kể cả Ctrl-C) đi thẳng tới REPL; Ctrl-] thoát
+    import termios
+    import tty
+    await c.repl()
+    print("[REPL] connected, Ctrl-] to exit\r")
+    loop = asyncio.get_running_loop()
+    keys = asyncio.Queue()
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+
+    async def output():
+        while True:
+            data = await c.term_read(timeout=3600)
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+    out = asyncio.ensure_future(output())
+    tty.setraw(fd)
+    loop.add_reader(fd, lambda: keys.put_nowait(os.read(fd, 256)))
+    try:
+        while True:
+            data = await keys.get()
+            if b"\x1d" in data:
+                break
+            await c.term_write(data)
+    finally:
+        loop.remove_reader(fd)
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+        out.cancel()
+    print()
+    await c.repl(False)
+
+async def _run(args):
+    async with Client(_transport(args), timeout=args.timeout) as c:
+        if args.cmd == "ping":
+            print(await c.ping())
+        elif args.cmd == "ls":
+            for name, kind, size in await c.ls(args.path):
+                print("%8s  %s" % ("<dir>", name + "/") if kind == "D" else "%8d  %s" % (size, name))
+        elif args.cmd == "stat":
+            kind, size = await c.stat(args.remote)
+            print("%s %s %d" % (args.remote, "dir" if kind == "D" else "file", size))
+        elif args.cmd == "get":
+            last = []
+
+            def progress(stats):
+                last[:] = [stats]
+                _progress(stats, "GET")
+            data = await c.get(args.remote, args.offset, args.length, window=args.window,
+                               progress=progress)
+            local = args.local or os.path.basename(args.remote)
+            with open(local, "wb") as f:
+                f.write(data)
+            print("\n[GET] %s -> %s: %s" % (args.remote, local, last[0]))
+        elif args.cmd == "reset":
+            print(await c.reset())
+        elif args.cmd == "stats":
+            for k, v in (await c.stats(reset=args.reset)).items():
+                print("%-14s %d" % (k, v))
+        elif args.cmd == "logs":
+            for ts, text in await c.logs(args.count):
+                print("%10.3f  %s" % (ts / 1000, text))
+        elif args.cmd == "run":
+            print("[RUN]", await c.run(args.module))
+        elif args.cmd == "stop":
+            print("[STOP]", await c.stop() or "nothing running")
+        elif args.cmd == "stream":
+            hz, names = await c.stream(args.hz)
+            print("ms," + ",".join(names))
+            end = time.monotonic() + args.seconds
+            try:
+                while time.monotonic() < end:
+                    for ts, vals in await c.samples():
+                        print("%d,%s" % (ts, ",".join("" if v is None else str(v) for v in vals)))
+            finally:
+                n, dropped = await c.stream_off()
+                print("[STREAM] %d samples at %d Hz, %d frames dropped" % (n, hz, dropped),
+                      file=sys.stderr)
+        elif args.cmd == "repl":
+            await _terminal(c)
+        elif args.cmd == "exec":
+            if args.file:
+                with open(args.file) as f:
+                    code = f.read()
+            else:
+                code = args.code
+            await c.repl()
+            try:
+                sys.stdout.write(await c.exec(code, timeout=args.exec_timeout))
+            finally:
+                await c.repl(False)
+        elif args.cmd == "resume":
+            print(await c.resume() or "no pending upload")
+        elif args.cmd == "put":
+            with open(args.local, "rb") as f:
+                data = f.read()
+            remote = args.remote or os.path.basename(args.local)
+            code = None
+            if args.mpy:
+                if not remote.endswith(".py"):
+                    raise SystemExit("--mpy needs a .py file")
+                code = mpycross.compile(data, remote, args.mpy_cross, args.march)
+                print("[PUT] %s: %d B source -> %d B bytecode" % (remote, len(data), len(code)))
+            offset = 0
+            if args.resume:
+                st = await c.resume()
+                target, body = (mpycross.cached(remote), code) if code else (remote, data)
+                size = len((args.zlib and deflate(body)) or body)
+                if st and st[0] == target and st[1] == size:
+                    offset = st[2]
+                    print("[PUT] resuming at", offset)
+            kw = dict(window=args.window, binary=not args.text, chunk=args.chunk, offset=offset,
+                      progress=_progress, compress=args.zlib, delta=args.delta)
+            if code:
+                saved, stats = await c.put_module(remote, data, code, **kw)
+            else:
+                saved, stats = remote, await c.put(remote, data, **kw)
+            print("\n[PUT] %s: %s" % (saved, stats))
+            if args.run:
+                print("[RUN]", await c.run(remote if remote.endswith(".py") else None))
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="meblock", description="MEBLOCK BLE file uploader")
+    g = p.add_argument_group("transport")
+    g.add_argument("-n", "--name", help="BLE name to scan for (BLE_NAME in setting.py)")
+    g.add_argument("-a", "--address", help="BLE address")
+    g.add_argument("-l", "--loopback", metavar="DIR",
+                   help="run core/ble.py in-process with DIR as the device filesystem")
+    g.add_argument("-s", "--sim", metavar="DIR",
+                   help="simulated device (boot.py, BLEUART, fake controller) with DIR as filesystem")
+    g.add_argument("--mtu", type=int, default=247, help="loopback/sim MTU (default 247)")
+    g.add_argument("--set", action="append", metavar="NAME=VALUE",
+                   help="sim: override a setting.py value, e.g. APP_RUNNER=True (repeat)")
+    p.add_argument("-w", "--window", type=int, default=8, help="chunks in flight (default 8)")
+    p.add_argument("--chunk", type=int, help="payload bytes per chunk (default: fit MTU)")
+    p.add_argument("--text", action="store_true", help="base64 DATA lines instead of binary frames")
+    p.add_argument("--timeout", type=float, default=5.0)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    for c in ("ping", "reset", "resume"):
+        sub.add_parser(c)
+    sp = sub.add_parser("ls")
+    sp.add_argument("path", nargs="?")
+    sp = sub.add_parser("stat")
+    sp.add_argument("remote")
+    sp = sub.add_parser("get", help="read a file back (windowed, CRC32-checked)")
+    sp.add_argument("remote")
+    sp.add_argument("local", nargs="?")
+    sp.add_argument("--offset", type=int, default=0)
+    sp.add_argument("--length", type=int)
+    sp = sub.add_parser("stats")
+    sp.add_argument("--reset", action="store_true", help="clear counters after reading")
+    sp = sub.add_parser("logs")
+    sp.add_argument("count", type=int, nargs="?", default=16)
+    sp = sub.add_parser("run", help="(re)start a program without resetting (APP_RUNNER)")
+    sp.add_argument("module", nargs="?", help="default: main")
+    sub.add_parser("stop", help="stop the running program")
+    sp = sub.add_parser("stream", help="print telemetry samples as CSV (STREAM)")
+    sp.add_argument("hz", type=int, nargs="?", default=10)
+    sp.add_argument("--seconds", type=float, default=10.0)
+    sub.add_parser("repl", help="interactive REPL over BLE (BLE_REPL), Ctrl-] exits")
+    sp = sub.add_parser("exec", help="run code on the device REPL (raw-paste)")
+    sp.add_argument("code", nargs="?", default="")
+    sp.add_argument("-f", "--file", help="read the code from FILE")
+    sp.add_argument("--exec-timeout", type=float, default=10.0)
+    sp = sub.add_parser("put")
+    sp.add_argument("local")
+    sp.add_argument("remote", nargs="?")
+    sp.add_argument("--resume", action="store_true", help="continue a pending upload if any")
+    sp.add_argument("--run", action="store_true", help="RUN the uploaded program afterwards")
+    sp.add_argument("--zlib", action="store_true",
+                    help="send zlib-compressed (ENC=zlib) when that is smaller")
+    sp.add_argument("--delta", action="store_true",
+                    help="send only blocks that differ from the file on the device (HASH/COPY)")
+    sp.add_argument("--mpy", action="store_true",
+                    help="send mpy-cross bytecode to __mpy__/ (source if the device rejects it)")
+    sp.add_argument("--march", help="mpy-cross -march (only for native/viper code, ESP32: xtensawin)")
+    sp.add_argument("--mpy-cross", metavar="PATH", help="mpy-cross binary (default: $MPY_CROSS, PATH,"
+                    " or the mpy-cross pip package)")
+    args = p.parse_args(argv)
+    try:
+        asyncio.run(_run(args))
+    except (ProtocolError, mpycross.CompileError) as e:
+        raise SystemExit("[ERR] %s" % e)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# python -m meblock.bench — đo đường upload của core/ble.py trên thiết bị giả lập
+#   python -m meblock.bench                         (1k..256k, BIN và text)
+#   python -m meblock.bench --save base.json        (lưu số đo làm mốc)
+#   python -m meblock.bench --baseline base.json    (so với mốc, exit 1 nếu tụt)
+#
+# Thông lượng với --interval > 0 bị giới hạn bởi liên kết giả lập (gói/connection
+# event); --interval 0 bỏ giới hạn đó để đo chi phí CPU của firmware.
+# Cấp phát đo bằng tracemalloc của CPython: chỉ dùng để so sánh giữa các lần chạy,
+# không phải số byte heap thật trên MicroPython.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from .client import Client
+from .transport import SimTransport
+
+# chỉ số so với mốc: (tên, True nếu càng lớn càng tốt)
+_CHECKS = (("rate", True), ("ack_p90_ms", False), ("heap_peak", False), ("rx_peak", False))
+
+def _size(text):
+    text = text.strip().lower()
+    mul = 1
+    if text.endswith("k"):
+        mul, text = 1024, text[:-1]
+    elif text.endswith("m"):
+        mul, text = 1024 * 1024, text[:-1]
+    return int(text) * mul
+
+def percentile(samples, p):
+    """Phân vị p (0..100) theo nearest-rank; 0 nếu không có mẫu."""
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    k = max(0, min(len(s) - 1, int(round(p / 100 * len(s) + 0.5)) - 1))
+    return s[k]
+
+async def _one(args, size, binary):
+    data = os.urandom(size)
+    with tempfile.TemporaryDirectory() as root:
+        t = SimTransport(root, mtu=args.mtu, interval_ms=args.interval,
+                         notify_queue=args.notify_queue, packets=args.packets,
+                         loss=args.loss, drop=args.drop, seed=args.seed)
+        async with Client(t, timeout=args.timeout) as c:
+            await c.ping()
+            dev = t.device
+            dev.heap_peak = 0
+            live = dev.heap_live()
+            stats = await c.put("bench.bin", data, window=args.window, binary=binary)
+            with open(os.path.join(root, "bench.bin"), "rb") as f:
+                if f.read() != data:
+                    raise SystemExit("[BENCH] file mismatch (%d B)" % size)
+            lat = [x * 1000 for x in stats.ack_latency]
+            return {
+                "size": size,
+                "mode": "bin" if binary else "text",
+                "rate": stats.rate,
+                "seconds": stats.seconds,
+                "chunks": stats.chunks,
+                "resent": stats.retransmits,
+                "ack_p50_ms": percentile(lat, 50),
+                "ack_p90_ms": percentile(lat, 90),
+                "ack_p99_ms": percentile(lat, 99),
+                "heap_peak": dev.heap_peak,
+                "heap_retained": dev.heap_live() - live,
+                "rx_peak": dev.rx_peak,
+                "txq_peak": dev.txq_peak,
+                "notify_peak": dev.radio.notify_peak,
+                "notify_full": dev.radio.notify_full,
+            }
+
+def _key(r):
+    return "%s/%d" % (r["mode"], r["size"])
+
+def _print(rows):
+    head = ("%-5s %8s %9s %7s %7s %7s %9s %9s %6s %6s %5s %5s" % (
+        "mode", "size", "KB/s", "p50ms", "p90ms", "p99ms", "heap_pk", "retained",
+        "rx_pk", "txq_pk", "ntf", "resnt"))
+    print(head)
+    print("-" * len(head))
+    for r in rows:
+        print("%-5s %8d %9.1f %7.1f %7.1f %7.1f %9d %9d %6d %6d %5d %5d" % (
+            r["mode"], r["size"], r["rate"] / 1024, r["ack_p50_ms"], r["ack_p90_ms"],
+            r["ack_p99_ms"], r["heap_peak"], r["heap_retained"], r["rx_peak"],
+            r["txq_peak"], r["notify_peak"], r["resent"]))
+
+def compare(rows, baseline, tolerance):
+    """Danh sách mô tả các chỉ số tệ hơn mốc quá `tolerance` (tỉ lệ)."""
+    base = {_key(r): r for r in baseline}
+    out = []
+    for r in rows:
+        b = base.get(_key(r))
+        if not b:
+            continue
+        for name, higher_better in _CHECKS:
+            old, new = b[name], r[name]
+            if not old:
+                continue
+            worse = (old - new) / old if higher_better else (new - old) / old
+            if worse > tolerance:
+                out.append("%s %s: %.1f -> %.1f (%+.0f%%)" % (
+                    _key(r), name, old, new, -worse * 100 if higher_better else worse * 100))
+    return out
+
+async def _run(args):
+    rows = []
+    for mode in args.modes.split(","):
+        for s in args.sizes.split(","):
+            rows.append(await _one(args, _size(s), mode == "bin"))
+    return rows
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="meblock.bench", description="BLE upload benchmark (simulated)")
+    p.add_argument("--sizes", default="1k,16k,64k,256k")
+    p.add_argument("--modes", default="bin,text", help="bin,text")
+    p.add_argument("-w", "--window", type=int, default=8)
+    p.add_argument("--mtu", type=int, default=247)
+    p.add_argument("--interval", type=float, default=7.5, help="connection interval ms (0: no limit)")
+    p.add_argument("--packets", type=int, default=6, help="packets per connection event")
+    p.add_argument("--notify-queue", type=int, default=8)
+    p.add_argument("--loss", type=float, default=0.0, help="link-layer packet loss (retransmitted)")
+    p.add_argument("--drop", type=float, default=0.0, help="probability a host write is lost")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--timeout", type=float, default=1.0)
+    p.add_argument("--json", action="store_true", help="print results as JSON")
+    p.add_argument("--save", metavar="FILE", help="write results to FILE")
+    p.add_argument("--baseline", metavar="FILE", help="compare with saved results")
+    p.add_argument("--tolerance", type=float, default=0.15, help="allowed regression (0.15 = 15%%)")
+    args = p.parse_args(argv)
+
+    tracemalloc.start()
+    try:
+        rows = asyncio.run(_run(args))
+    finally:
+        tracemalloc.stop()
+
+    if args.json:
+        print(json.dumps(rows, indent=1))
+    else:
+        _print(rows)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rows, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            bad = compare(rows, json.load(f), args.tolerance)
+        for line in bad:
+            print("[BENCH] REGRESSION", line)
+        if bad:
+            sys.exit(1)
+        print("[BENCH] OK vs", args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,673 @@
+# client.py — giao thức file của core/ble.py phía host (PING/LS/PUT/DATA/DONE/GET/RESET...)
+import asyncio
+import hashlib
+import struct
+import time
+import zlib
+from binascii import b2a_base64
+from itertools import accumulate
+
+from . import mpycross
+
+# khớp core/ble.py
+FRAME_HDR = 4
+FRAME_MAX = 1024
+FRAME_COPY = 0xFFFF # frame COPY (PUT ... DELTA): <0xFFFF><seq u16><offset u32><count u32>
+TLM_MARK = 0        # byte đầu của frame telemetry (core/telemetry.py)
+GET_MARK = 1        # byte đầu của frame GET: <0x01><len u16><seq u16><payload>
+GET_HDR = 5
+TERM_MARK = 2       # frame terminal hai chiều (core/blerepl.py): <0x02><len u8><byte...>
+TERM_MAX = 255
+# DONE BLOCKS=<crc>,...: CRC từng block cho tối đa chừng này block đầu (dòng DONE phải vừa vòng
+# RX của thiết bị); block lỗi -> ERR CRC BLOCK <i> <offset>, put() gửi lại từ offset đó
+DONE_BLOCKS = 112
+CRC_REWINDS = 3
+
+class ProtocolError(Exception):
+    """Thiết bị trả lời ERR ... hoặc trả lời không đúng giao thức."""
+
+class TransferStats:
+    def __init__(self, size):
+        self.size = size            # số byte cần gửi
+        self.sent = 0               # số byte thiết bị đã ACK
+        self.chunks = 0
+        self.retransmits = 0        # số chunk phải gửi lại (NAK/timeout)
+        self.ack_latency = []       # giây từ lúc gửi tới lúc được ACK (mỗi ACK một mẫu)
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        """Thông lượng (byte/s) tính trên phần đã được ACK."""
+        el = self.seconds or (time.monotonic() - self.started)
+        return self.sent / el if el > 0 else 0.0
+
+    def __str__(self):
+        return "%d B in %.2f s (%.1f KB/s, %d chunks, %d resent)" % (
+            self.sent, self.seconds, self.rate / 1024, self.chunks, self.retransmits)
+
+def deflate(data):
+    """
+    Bản nén zlib cho upload ENC=zlib, hoặc None nếu không nhỏ hơn. Cửa sổ 1 KB (wbits=10):
+    thiết bị cấp phát cửa sổ giải nén theo header zlib.
+    """
+    z = zlib.compressobj(9, zlib.DEFLATED, 10)
+    out = z.compress(data) + z.flush()
+    return out if len(out) < len(data) else None
+
+def _blocks_opt(reply, data):
+    # " BLOCKS=<crc>,..." theo BLOCK=<n> trong phản hồi PUT ("" nếu thiết bị không báo)
+    for o in reply.split():
+        if o.startswith("BLOCK="):
+            n = int(o[6:])
+            crcs = [zlib.crc32(data[i:i + n]) for i in range(0, min(len(data), DONE_BLOCKS * n), n)]
+            return " BLOCKS=" + ",".join("%08x" % c for c in crcs) if crcs else ""
+    return ""
+
+def delta_ops(data, block, crcs, old_size, chunk):
+    """
+    Các phần của `data` cho PUT ... DELTA theo CRC32 từng block của file cũ (hashes()):
+    block trùng (cùng CRC và độ dài, ở bất kỳ vị trí nào) -> (offset, count) để thiết bị
+    tự chép từ file cũ; phần còn lại -> bytes, tối đa `chunk` byte mỗi phần.
+    """
+    old = {}
+    for j, c in enumerate(crcs):
+        old.setdefault((c, min(block, old_size - j * block)), j * block)
+    out = []
+    mv = memoryview(data)
+    lit = 0     # đầu phần dữ liệu chưa khớp
+    for i in range(0, len(data), block):
+        part = mv[i:i + block]
+        off = old.get((zlib.crc32(part), len(part)))
+        if off is None:
+            continue
+        out += [mv[k:min(i, k + chunk)] for k in range(lit, i, chunk)]
+        out.append((off, len(part)))
+        lit = i + len(part)
+    out += [mv[k:k + chunk] for k in range(lit, len(data), chunk)]
+    return out
+
+def _plen(p):
+    # số byte của file mà một phần (bytes hoặc COPY (offset, count)) tạo ra
+    return p[1] if isinstance(p, tuple) else len(p)
+
+def _seq_abs(base, seq):
+    # seq trên dây là u16: quy về chỉ số tuyệt đối gần `base` nhất (không lùi)
+    return base + ((seq - base) & 0xFFFF)
+
+def decode_frame(frame):
+    """
+    Giải mã một frame telemetry (core/telemetry.py):
+    0x00 <len u8> <seq u8> <nsrc u8> <t0 u32> { <dt u16> <v i16>*nsrc }*
+    -> (seq, [(ticks_ms, (v, ...))]); giá trị -32768 (nguồn lỗi/None) thành None.
+    """
+    if len(frame) < 8 or frame[0] != TLM_MARK or frame[1] != len(frame) - 2:
+        raise ProtocolError("bad telemetry frame")
+    _, _, seq, nsrc, t0 = struct.unpack_from("<BBBBI", frame)
+    rec = struct.Struct("<H%dh" % nsrc)
+    out = []
+    for off in range(8, len(frame) - rec.size + 1, rec.size):
+        dt, *vals = rec.unpack_from(frame, off)
+        out.append(((t0 + dt) & 0xFFFFFFFF, tuple(None if v == -32768 else v for v in vals)))
+    return seq, out
+
+class Client:
+    """
+    Client bất đồng bộ cho dịch vụ file BLE. Dùng với mọi Transport:
+
+        async with Client(LoopbackTransport("dev")) as c:
+            await c.ping()
+            stats = await c.put("main.py", data, window=8)
+    """
+    def __init__(self, transport, timeout=5.0):
+        self.t = transport
+        self.timeout = timeout
+        self._buf = bytearray()
+        self._lines = asyncio.Queue()
+        self._frames = asyncio.Queue()      # frame telemetry (STREAM), xem core/telemetry.py
+        self._gets = asyncio.Queue()        # frame GET (đọc file)
+        self._tbuf = bytearray()            # byte terminal (REPL) chưa đọc
+        self._tev = asyncio.Event()
+        # mỗi dòng/frame ghi liền một mạch: frame terminal không được chen vào giữa dòng lệnh,
+        # và không gửi trong lúc thiết bị đang nhận frame upload BIN
+        self._wlock = asyncio.Lock()
+        self._text = asyncio.Event()
+        self._text.set()
+        transport.set_notify(self._on_notify)
+
+    async def __aenter__(self):
+        await self.t.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.t.close()
+
+    # ====== Dòng phản hồi ======
+    def _on_notify(self, data):
+        self._buf += data
+        while self._buf:
+            if self._buf[0] == TLM_MARK:
+                # frame telemetry: 0x00 <len> <len byte>
+                if len(self._buf) < 2 or len(self._buf) < 2 + self._buf[1]:
+                    break
+                n = 2 + self._buf[1]
+                self._frames.put_nowait(bytes(self._buf[:n]))
+                del self._buf[:n]
+                continue
+            if self._buf[0] == GET_MARK:
+                if len(self._buf) < GET_HDR:
+                    break
+                n = GET_HDR + (self._buf[1] | self._buf[2] << 8)
+                if len(self._buf) < n:
+                    break
+                self._gets.put_nowait(bytes(self._buf[:n]))
+                del self._buf[:n]
+                continue
+            if self._buf[0] == TERM_MARK:
+                if len(self._buf) < 2 or len(self._buf) < 2 + self._buf[1]:
+                    break
+                n = 2 + self._buf[1]
+                self._tbuf += self._buf[2:n]
+                self._tev.set()
+                del self._buf[:n]
+                continue
+            i = self._buf.find(b"\n")
+            if i < 0:
+                break
+            line = bytes(self._buf[:i]).decode("utf-8", "replace").strip()
+            del self._buf[:i + 1]
+            if line.startswith("OK STREAM"):
+                # frame đứng trước phản hồi này thuộc lần STREAM cũ
+                while not self._frames.empty():
+                    self._frames.get_nowait()
+            if line:
+                self._lines.put_nowait(line)
+
+    async def readline(self, timeout=None):
+        return await asyncio.wait_for(self._lines.get(), timeout or self.timeout)
+
+    async def _write(self, data):
+        async with self._wlock:
+            await self.t.write_stream(data)
+
+    async def send_line(self, text):
+        await self._write((text + "\n").encode())
+
+    async def command(self, text, timeout=None):
+        """Gửi một lệnh, trả về dòng phản hồi; ERR ... -> ProtocolError."""
+        await self.send_line(text)
+        line = await self.readline(timeout)
+        if line.startswith("ERR"):
+            raise ProtocolError(line)
+        return line
+
+    # ====== Lệnh đơn giản ======
+    async def ping(self):
+        return await self.command("PING")
+
+    async def ls(self, path=None, page=None):
+        """
+        [(name, "F"/"D", size)] của thư mục `path` (mặc định thư mục hiện tại của thiết bị).
+        Thiết bị trả từng trang (tối đa `page` mục, vừa hàng đợi TX); đọc hết mọi trang.
+        """
+        out = []
+        start = 0
+        while True:
+            await self.send_line("LS%s START=%d%s" % (" " + path if path else "", start,
+                                                      " N=%d" % page if page else ""))
+            while True:
+                line = await self.readline()
+                if line.startswith("ERR"):
+                    raise ProtocolError(line)
+                if line.startswith("LS "):
+                    break
+                kind, size, name = line.split(" ", 2)
+                out.append((name, kind, int(size)))
+            parts = line.split()
+            if parts[1] != "MORE":
+                return out
+            start = int(parts[2])
+
+    async def stat(self, name):
+        """("F"/"D", size) của `name`; không có -> ProtocolError."""
+        parts = (await self.command("STAT %s" % name)).split(" ", 3)
+        return parts[1], int(parts[2])
+
+    async def stats(self, reset=False):
+        """Bộ đếm của thiết bị (lệnh STATS) dạng dict; reset=True xóa sau khi đọc."""
+        line = await self.command("STATS RESET" if reset else "STATS")
+        return {k: int(v) for k, _, v in (x.partition("=") for x in line.split()[1:])}
+
+    async def logs(self, n=16):
+        """n sự kiện gần nhất trong vòng log của thiết bị: [(ticks_ms, text)]."""
+        count = int((await self.command("LOGS %d" % n)).split()[1])
+        out = []
+        for _ in range(count):
+            ts, _, text = (await self.readline()).partition(" ")
+            out.append((int(ts), text))
+        return out
+
+    async def reset(self):
+        return await self.command("RESET")
+
+    async def run(self, module=None, timeout=None):
+        """Chạy lại chương trình (mặc định main.py) không cần reset; trả về tên module."""
+        line = await self.command("RUN %s" % module if module else "RUN", timeout)
+        return line.split()[2]
+
+    async def stop(self):
+        """Dừng chương trình đang chạy; trả về tên module đã dừng hoặc None."""
+        name = (await self.command("STOP")).split()[2]
+        return None if name == "NONE" else name
+
+    async def stream(self, hz=10):
+        """Bật STREAM; trả về (tần số thật, [tên nguồn]). Đọc mẫu bằng samples()."""
+        parts = (await self.command("STREAM %d" % hz)).split()
+        return int(parts[2]), parts[3].split(",")
+
+    async def stream_off(self):
+        """Tắt STREAM; trả về (số mẫu đã lấy, số frame thiết bị bỏ). Bỏ qua frame còn bay."""
+        await self.send_line("STREAM OFF")
+        while True:
+            line = await self.readline()
+            if line.startswith("OK STREAM OFF"):
+                parts = line.split()
+                return int(parts[3]), int(parts[4])
+            if line.startswith("ERR"):
+                raise ProtocolError(line)
+
+    async def samples(self, timeout=None):
+        """Các mẫu của frame telemetry kế tiếp: [(ticks_ms, (giá trị...))], None = thiếu."""
+        frame = await asyncio.wait_for(self._frames.get(), timeout or self.timeout)
+        return decode_frame(frame)[1]
+
+    async def resume(self):
+        """(name, size, committed) của phiên upload dở trên thiết bị, hoặc None."""
+        parts = (await self.command("RESUME")).split()
+        if len(parts) != 4:
+            return None
+        return parts[1], int(parts[2]), int(parts[3])
+
+    async def hashes(self, name, block=None):
+        """(size, block, [crc32...]) của file đang có trên thiết bị (theo các trang HASH ... MORE)."""
+        crcs = []
+        start = 0
+        while True:
+            cmd = "HASH %s%s START=%d" % (name, " %d" % block if block else "", start)
+            # HASH <size> <block> <start> <crc>,<crc>... [MORE <start trang sau>]
+            parts = (await self.command(cmd)).split()
+            if int(parts[3]) != start:
+                raise ProtocolError(" ".join(parts))
+            if len(parts) > 4 and parts[4] != "MORE":
+                crcs += [int(x, 16) for x in parts[4].split(",")]
+            if parts[-2] != "MORE":
+                return int(parts[1]), int(parts[2]), crcs
+            start = int(parts[-1])
+
+    # ====== Đọc file ======
+    async def get(self, name, offset=0, length=None, window=8, progress=None):
+        """
+        Đọc file `name` (từ `offset`, tối đa `length` byte). Thiết bị gửi frame theo cửa sổ
+        trượt như upload, host ACK gộp mỗi nửa cửa sổ; hở/hết giờ -> NAK, thiết bị gửi lại
+        từ đó. Kiểm tra CRC32 ở cuối. progress(stats) được gọi mỗi frame.
+        """
+        while not self._gets.empty():
+            self._gets.get_nowait()     # frame sót lại của GET trước
+        cmd = "GET %s %d" % (name, offset)
+        if length is not None:
+            cmd += " %d" % length
+        parts = (await self.command(cmd + " WIN=%d" % window)).split()
+        # OK GET <name> <size> <offset> <len> WIN=<w> CHUNK=<c>
+        size = int(parts[5])
+        win = int(parts[6][4:])
+        ack_every = max(1, win // 2)
+        stats = TransferStats(size)
+        data = bytearray()
+        nxt = unacked = 0
+        nak = False
+        while len(data) < size:
+            try:
+                frame = await asyncio.wait_for(self._gets.get(), self.timeout)
+            except asyncio.TimeoutError:
+                if not self._lines.empty():
+                    raise ProtocolError(self._lines.get_nowait())   # ERR GET ... giữa chừng
+                # mất frame/ACK: xin gửi lại từ frame đang chờ
+                stats.retransmits += 1
+                await self.send_line("NAK %d" % (nxt & 0xFFFF))
+                continue
+            seq = frame[3] | frame[4] << 8
+            if seq != nxt & 0xFFFF:
+                if not nak and (seq - nxt) & 0xFFFF < 0x8000:
+                    # hở: báo một lần, bỏ các frame sau nó cho tới khi nhận lại
+                    nak = True
+                    stats.retransmits += 1
+                    await self.send_line("NAK %d" % (nxt & 0xFFFF))
+                continue
+            nak = False
+            data += frame[GET_HDR:]
+            nxt += 1
+            unacked += 1
+            stats.chunks += 1
+            stats.sent = len(data)
+            if unacked >= ack_every or len(data) >= size:
+                await self.send_line("ACK %d" % (nxt & 0xFFFF))
+                unacked = 0
+            if progress:
+                progress(stats)
+        line = await self.readline()
+        parts = line.split()
+        if parts[0] != "EOF" or int(parts[1]) != size:
+            raise ProtocolError(line)
+        if int(parts[2], 16) != zlib.crc32(data):
+            raise ProtocolError("CRC %s != %08x" % (parts[2], zlib.crc32(data)))
+        stats.seconds = time.monotonic() - stats.started
+        if progress:
+            progress(stats)
+        return bytes(data)
+
+    # ====== REPL (core/blerepl.py) ======
+    async def repl(self, on=True):
+        """Gắn (on=True) hoặc gỡ REPL của thiết bị khỏi kết nối BLE."""
+        if on:
+            self._tbuf.clear()
+            return await self.command("REPL")
+        return await self.command("REPL OFF")
+
+    async def term_write(self, data):
+        """Gửi byte vào stdin của REPL (nguyên dạng: Ctrl-C, Ctrl-A... đều được)."""
+        data = bytes(data)
+        for i in range(0, len(data), TERM_MAX):
+            part = data[i:i + TERM_MAX]
+            await self._text.wait()
+            await self._write(bytes((TERM_MARK, len(part))) + part)
+
+    async def term_read(self, timeout=None):
+        """Byte REPL đã nhận (chờ tối đa `timeout` giây cho byte đầu tiên); b"" nếu không có."""
+        if not self._tbuf:
+            self._tev.clear()
+            try:
+                await asyncio.wait_for(self._tev.wait(), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                return b""
+        out = bytes(self._tbuf)
+        self._tbuf.clear()
+        return out
+
+    async def _term_until(self, end, timeout=None, n=None):
+        # byte REPL tới hết `end` (hoặc đúng n byte); hết giờ -> TimeoutError
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        while True:
+            i = len(self._tbuf) - n if n is not None else self._tbuf.find(end)
+            if i >= 0:
+                k = n if n is not None else i + len(end)
+                out = bytes(self._tbuf[:k])
+                del self._tbuf[:k]
+                return out
+            self._tev.clear()
+            await asyncio.wait_for(self._tev.wait(), max(0.0, deadline - loop.time()))
+
+    async def exec(self, code, timeout=10.0):
+        """
+        Chạy đoạn mã nhiều dòng bằng raw-paste của MicroPython (như mpremote): ngắt chương
+        trình đang chạy (Ctrl-C), vào raw REPL, gửi mã theo cửa sổ thiết bị cấp, rồi về REPL
+        thường. Cần REPL ở tiền cảnh (xem core/blerepl.py). Trả về stdout; lỗi -> ProtocolError.
+        """
+        data = code.encode() if isinstance(code, str) else bytes(code)
+        await self.term_write(b"\r\x03\x03")
+        await asyncio.sleep(0.1)
+        self._tbuf.clear()
+        await self.term_write(b"\r\x01")
+        await self._term_until(b"raw REPL; CTRL-B to exit\r\n>")
+        await self.term_write(b"\x05A\x01")
+        r = await self._term_until(None, n=2)
+        if r == b"R\x01":
+            # raw-paste: thiết bị cấp cửa sổ `win` byte, mỗi 0x01 cấp thêm một cửa sổ
+            win = struct.unpack("<H", await self._term_until(None, n=2))[0]
+            remain = win
+            i = 0
+            aborted = False
+            while i < len(data) and not aborted:
+                while remain == 0 or self._tbuf:
+                    c = await self._term_until(None, timeout, n=1)
+                    if c == b"\x01":
+                        remain += win
+                    elif c == b"\x04":
+                        # thiết bị dừng nhận giữa chừng: xác nhận rồi đọc kết quả
+                        await self.term_write(b"\x04")
+                        aborted = True
+                        break
+                    else:
+                        raise ProtocolError("raw paste: unexpected %r" % c)
+                if not aborted:
+                    part = data[i:i + remain]
+                    await self.term_write(part)
+                    remain -= len(part)
+                    i += len(part)
+            if not aborted:
+                await self.term_write(b"\x04")
+                await self._term_until(b"\x04", timeout)
+        elif r == b"R\x00":
+            # firmware không có raw-paste: raw REPL thường
+            await self.term_write(data + b"\x04")
+            if await self._term_until(None, n=2) != b"OK":
+                raise ProtocolError("raw REPL: no OK")
+        else:
+            raise ProtocolError("raw REPL: unexpected %r" % r)
+        out = (await self._term_until(b"\x04", timeout))[:-1]
+        err = (await self._term_until(b"\x04", timeout))[:-1]
+        await self._term_until(b">")
+        await self.term_write(b"\x02")     # về REPL thường
+        if err:
+            raise ProtocolError(err.decode("utf-8", "replace").strip())
+        return out.decode("utf-8", "replace")
+
+    # ====== Upload ======
+    def chunk_size(self, binary=True):
+        """Payload mỗi chunk sao cho một frame/dòng DATA vừa một lần ghi GATT."""
+        room = self.t.max_write
+        if binary:
+            return max(16, min(FRAME_MAX, room - FRAME_HDR))
+        # "DATA <seq> " + base64 + "\n"
+        return max(12, (room - 13) // 4 * 3)
+
+    @staticmethod
+    def _frame(seq, payload, binary, windowed):
+        if isinstance(payload, tuple):
+            off, cnt = payload
+            if binary:
+                return struct.pack("<HHII", FRAME_COPY, seq & 0xFFFF, off, cnt)
+            if windowed:
+                return b"COPY %d %d %d\n" % (seq & 0xFFFF, off, cnt)
+            return b"COPY %d %d\n" % (off, cnt)
+        if binary:
+            return struct.pack("<HH", len(payload), seq & 0xFFFF) + payload
+        b64 = b2a_base64(payload, newline=False)
+        if windowed:
+            return b"DATA %d %s\n" % (seq & 0xFFFF, b64)
+        return b"DATA %s\n" % b64
+
+    def _header(self, op, name, data, window, binary, compress, extra=""):
+        # "PUT/FILE <name> <size> ..." và dữ liệu thật sự truyền (bản nén nếu nhỏ hơn)
+        raw = len(data)
+        packed = deflate(data) if compress else None
+        if packed is not None:
+            data = packed
+        cmd = "%s %s %d WIN=%d CRC=%08x%s" % (op, name, len(data), window, zlib.crc32(data), extra)
+        if packed is not None:
+            cmd += " ENC=zlib RAW=%d" % raw
+        if binary:
+            cmd += " BIN"
+        return cmd, data
+
+    async def put(self, name, data, window=8, binary=True, chunk=None, offset=0,
+                  sha256=False, progress=None, compress=False, delta=False):
+        """
+        Upload `data` thành file `name`, pipeline tối đa `window` chunk chưa ACK.
+        offset > 0: tiếp tục phiên dở (xem resume()). progress(stats) được gọi mỗi ACK.
+        compress=True: gửi bản nén deflate(data) (ENC=zlib) nếu nó nhỏ hơn, thiết bị giải nén
+        lúc DONE; khi đó offset, CRC và stats tính trên dữ liệu nén.
+        delta=True: so CRC từng block với file đang có (HASH), block không đổi được gửi bằng
+        COPY (PUT ... DELTA) thay vì gửi lại; không có block nào trùng -> upload thường.
+        DONE kèm CRC từng block: thiết bị báo block hỏng đầu tiên thì chỉ gửi lại từ block đó
+        (tối đa CRC_REWINDS lần). stats là của lượt gửi cuối.
+        """
+        chunk = chunk or self.chunk_size(binary)
+        parts = None
+        if delta:
+            try:
+                old, block, crcs = await self.hashes(name)
+            except ProtocolError:
+                old = 0     # chưa có file trên thiết bị
+            if old:
+                parts = delta_ops(data, block, crcs, old, chunk)
+                if not any(isinstance(p, tuple) for p in parts):
+                    parts = None
+        if parts is not None:
+            # DELTA không đi cùng ENC: COPY chép dữ liệu gốc của file cũ
+            cmd, data = self._header("PUT", name, data, window, binary, False, " DELTA")
+        else:
+            cmd, data = self._header("PUT", name, data, window, binary, compress)
+        if sha256:
+            cmd += " SHA256=" + hashlib.sha256(data).hexdigest()
+        rewinds = 0
+        while True:
+            stats, reply = await self._put_pass(cmd, data, parts, binary, chunk, offset, progress)
+            try:
+                reply = await self.command("DONE" + _blocks_opt(reply, data))
+            except ProtocolError as e:
+                # ERR CRC BLOCK <i> <offset>: thiết bị giữ phần trước block hỏng
+                err = str(e).split()
+                if err[:3] != ["ERR", "CRC", "BLOCK"] or rewinds >= CRC_REWINDS:
+                    raise
+                rewinds += 1
+                offset = int(err[4])
+                continue
+            if not reply.startswith("OK SAVED"):
+                raise ProtocolError(reply)
+            return stats
+
+    async def _put_pass(self, cmd, data, parts, binary, chunk, offset, progress):
+        # một lượt PUT (từ offset) tới hết dữ liệu, chưa DONE; trả về (stats, phản hồi PUT)
+        size = len(data)
+        if offset:
+            cmd += " OFFSET=%d" % offset
+        if binary:
+            self._text.clear()      # thiết bị đọc frame BIN tới khi đủ dữ liệu: giữ terminal lại
+        try:
+            reply = await self.command(cmd)
+            if parts is None:
+                mv = memoryview(data)
+                payloads = [mv[i:i + chunk] for i in range(offset, size, chunk)]
+            else:
+                # resume DELTA: bỏ các phần đã ghi, cắt phần chứa `offset`
+                payloads = []
+                pos = 0
+                for p in parts:
+                    n = _plen(p)
+                    k = offset - pos
+                    if k <= 0:
+                        payloads.append(p)
+                    elif k < n:
+                        payloads.append((p[0] + k, n - k) if isinstance(p, tuple) else p[k:])
+                    pos += n
+            return await self._stream(payloads, reply, progress), reply
+        finally:
+            self._text.set()
+
+    async def bundle(self, files, window=8, binary=True, chunk=None, progress=None,
+                     compress=False):
+        """
+        Upload nhiều file [(name, data)] trong một phiên BUNDLE: thiết bị chỉ thay các file
+        đích khi mọi file đã đủ và đúng CRC, lỗi ở bất kỳ file nào -> không file nào đổi.
+        File trong BUNDLE không resume được. Trả về [TransferStats] theo thứ tự files.
+        """
+        await self.command("BUNDLE %d" % len(files))
+        chunk = chunk or self.chunk_size(binary)
+        out = []
+        seq = 0         # số thứ tự chunk chạy tiếp qua các file của phiên
+        for name, data in files:
+            cmd, data = self._header("FILE", name, data, window, binary, compress)
+            if binary:
+                self._text.clear()
+            try:
+                reply = await self.command(cmd)
+                mv = memoryview(data)
+                payloads = [mv[i:i + chunk] for i in range(0, len(data), chunk)]
+                out.append(await self._stream(payloads, reply, progress, seq))
+            finally:
+                self._text.set()
+            seq += len(payloads)
+        reply = await self.command("DONE")
+        if not reply.startswith("OK SAVED"):
+            raise ProtocolError(reply)
+        return out
+
+    async def put_module(self, name, data, code=None, **kw):
+        """
+        Upload module `name` (.py) dạng bytecode `code` (mặc định mpycross.compile(data, name))
+        vào __mpy__/ của thiết bị; thiết bị từ chối bytecode (sai phiên bản MicroPython, module
+        trong gói) thì upload mã nguồn `data`. kw như put(). Trả về (tên đã ghi, TransferStats).
+        """
+        if code is None:
+            code = mpycross.compile(data, name)
+        target = mpycross.cached(name)
+        try:
+            return target, await self.put(target, code, **kw)
+        except ProtocolError as e:
+            if "mpy" not in str(e):
+                raise
+        kw.pop("offset", None)
+        return name, await self.put(name, data, **kw)
+
+    async def _stream(self, payloads, reply, progress=None, first=0):
+        # Gửi các chunk theo cửa sổ trượt; ACK gộp, NAK -> gửi lại từ chỗ hở (go-back-N).
+        # first: seq của chunk đầu tiên (BUNDLE đánh số liên tục qua các file)
+        opts = reply.split()
+        binary = "BIN" in opts
+        granted = 0
+        for o in opts:
+            if o.startswith("WIN="):
+                granted = int(o[4:])
+        win = max(1, granted)
+        ends = [0] + list(accumulate(_plen(p) for p in payloads))
+        stats = TransferStats(ends[-1])
+        n = len(payloads)
+        sent_at = [0.0] * n
+        base = nxt = 0
+        while base < n:
+            while nxt < n and nxt - base < win:
+                await self._write(self._frame(first + nxt, payloads[nxt], binary, granted))
+                sent_at[nxt] = time.monotonic()
+                stats.chunks += 1
+                nxt += 1
+            try:
+                line = await self.readline()
+            except asyncio.TimeoutError:
+                # mất ACK/khung: gửi lại toàn bộ phần chưa ACK
+                stats.retransmits += nxt - base
+                nxt = base
+                continue
+            parts = line.split()
+            prev = base
+            if parts[0] == "ACK" and granted:
+                acked = _seq_abs(first + base, int(parts[1])) - first
+                if acked <= nxt:
+                    base = acked
+            elif parts[0] == "NAK" and granted:
+                gap = _seq_abs(first + base, int(parts[1])) - first
+                if base <= gap < nxt:
+                    stats.retransmits += nxt - gap
+                    nxt = gap
+                    base = gap
+            elif parts[0] == "OK" and not granted:
+                base += 1
+            else:
+                raise ProtocolError(line)
+            if base > prev:
+                stats.ack_latency.append(time.monotonic() - sent_at[base - 1])
+            stats.sent = ends[base]
+            if progress:
+                progress(stats)
+        stats.seconds = time.monotonic() - stats.started
+        return stats
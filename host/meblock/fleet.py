@@ -0,0 +1,279 @@
+# python -m meblock.fleet — nạp cùng một bộ file cho nhiều thiết bị cùng lúc
+#   python -m meblock.fleet -n MEBLOCK main.py setting.py     (quét BLE: NUS + tên bắt đầu bằng MEBLOCK)
+#   python -m meblock.fleet -a AA:BB:.. -a CC:DD:.. main.py
+#   python -m meblock.fleet --sim ./lab:8 main.py --run       (8 thiết bị giả lập trong ./lab/dev0..7)
+#
+# Mỗi thiết bị một Client riêng, tối đa -j thiết bị cùng lúc. Nhiều file đi chung một phiên
+# BUNDLE: thiết bị chỉ thay file khi đã nhận đủ cả bộ, không bao giờ còn lẫn file cũ và mới.
+# Lỗi (mất kết nối, timeout, ERR) -> kết nối lại; một file thì tiếp tục bằng RESUME, BUNDLE
+# (không resume được) thì gửi lại cả bộ.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from . import mpycross
+from .client import Client, ProtocolError, deflate
+from .transport import NUS_SERVICE, BleakTransport, SimTransport
+
+# ====== Tìm thiết bị ======
+def _uuid_str(b):
+    # UUID 128-bit trong dữ liệu quảng bá là little-endian
+    h = bytes(b)[::-1].hex()
+    return "%s-%s-%s-%s-%s" % (h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+def ad_fields(*payloads):
+    """(local_name, [service UUID]) từ payload quảng bá/scan response (như bleuart._adv_payload)."""
+    name, services = None, []
+    for p in payloads:
+        p = bytes(p or b"")
+        i = 0
+        while i + 1 < len(p):
+            n, kind = p[i], p[i + 1]
+            value = p[i + 2:i + 1 + n]
+            if kind in (0x08, 0x09):
+                name = value.decode("utf-8", "replace")
+            elif kind in (0x06, 0x07):
+                services += [_uuid_str(value[k:k + 16]) for k in range(0, len(value) - 15, 16)]
+            elif kind in (0x02, 0x03):
+                services += ["0000%04x-0000-1000-8000-00805f9b34fb" % int.from_bytes(value[k:k + 2], "little")
+                             for k in range(0, len(value) - 1, 2)]
+            i += 1 + n
+    return name, services
+
+def match(name, local_name, services):
+    """Thiết bị MEBLOCK: có NUS và tên (nếu lọc) bắt đầu bằng `name`."""
+    if NUS_SERVICE not in [s.lower() for s in services]:
+        return False
+    return not name or (local_name or "").startswith(name)
+
+async def discover(name=None, timeout=5.0):
+    """Quét BLE, trả về [(nhãn, BleakTransport)] cho mọi thiết bị khớp match()."""
+    from bleak import BleakScanner
+    found = await BleakScanner.discover(timeout=timeout, return_adv=True)
+    out = []
+    for dev, adv in found.values():
+        if match(name, adv.local_name or dev.name, adv.service_uuids):
+            label = "%s %s" % (adv.local_name or dev.name or "?", dev.address)
+            out.append((label, BleakTransport(address=dev)))
+    return sorted(out, key=lambda x: x[0])
+
+def discover_sim(transports, name=None):
+    """Như discover() nhưng đọc dữ liệu quảng bá từ bộ điều khiển của các SimTransport."""
+    out = []
+    for t in transports:
+        adv = t.device.radio.advertising if t.device.radio else None
+        if adv and match(name, *ad_fields(adv[1], adv[2])):
+            out.append((os.path.basename(t.device.root), t))
+    return out
+
+# ====== Nạp ======
+class DeviceResult:
+    """Kết quả nạp của một thiết bị."""
+    def __init__(self, label):
+        self.label = label
+        self.ok = False
+        self.active = False
+        self.attempts = 0
+        self.files = 0          # số file đã nạp xong
+        self.sent = 0           # byte đã được ACK (mọi lần thử)
+        self.partial = 0        # byte đã ACK của file đang gửi
+        self.resumed = 0        # byte không phải gửi lại nhờ RESUME
+        self.retransmits = 0
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def rate(self):
+        return self.sent / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        if self.ok:
+            return "%d files, %d B in %.2f s (%.1f KB/s, %d attempts, %d B resumed)" % (
+                self.files, self.sent, self.seconds, self.rate / 1024, self.attempts, self.resumed)
+        return "FAILED after %d attempts (%d files): %s" % (self.attempts, self.files, self.error)
+
+async def _bundle(c, files, res, opts):
+    # cả bộ file trong một phiên BUNDLE; thiết bị từ chối bytecode -> gửi lại cả bộ bằng mã nguồn
+    sent = {}
+
+    def progress(stats):
+        sent[id(stats)] = stats.sent
+        res.partial = sum(sent.values())
+    kw = dict(window=opts.get("window", 8), binary=opts.get("binary", True), progress=progress,
+              compress=opts.get("compress", False))
+    mpy = [(mpycross.cached(f[0]), f[2]) if len(f) > 2 and f[2] is not None else f[:2]
+           for f in files]
+    try:
+        stats = await c.bundle(mpy, **kw)
+    except ProtocolError as e:
+        if "mpy" not in str(e) or all(len(f) < 3 or f[2] is None for f in files):
+            raise
+        res.sent += res.partial
+        res.partial = 0
+        sent.clear()
+        stats = await c.bundle([f[:2] for f in files], **kw)
+    res.sent += sum(s.sent for s in stats)
+    res.partial = 0
+    res.retransmits += sum(s.retransmits for s in stats)
+    res.files = len(files)
+
+async def _program(label, t, files, res, sem, opts):
+    async with sem:
+        res.active = True
+        started = time.monotonic()
+        while not res.ok:
+            res.attempts += 1
+            try:
+                async with Client(t, timeout=opts.get("timeout", 5.0)) as c:
+                    if len(files) > 1 and res.files < len(files):
+                        await _bundle(c, files, res, opts)
+                    while res.files < len(files):
+                        name, data, *code = files[res.files]
+                        code = code[0] if code else None
+                        offset = 0
+                        st = await c.resume()
+                        target, body = ((mpycross.cached(name), code) if code is not None
+                                        else (name, data))
+                        size = len((opts.get("compress") and deflate(body)) or body)
+                        if st and st[0] == target and st[1] == size:
+                            offset = st[2]
+                            res.resumed += offset
+
+                        def progress(stats):
+                            res.partial = stats.sent
+                        kw = dict(window=opts.get("window", 8), binary=opts.get("binary", True),
+                                  offset=offset, progress=progress,
+                                  compress=opts.get("compress", False))
+                        if code is not None:
+                            stats = (await c.put_module(name, data, code, **kw))[1]
+                        else:
+                            stats = await c.put(name, data, **kw)
+                        res.sent += stats.sent
+                        res.partial = 0
+                        res.retransmits += stats.retransmits
+                        res.files += 1
+                    if opts.get("run"):
+                        await c.run()
+                res.ok = True
+                res.error = None
+            except Exception as e:
+                # mất kết nối/timeout/ERR/lỗi của bleak: phần đã ACK của file dở còn trên thiết bị
+                # (RESUME), BUNDLE dở bị bỏ
+                res.sent += res.partial
+                res.partial = 0
+                res.error = "%s %s" % (type(e).__name__, e)
+                if res.attempts > opts.get("retries", 3):
+                    break
+                await asyncio.sleep(opts.get("backoff", 0.5) * res.attempts)
+        res.seconds = time.monotonic() - started
+        res.active = False
+    return res
+
+async def program(targets, files, concurrency=4, progress=None, interval=0.5, **opts):
+    """
+    Nạp `files` ([(tên trên thiết bị, bytes[, bytecode])]) cho mọi `targets`
+    ([(nhãn, Transport)]); có bytecode thì gửi nó vào __mpy__/ (Client.put_module),
+    nhiều file thì gửi chung một BUNDLE (Client.bundle), tối đa `concurrency` thiết bị cùng lúc. opts: window, binary, timeout, retries,
+    backoff, run, compress. progress(results, seconds) được gọi mỗi `interval` giây.
+    Trả về [DeviceResult] theo thứ tự targets.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    results = [DeviceResult(label) for label, _ in targets]
+    jobs = asyncio.gather(*(_program(label, t, files, res, sem, opts)
+                            for (label, t), res in zip(targets, results)))
+    started = time.monotonic()
+    while progress and not jobs.done():
+        await asyncio.wait((jobs,), timeout=interval)
+        progress(results, time.monotonic() - started)
+    await jobs
+    return results
+
+def summary(results, seconds):
+    """Các dòng tổng kết: từng thiết bị rồi tổng thông lượng."""
+    out = ["%-24s %s" % (r.label, r) for r in results]
+    ok = sum(r.ok for r in results)
+    total = sum(r.sent for r in results)
+    out.append("[FLEET] %d/%d ok, %d B in %.2f s, aggregate %.1f KB/s" % (
+        ok, len(results), total, seconds, total / seconds / 1024 if seconds else 0.0))
+    return out
+
+def _progress(results, seconds):
+    done = sum(r.ok for r in results)
+    failed = sum(not r.ok and not r.active and r.attempts > 0 for r in results)
+    active = sum(r.active for r in results)
+    total = sum(r.sent + r.partial for r in results)
+    sys.stdout.write("\r[FLEET] %d/%d done  %d active  %d failed  %.1f KB/s " % (
+        done, len(results), active, failed, total / seconds / 1024 if seconds else 0.0))
+    sys.stdout.flush()
+
+def _files(specs, mpy=False, mpy_cross=None, march=None):
+    # "local" hoặc "local:remote"; mpy: biên dịch các file .py một lần cho mọi thiết bị
+    out = []
+    for spec in specs:
+        local, _, remote = spec.partition(":")
+        remote = remote or os.path.basename(local)
+        with open(local, "rb") as f:
+            data = f.read()
+        code = None
+        if mpy and remote.endswith(".py"):
+            code = mpycross.compile(data, remote, mpy_cross, march)
+        out.append((remote, data, code))
+    return out
+
+async def _run(args, files):
+    if args.sim:
+        root, _, count = args.sim.rpartition(":")
+        if not root:
+            root, count = count, "1"
+        sims = [SimTransport(os.path.join(root, "dev%d" % i), mtu=args.mtu)
+                for i in range(int(count))]
+        targets = discover_sim(sims, args.name)
+    elif args.address:
+        targets = [(a, BleakTransport(address=a)) for a in args.address]
+    else:
+        print("[FLEET] scanning %.0f s for %s ..." % (args.scan, args.name or "NUS devices"))
+        targets = await discover(args.name, args.scan)
+    if not targets:
+        raise SystemExit("[FLEET] no devices found")
+    print("[FLEET] %d devices, %d files, %d at a time" % (len(targets), len(files), args.jobs))
+    started = time.monotonic()
+    results = await program(targets, files, concurrency=args.jobs, progress=_progress,
+                            window=args.window, binary=not args.text, timeout=args.timeout,
+                            retries=args.retries, run=args.run, compress=args.zlib)
+    print()
+    for line in summary(results, time.monotonic() - started):
+        print(line)
+    return all(r.ok for r in results)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="meblock.fleet",
+                                description="Upload the same files to many MEBLOCK boards")
+    p.add_argument("files", nargs="+", metavar="LOCAL[:REMOTE]")
+    g = p.add_argument_group("devices")
+    g.add_argument("-n", "--name", help="only names starting with NAME (BLE_NAME in setting.py)")
+    g.add_argument("-a", "--address", action="append", help="BLE address (repeat; skips scanning)")
+    g.add_argument("--sim", metavar="DIR[:N]", help="N simulated devices in DIR/dev0..N-1")
+    g.add_argument("--scan", type=float, default=5.0, help="scan time in seconds")
+    g.add_argument("--mtu", type=int, default=247, help="sim MTU (default 247)")
+    p.add_argument("-j", "--jobs", type=int, default=4, help="devices programmed at once")
+    p.add_argument("--retries", type=int, default=3, help="reconnects per device before giving up")
+    p.add_argument("-w", "--window", type=int, default=8, help="chunks in flight (default 8)")
+    p.add_argument("--text", action="store_true", help="base64 DATA lines instead of binary frames")
+    p.add_argument("--timeout", type=float, default=5.0)
+    p.add_argument("--run", action="store_true", help="RUN main.py on each device afterwards")
+    p.add_argument("--zlib", action="store_true", help="send zlib-compressed when that is smaller")
+    p.add_argument("--mpy", action="store_true", help="send .py files as mpy-cross bytecode")
+    p.add_argument("--march", help="mpy-cross -march (only for native/viper code)")
+    p.add_argument("--mpy-cross", metavar="PATH", help="mpy-cross binary")
+    args = p.parse_args(argv)
+    try:
+        files = _files(args.files, args.mpy, args.mpy_cross, args.march)
+    except mpycross.CompileError as e:
+        raise SystemExit("[ERR] %s" % e)
+    if not asyncio.run(_run(args, files)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# mpycross.py — biên dịch module .py thành bytecode .mpy bằng mpy-cross trước khi upload
+# Thiết bị (core/bytecache.py) ưu tiên bytecode trong __mpy__/ hơn mã nguồn cùng tên.
+# mpy-cross: tham số `mpy_cross`, biến môi trường MPY_CROSS, lệnh mpy-cross trong PATH,
+# hoặc gói pip "mpy-cross" (python -m mpy_cross); phiên bản nên khớp MicroPython trên chip.
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+CACHE = "__mpy__"   # khớp core/bytecache.py
+
+class CompileError(Exception):
+    """mpy-cross không chạy được hoặc báo lỗi (vd SyntaxError trong mã nguồn)."""
+
+def cached(name):
+    """Tên bytecode trên thiết bị của module `name`: "lib/x.py" -> "__mpy__/lib/x.mpy"."""
+    return "%s/%s.mpy" % (CACHE, name.lstrip("/")[:-3])
+
+def command(mpy_cross=None):
+    """Lệnh chạy mpy-cross (list cho subprocess)."""
+    path = mpy_cross or os.environ.get("MPY_CROSS") or shutil.which("mpy-cross")
+    return [path] if path else [sys.executable, "-m", "mpy_cross"]
+
+def compile(data, name, mpy_cross=None, march=None, opt=None):
+    """
+    Bytecode của mã nguồn `data` (bytes). `name` là tên file trong traceback trên thiết bị;
+    march (vd "xtensawin" cho ESP32) chỉ cần khi module có @micropython.native/viper.
+    """
+    with tempfile.TemporaryDirectory() as d:
+        src = os.path.join(d, "src.py")
+        out = os.path.join(d, "out.mpy")
+        with open(src, "wb") as f:
+            f.write(data)
+        cmd = command(mpy_cross) + ["-s", name.lstrip("/"), "-o", out]
+        if march:
+            cmd.append("-march=" + march)
+        if opt is not None:
+            cmd.append("-O%d" % opt)
+        cmd.append(src)
+        try:
+            r = subprocess.run(cmd, capture_output=True)
+        except OSError as e:
+            raise CompileError("%s: %s" % (cmd[0], e))
+        if r.returncode or not os.path.exists(out):
+            msg = (r.stderr or r.stdout).decode("utf-8", "replace").strip()
+            raise CompileError(msg.replace(src, name) or "mpy-cross exit %d" % r.returncode)
+        with open(out, "rb") as f:
+            return f.read()
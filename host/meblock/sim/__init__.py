@@ -0,0 +1,70 @@
+# sim — chạy mã firmware trong core/ bằng CPython, dùng các module thay thế trong mpy/
+import os
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+MPY_DIR = os.path.join(_HERE, "mpy")
+CORE_DIR = os.path.normpath(os.path.join(_HERE, "..", "..", "..", "core"))
+
+# module firmware được nạp lại riêng cho từng thiết bị giả lập
+CORE_MODULES = ("boot", "ble", "bleuart", "upload", "setting", "utility", "blerepl", "runner",
+                "telemetry", "bytecache")
+
+def _patch_time():
+    # các hàm time.* riêng của MicroPython
+    if hasattr(time, "ticks_ms"):
+        return
+    time.ticks_ms = lambda: time.monotonic_ns() // 1000000 & 0x3FFFFFFF
+    time.ticks_us = lambda: time.monotonic_ns() // 1000 & 0x3FFFFFFF
+    time.ticks_add = lambda t, d: (t + d) & 0x3FFFFFFF
+    time.ticks_diff = lambda a, b: ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+def install(core_dir=CORE_DIR):
+    """Thêm module thay thế (machine, bluetooth, ...) và core/ vào sys.path."""
+    _patch_time()
+    for p in (core_dir, MPY_DIR):
+        if p not in sys.path:
+            sys.path.insert(0, p)
+
+def _serve_on_host(first=None):
+    pass
+
+def load_core(core_dir=CORE_DIR, entry="ble", nvs=None, modules=None, settings=None):
+    """
+    Import mới toàn bộ module firmware và trả về module `entry` ("ble", hoặc
+    "boot" để chạy cả trình tự khởi động). Mỗi lần gọi cho một bản độc lập
+    (biến toàn cục riêng, NVS riêng `nvs`), nên nhiều thiết bị có thể cùng chạy.
+    `modules` (dict) nhận các module firmware vừa nạp; `settings` (dict) thay các
+    giá trị của setting.py (vd {"APP_RUNNER": True}).
+    """
+    install(core_dir)
+    import esp32
+    esp32.bind({} if nvs is None else nvs)
+    saved = {}
+    for m in CORE_MODULES:
+        if m in sys.modules:
+            saved[m] = sys.modules.pop(m)
+    try:
+        if settings:
+            setting = __import__("setting")
+            for k, v in settings.items():
+                setattr(setting, k, v)
+        if entry == "boot" and getattr(__import__("setting"), "APP_RUNNER", False):
+            # boot.py kết thúc bằng runner.serve() (vòng lặp asyncio không trả về trên chip);
+            # ở đây host chạy runner.supervisor() trong vòng lặp của nó (SimTransport)
+            try:
+                __import__("runner").serve = _serve_on_host
+            except Exception:
+                pass    # boot.py tự báo lỗi import runner như trên chip
+        return __import__(entry)
+    finally:
+        for m in CORE_MODULES:
+            mod = sys.modules.pop(m, None)
+            if mod is not None and modules is not None:
+                modules[m] = mod
+        sys.modules.update(saved)
+
+from .device import Device  # noqa: E402
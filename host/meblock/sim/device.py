@@ -0,0 +1,183 @@
+# device.py — một ESP32 giả lập: chạy boot.py thật trên bộ điều khiển BLE giả lập
+import contextlib
+import importlib
+import io
+import os
+import sys
+import tracemalloc
+
+from . import CORE_DIR, install, load_core
+
+install()
+import bluetooth        # noqa: E402  (bản thay thế trong sim/mpy)
+import esp32            # noqa: E402
+import machine          # noqa: E402
+import micropython      # noqa: E402
+
+class Device:
+    """
+    Thiết bị giả lập: `root` là filesystem, NVS/Timer/hàng đợi schedule riêng.
+    boot.py được chạy như trên chip (DRD, khởi động BLE), sau đó trình giả lập
+    gọi tick() mỗi connection event. `link` chuyển cho bluetooth.configure();
+    `settings` thay giá trị của setting.py (xem load_core).
+
+    Với APP_RUNNER, `runner` là module runner của thiết bị: host chạy
+    runner.supervisor() trong vòng lặp asyncio của mình (xem SimTransport).
+    Việc nạp/dọn chương trình diễn ra trong ngữ cảnh thiết bị, nhưng các bước
+    của chương trình thì không (cwd/stdout của host).
+
+    Khi chạy với tracemalloc, mỗi lần firmware xử lý (call) ghi lại mức cấp phát
+    tạm cao nhất (heap_peak); heap_live() là bộ nhớ mã firmware đang giữ.
+    """
+    def __init__(self, root, core_dir=CORE_DIR, quiet=True, settings=None, **link):
+        self.root = os.path.abspath(root)
+        self.settings = settings
+        os.makedirs(self.root, exist_ok=True)
+        self.core_dir = core_dir
+        self.link = link
+        self.nvs = {}
+        self.log = io.StringIO() if quiet else None
+        self._timers = []
+        self._sched = []
+        self.boots = 0
+        self.resets = 0
+        self.boot()
+
+    # ====== Ngữ cảnh thiết bị ======
+    def call(self, fn, *args):
+        """Chạy fn trong ngữ cảnh thiết bị (cwd, NVS, timer, schedule, stdout)."""
+        saved = (os.getcwd(), micropython._queue, machine._timers)
+        os.chdir(self.root)
+        micropython._queue = self._sched
+        machine._timers = self._timers
+        esp32.bind(self.nvs)
+        out = contextlib.redirect_stdout(self.log) if self.log else contextlib.nullcontext()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        try:
+            with out:
+                return fn(*args)
+        except machine.DeviceReset:
+            self.resets += 1
+            self._reboot()
+        finally:
+            if tracing:
+                cur, peak = tracemalloc.get_traced_memory()
+                self.heap_peak = max(self.heap_peak, peak - base)
+            os.chdir(saved[0])
+            micropython._queue = saved[1]
+            machine._timers = saved[2]
+
+    def heap_live(self):
+        """Số byte (tracemalloc) còn được giữ bởi cấp phát trong core/."""
+        snap = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(True, os.path.join(self.core_dir, "*")),))
+        return sum(s.size for s in snap.statistics("filename"))
+
+    def boot(self):
+        """Khởi động lạnh: nạp lại firmware, chạy boot.py (NVS và file được giữ)."""
+        self._timers.clear()
+        self._sched.clear()
+        self.rx_peak = 0
+        self.txq_peak = 0
+        self.heap_peak = 0
+        bluetooth.configure(**self.link)
+        bluetooth.last = None
+        self.modules = {}
+        self.boot_mod = self.call(load_core, self.core_dir, "boot", self.nvs, self.modules,
+                                  self.settings)
+        self.boots += 1
+        self.radio = bluetooth.last
+        self.ble = getattr(self.boot_mod, "ble_o", None)
+        if self.ble is not None and self.ble.uart is not None:
+            self._probe()
+        self.runner = getattr(self.boot_mod, "runner", None)
+        if self.runner is not None:
+            r = self.runner
+            load, unload = r._load, r._unload
+            r._load = lambda name: self._app_call(load, name)
+            r._unload = lambda: self._app_call(unload)
+
+    def _app_call(self, fn, *args):
+        # chương trình nằm trong root và thấy các module firmware của chính thiết bị này
+        path = sys.path[:]
+        sys.path[:] = [self.root] + [p for p in path if p != self.core_dir]
+        prev = {k: sys.modules.get(k) for k in self.modules}
+        sys.modules.update(self.modules)
+        importlib.invalidate_caches()
+        try:
+            return self.call(fn, *args)
+        finally:
+            sys.path[:] = path
+            for k, v in prev.items():
+                if v is None:
+                    sys.modules.pop(k, None)
+                else:
+                    sys.modules[k] = v
+
+    def _reboot(self):
+        old = self.radio
+        if old is not None and old.conn is not None:
+            # gói đã vào controller coi như kịp phát trước khi chip reset
+            while old._down:
+                old.event()
+            central = old.central
+            old.conn = None
+            if central:
+                central(None, None)     # báo host: mất kết nối
+        self.boot()
+
+    def _probe(self):
+        # đo mức đầy cao nhất của vòng đệm RX (BLEMain) và hàng đợi TX (BLEUART)
+        b, u = self.ble, self.ble.uart
+        rx_write, send = b._rx_write, u.send
+
+        def _rx_write(data):
+            ok = rx_write(data)
+            n = b._rx_used()
+            if n > self.rx_peak:
+                self.rx_peak = n
+            return ok
+
+        def _send(data):
+            n = send(data)
+            n = u._tx_used()
+            if n > self.txq_peak:
+                self.txq_peak = n
+            return n
+
+        b._rx_write = _rx_write
+        u.send = _send
+
+    # ====== Điều khiển liên kết ======
+    def connect(self, central, mtu=247):
+        """Host kết nối; central(handle, data) nhận notify (None, None khi mất kết nối)."""
+        if self.radio is None:
+            raise OSError("BLE not started on device")
+        return self.call(self.radio.connect, central, mtu)
+
+    def disconnect(self):
+        if self.radio is not None:
+            self.call(self.radio.disconnect)
+
+    def handle(self, uuid):
+        return self.radio.handle(bluetooth.UUID(uuid))
+
+    def write(self, handle, data):
+        self.radio.write(handle, data)
+
+    def pending(self):
+        return self.radio.pending() if self.radio else 0
+
+    def tick(self):
+        """Một connection event, rồi các việc đã schedule và timer đến hạn."""
+        self.call(self._tick)
+
+    def _tick(self):
+        if self.radio is not None:
+            self.radio.event()
+        micropython.run_scheduled()
+        machine.run_timers()
+        micropython.run_scheduled()
@@ -0,0 +1,223 @@
+# bluetooth.py — bộ điều khiển BLE giả lập cho CPython (phía peripheral như MicroPython,
+# kèm các hàm phía central để trình giả lập điều khiển liên kết)
+import random
+from collections import deque
+
+FLAG_READ = 0x0002
+FLAG_WRITE_NO_RESPONSE = 0x0004
+FLAG_WRITE = 0x0008
+FLAG_NOTIFY = 0x0010
+
+_IRQ_CENTRAL_CONNECT = 1
+_IRQ_CENTRAL_DISCONNECT = 2
+_IRQ_GATTS_WRITE = 3
+_IRQ_MTU_EXCHANGED = 21
+
+_ENOMEM = 12
+_CONN_HANDLE = 64       # NimBLE trên ESP32 đánh số kết nối từ 64
+
+class UUID:
+    def __init__(self, value):
+        if isinstance(value, int):
+            self._b = value.to_bytes(2, "little")
+        else:
+            self._b = bytes.fromhex(value.replace("-", ""))[::-1]
+
+    def __bytes__(self):
+        return self._b
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self._b == other._b
+
+    def __hash__(self):
+        return hash(self._b)
+
+# Tham số liên kết cho BLE() tạo ra tiếp theo (firmware gọi BLE() không đối số)
+_config = {}
+last = None             # controller được tạo gần nhất
+
+def configure(**kw):
+    """
+    Đặt tham số cho controller kế tiếp:
+      notify_queue: số notify controller giữ được (đầy -> OSError ENOMEM)
+      packets:      số gói mỗi chiều trong một connection event
+      loss:         xác suất mất một gói trên không trung (link layer gửi lại
+                    ở slot sau, nên chỉ tốn băng thông, dữ liệu không mất)
+      drop:         xác suất cả một lần ghi của host bị mất hẳn (thử NAK/timeout)
+      seed:         hạt giống ngẫu nhiên để kết quả lặp lại được
+    """
+    _config.clear()
+    _config.update(kw)
+
+class BLE:
+    def __init__(self):
+        global last
+        last = self
+        cfg = _config
+        self.notify_queue = cfg.get("notify_queue", 8)
+        self.packets = cfg.get("packets", 6)
+        self.loss = cfg.get("loss", 0.0)
+        self.drop = cfg.get("drop", 0.0)
+        self._rand = random.Random(cfg.get("seed"))
+        self._active = False
+        self._irq = None
+        self._mtu_pref = 23
+        self._next_handle = 1
+        self._values = {}           # handle -> giá trị hiện tại
+        self._uuids = {}            # bytes(uuid) -> handle của đặc tính
+        self.conn = None
+        self.mtu = 23
+        self.advertising = None
+        self._down = deque()        # notify chờ phát
+        self._up = deque()          # lần ghi của host chờ phát
+        self.central = None         # nhận (handle, bytes) cho mỗi notify tới host
+        # thống kê
+        self.notifies = 0
+        self.notify_full = 0        # số lần gatts_notify báo ENOMEM
+        self.notify_peak = 0
+        self.writes = 0
+        self.retries = 0            # gói phải gửi lại do loss
+        self.dropped = 0            # lần ghi bị mất hẳn (drop)
+        self.events = 0
+
+    # ====== API MicroPython (phía firmware) ======
+    def active(self, flag=None):
+        if flag is not None:
+            self._active = bool(flag)
+        return self._active
+
+    def irq(self, handler):
+        self._irq = handler
+
+    def config(self, *args, **kw):
+        if "mtu" in kw:
+            self._mtu_pref = kw["mtu"]
+        if args:
+            if args[0] == "mtu":
+                return self._mtu_pref
+            if args[0] == "mac":
+                return (0, b"\x24\x0a\xc4\x00\x00\x01")
+            raise ValueError("unknown config param")
+
+    def gatts_register_services(self, services):
+        out = []
+        for _uuid, chars in services:
+            self._next_handle += 1          # handle của khai báo service
+            hs = []
+            for c in chars:
+                h = self._next_handle + 1   # khai báo đặc tính + giá trị
+                self._next_handle += 2
+                self._values[h] = b""
+                self._uuids[bytes(c[0])] = h
+                hs.append(h)
+            out.append(tuple(hs))
+        return tuple(out)
+
+    def gatts_set_buffer(self, handle, size, append=False):
+        if handle not in self._values:
+            raise ValueError("bad handle")
+
+    def gatts_read(self, handle):
+        return self._values[handle]
+
+    def gatts_write(self, handle, data, send_update=False):
+        self._values[handle] = bytes(data)
+
+    def gatts_notify(self, conn, handle, data=None):
+        if conn != self.conn:
+            raise OSError(128)      # ENOTCONN
+        if data is None:
+            data = self._values[handle]
+        if len(self._down) >= self.notify_queue:
+            self.notify_full += 1
+            raise OSError(_ENOMEM)
+        # controller chỉ gửi tối đa MTU-3 byte (NimBLE cắt bớt phần dư)
+        self._down.append((handle, bytes(data[:self.mtu - 3])))
+        self.notifies += 1
+        if len(self._down) > self.notify_peak:
+            self.notify_peak = len(self._down)
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        if adv_data is not None and len(adv_data) > 31:
+            raise ValueError("adv data too long")
+        self.advertising = None if interval_us is None else (interval_us, adv_data, resp_data)
+
+    def gap_disconnect(self, conn):
+        if conn != self.conn:
+            return False
+        self.disconnect()
+        return True
+
+    # ====== Phía central (trình giả lập điều khiển) ======
+    def handle(self, uuid):
+        """Handle giá trị của đặc tính có UUID `uuid`."""
+        return self._uuids[bytes(uuid)]
+
+    def connect(self, central, mtu=247):
+        if self.advertising is None:
+            raise OSError("not advertising")
+        self.central = central
+        self.conn = _CONN_HANDLE
+        self.advertising = None
+        self._irq(_IRQ_CENTRAL_CONNECT, (self.conn, 0, b"\x00" * 6))
+        self.mtu = min(mtu, self._mtu_pref)
+        if self.mtu > 23:
+            self._irq(_IRQ_MTU_EXCHANGED, (self.conn, self.mtu))
+        return self.mtu
+
+    def disconnect(self):
+        if self.conn is None:
+            return
+        ch = self.conn
+        self.conn = None
+        self._down.clear()
+        self._up.clear()
+        central, self.central = self.central, None
+        if central:
+            central(None, None)     # báo host: mất kết nối
+        self._irq(_IRQ_CENTRAL_DISCONNECT, (ch, 0, b"\x00" * 6))
+
+    def write(self, handle, data):
+        """Host ghi (write without response): xếp hàng tới connection event kế tiếp."""
+        if len(data) > self.mtu - 3:
+            raise ValueError("write longer than MTU-3")
+        self._up.append((handle, bytes(data)))
+
+    def pending(self):
+        return len(self._up)
+
+    def _air(self):
+        # một gói trên không trung: True nếu tới nơi
+        if self.loss and self._rand.random() < self.loss:
+            self.retries += 1
+            return False
+        return True
+
+    def event(self):
+        """
+        Một connection event: tối đa `packets` gói mỗi chiều. Chỉ notify đã xếp
+        hàng trước event mới được phát (phản hồi cho lần ghi trong event này đi
+        ở event sau, như trên chip thật).
+        """
+        self.events += 1
+        ready = len(self._down)
+        for _ in range(self.packets):
+            if not self._up or self.conn is None:
+                break
+            if not self._air():
+                break
+            handle, data = self._up.popleft()
+            if self.drop and self._rand.random() < self.drop:
+                self.dropped += 1
+                continue
+            self.writes += 1
+            self._values[handle] = data
+            self._irq(_IRQ_GATTS_WRITE, (self.conn, handle))
+        for _ in range(min(self.packets, ready)):
+            if not self._down or self.conn is None:
+                break
+            if not self._air():
+                break
+            handle, data = self._down.popleft()
+            if self.central:
+                self.central(handle, data)
@@ -0,0 +1,36 @@
+# deflate.py — DeflateIO (chỉ đọc) dựng trên zlib của CPython
+import zlib
+
+RAW = 1
+ZLIB = 2
+GZIP = 3
+
+_WBITS = {RAW: -15, ZLIB: 15, GZIP: 31}
+
+class DeflateIO:
+    def __init__(self, stream, format=ZLIB, wbits=0):
+        self._s = stream
+        self._d = zlib.decompressobj(_WBITS[format])
+        self._pend = b""
+
+    def readinto(self, buf):
+        while not self._pend:
+            raw = self._s.read(256)
+            if not raw:
+                self._pend = self._d.flush()
+                break
+            self._pend = self._d.decompress(raw)
+        n = min(len(buf), len(self._pend))
+        buf[:n] = self._pend[:n]
+        self._pend = self._pend[n:]
+        return n
+
+    def read(self, n=-1):
+        out = bytearray()
+        b = bytearray(256)
+        while n < 0 or len(out) < n:
+            k = self.readinto(memoryview(b)[:256 if n < 0 else min(256, n - len(out))])
+            if not k:
+                break
+            out += b[:k]
+        return bytes(out)
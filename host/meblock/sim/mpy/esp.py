@@ -0,0 +1,6 @@
+# esp.py — bản thay thế tối giản cho CPython
+def osdebug(level, *args):
+    pass
+
+def flash_size():
+    return 4 * 1024 * 1024
@@ -0,0 +1,42 @@
+# esp32.py — NVS giả lập; mỗi thiết bị giả lập có kho riêng (bind trước khi nạp firmware)
+_ENOENT = 2
+
+_store = {}             # namespace -> {key: value}
+
+def bind(store):
+    """Các NVS(...) tạo sau đó dùng `store` (dict) làm bộ nhớ NVS của thiết bị."""
+    global _store
+    _store = store
+
+class NVS:
+    # ESP-IDF ghi ngay khi set_*, commit() chỉ đảm bảo đã xuống flash: ở đây là no-op
+    def __init__(self, namespace):
+        self._ns = _store.setdefault(namespace, {})
+
+    def _get(self, key):
+        try:
+            return self._ns[key]
+        except KeyError:
+            raise OSError(_ENOENT)
+
+    def set_i32(self, key, value):
+        self._ns[key] = int(value)
+
+    def get_i32(self, key):
+        return self._get(key)
+
+    def set_blob(self, key, value):
+        self._ns[key] = bytes(value.encode() if isinstance(value, str) else value)
+
+    def get_blob(self, key, buf):
+        v = self._get(key)
+        buf[:len(v)] = v
+        return len(v)
+
+    def erase_key(self, key):
+        if key not in self._ns:
+            raise OSError(_ENOENT)
+        del self._ns[key]
+
+    def commit(self):
+        pass
@@ -0,0 +1,61 @@
+# machine.py — bản thay thế tối giản cho CPython
+import time
+
+class DeviceReset(BaseException):
+    """
+    Nâng lên thay cho reset() thật để trình giả lập tự xử lý. Kế thừa
+    BaseException để các khối `except Exception` của firmware không nuốt mất
+    (reset() thật không bao giờ trả về).
+    """
+
+def reset():
+    raise DeviceReset()
+
+def soft_reset():
+    raise DeviceReset()
+
+# Timer đang chạy của thiết bị giả lập hiện hành; trình giả lập gọi run_timers()
+_timers = []
+
+def run_timers():
+    now = time.ticks_ms()
+    for t in list(_timers):
+        if t._due is not None and time.ticks_diff(now, t._due) >= 0:
+            t._fire(now)
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kw):
+        self.id = id
+        self._due = None
+        self._cb = None
+        self._period = 0
+        self._mode = Timer.ONE_SHOT
+        self._list = _timers
+        if kw:
+            self.init(**kw)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        if freq:
+            period = 1000 // freq
+        self._mode = mode
+        self._period = max(0, period)
+        self._cb = callback
+        self._due = time.ticks_add(time.ticks_ms(), self._period)
+        if self not in self._list:
+            self._list.append(self)
+
+    def deinit(self):
+        self._due = None
+        if self in self._list:
+            self._list.remove(self)
+
+    def _fire(self, now):
+        if self._mode == Timer.PERIODIC:
+            self._due = time.ticks_add(now, self._period)
+        else:
+            self.deinit()
+        if self._cb:
+            self._cb(self)
@@ -0,0 +1,33 @@
+# micropython.py — bản thay thế tối giản cho CPython
+def const(x):
+    return x
+
+# Hàng đợi schedule của thiết bị giả lập hiện hành (None: chạy ngay).
+# Giống MicroPython: tối đa 8 mục, đầy -> RuntimeError.
+_queue = None
+_DEPTH = 8
+
+def schedule(func, arg):
+    if _queue is None:
+        func(arg)
+        return
+    if len(_queue) >= _DEPTH:
+        raise RuntimeError("schedule queue full")
+    _queue.append((func, arg))
+
+def run_scheduled():
+    """
+    Chạy các hàm đã schedule (như VM làm giữa hai bytecode). Hàm được schedule
+    trong lúc chạy đợi lượt sau: trên chip, thời gian trôi giữa hai lượt (vd
+    sleep_ms khi thử lại notify) còn ở đây thì không.
+    """
+    q = _queue
+    for _ in range(len(q)):
+        func, arg = q.pop(0)
+        func(arg)
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+def mem_info(*args):
+    pass
@@ -0,0 +1,2 @@
+# ubinascii.py — ánh xạ sang binascii của CPython
+from binascii import *  # noqa: F401,F403
@@ -0,0 +1,2 @@
+# ubluetooth.py — tên cũ của bluetooth
+from bluetooth import *  # noqa: F401,F403
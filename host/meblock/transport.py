@@ -0,0 +1,227 @@
+# transport.py — lớp vận chuyển cho host: BLE thật (bleak) hoặc loopback trong tiến trình
+import asyncio
+import os
+
+# Nordic UART Service (khớp core/bleuart.py)
+NUS_SERVICE = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
+NUS_RX = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"     # host ghi
+NUS_TX = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"     # thiết bị notify
+
+class Transport:
+    """
+    Giao diện tối thiểu mà Client cần:
+      - connect()/close()
+      - write(data): một lần ghi GATT, len(data) <= max_write
+      - notify: gọi self._notify(bytes) mỗi khi thiết bị gửi dữ liệu
+    """
+    max_write = 20
+
+    def __init__(self):
+        self._notify = None
+
+    def set_notify(self, cb):
+        self._notify = cb
+
+    async def connect(self):
+        pass
+
+    async def write(self, data):
+        raise NotImplementedError
+
+    async def write_stream(self, data):
+        # cắt theo max_write; thiết bị tự ghép lại bằng vòng đệm RX
+        mv = memoryview(data)
+        for i in range(0, len(mv), self.max_write):
+            await self.write(mv[i:i + self.max_write])
+
+    async def close(self):
+        pass
+
+class BleakTransport(Transport):
+    """BLE thật qua thư viện bleak (pip install bleak)."""
+    def __init__(self, address=None, name=None, timeout=10.0):
+        super().__init__()
+        self.address = address
+        self.name = name
+        self.timeout = timeout
+        self._client = None
+
+    async def connect(self):
+        from bleak import BleakClient, BleakScanner
+        target = self.address
+        if target is None:
+            target = await BleakScanner.find_device_by_name(self.name, timeout=self.timeout)
+            if target is None:
+                raise OSError("device %r not found" % self.name)
+        self._client = BleakClient(target)
+        await self._client.connect()
+        # MTU - 3 byte header ATT
+        self.max_write = max(20, self._client.mtu_size - 3)
+        await self._client.start_notify(NUS_TX, lambda _h, data: self._notify(bytes(data)))
+
+    async def write(self, data):
+        await self._client.write_gatt_char(NUS_RX, bytes(data), response=False)
+
+    async def close(self):
+        if self._client:
+            await self._client.disconnect()
+            self._client = None
+
+class _LoopUART:
+    # đóng vai BLEUART cho BLEMain: send() đẩy thẳng sang host
+    def __init__(self, transport):
+        self._t = transport
+
+    def payload_size(self):
+        return self._t.max_write
+
+    def is_connected(self):
+        return True
+
+    def tx_room(self):
+        return 1 << 16      # send() giao thẳng cho host, không có hàng đợi
+
+    def cork(self):
+        pass
+
+    def uncork(self):
+        pass
+
+    def flush(self):
+        return True
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._t._deliver(data)
+        return len(data)
+
+class LoopbackTransport(Transport):
+    """
+    Chạy BLEMain của core/ble.py ngay trong tiến trình: mỗi write() gọi
+    BLEMain._on_rx như một lần ghi GATT. File của thiết bị nằm trong `root`.
+    """
+    def __init__(self, root, mtu=247, core_dir=None):
+        super().__init__()
+        from .sim import load_core, CORE_DIR
+        self.root = os.path.abspath(root)
+        self.max_write = mtu - 3
+        os.makedirs(self.root, exist_ok=True)
+        self.ble = self._in_root(load_core, core_dir or CORE_DIR)
+        self.device = self.ble.BLEMain()
+        self.device.uart = _LoopUART(self)
+        import machine      # bản thay thế trong sim/mpy
+        self._reset_exc = machine.DeviceReset
+        self.resets = 0
+
+    def _in_root(self, fn, *args):
+        # firmware dùng đường dẫn tương đối: chuyển cwd sang thư mục của thiết bị
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            return fn(*args)
+        finally:
+            os.chdir(cwd)
+
+    def _deliver(self, data):
+        if self._notify:
+            self._notify(bytes(data))
+
+    async def write(self, data):
+        try:
+            self._in_root(self.device._on_rx, bytes(data))
+        except self._reset_exc:
+            self.resets += 1
+        # nhường vòng lặp để phía host xử lý phản hồi
+        await asyncio.sleep(0)
+
+    async def close(self):
+        self._in_root(self.device._on_conn, False)
+
+class SimTransport(Transport):
+    """
+    Thiết bị giả lập đầy đủ (sim.Device): boot.py, BLEUART và BLEMain thật chạy
+    trên bộ điều khiển BLE giả lập. Mỗi `interval_ms` là một connection event;
+    host chỉ được xếp tối đa `host_queue` lần ghi chờ phát (như hàng đợi của
+    BLE stack phía máy tính). `link`: notify_queue, packets, loss, drop, seed.
+    `settings`: thay giá trị của setting.py, vd {"APP_RUNNER": True} cho RUN/STOP.
+    """
+    def __init__(self, root, mtu=247, interval_ms=7.5, host_queue=16, core_dir=None,
+                 quiet=True, settings=None, **link):
+        super().__init__()
+        from .sim import Device, CORE_DIR
+        self.mtu = mtu
+        self.interval = interval_ms / 1000
+        self.host_queue = host_queue
+        self.device = Device(root, core_dir or CORE_DIR, quiet=quiet, settings=settings, **link)
+        self._task = None
+        self._tick = None
+        self._inbox = []
+        self._rx_handle = None
+        self._app = None            # task runner.supervisor() của thiết bị (APP_RUNNER)
+        self._app_boot = 0
+
+    def _central(self, handle, data):
+        # gọi trong ngữ cảnh thiết bị: chỉ gom lại, giao cho host sau tick()
+        if data is None:
+            self._rx_handle = None      # thiết bị reset / ngắt kết nối
+        else:
+            self._inbox.append(data)
+
+    def _deliver(self):
+        inbox, self._inbox = self._inbox, []
+        if self._notify:
+            for data in inbox:
+                self._notify(data)
+
+    async def connect(self):
+        mtu = self.device.connect(self._central, self.mtu)
+        self.max_write = mtu - 3
+        self._rx_handle = self.device.handle(NUS_RX)
+        self._tick = asyncio.Event()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._pump())
+        self._start_app()
+        self._deliver()
+
+    def _start_app(self):
+        # mỗi lần thiết bị boot lại có runner mới: thay task supervisor cũ
+        dev = self.device
+        if dev.runner is None or self._app_boot == dev.boots:
+            return
+        if self._app:
+            self._app.cancel()
+        self._app_boot = dev.boots
+        self._app = asyncio.ensure_future(dev.runner.supervisor())
+
+    @property
+    def connected(self):
+        return self._rx_handle is not None
+
+    async def _pump(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.device.tick()
+            self._start_app()
+            self._deliver()
+            ev, self._tick = self._tick, asyncio.Event()
+            ev.set()
+
+    async def write(self, data):
+        while self.connected and self.device.pending() >= self.host_queue:
+            await self._tick.wait()
+        if not self.connected:
+            raise ConnectionError("device disconnected")
+        self.device.write(self._rx_handle, data)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._app:
+            self._app.cancel()
+            self._app = None
+            self._app_boot = 0
+        if self.connected:
+            self.device.disconnect()
+            self._rx_handle = None
@@ -0,0 +1,7 @@
+# conftest.py — chạy test từ gốc repo: python -m pytest -q host/tests
+import os
+import sys
+
+HOST = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HOST)
+sys.path.insert(0, os.path.join(os.path.dirname(HOST), "Lib"))      # ultrasonic.py
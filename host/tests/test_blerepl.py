@@ -0,0 +1,159 @@
+# test_blerepl.py — REPL qua BLE (core/blerepl.py) với dupterm giả trên SimTransport
+import asyncio
+import contextlib
+import io
+import struct
+
+import pytest
+
+from meblock import Client, ProtocolError, SimTransport
+
+
+class FakeREPL:
+    """pyexec tối giản trên luồng dupterm: REPL thường, raw và raw-paste như MicroPython."""
+    def __init__(self):
+        self.stream = None
+        self.mode = "friendly"
+        self.buf = b""
+        self.code = b""
+
+    def dupterm(self, s, slot=0):
+        prev, self.stream = self.stream, s
+        return prev
+
+    def out(self, b):
+        if self.stream:
+            self.stream.write(b)
+
+    def step(self):
+        b = bytearray(64)
+        while self.stream:
+            n = self.stream.readinto(b)
+            if not n:
+                break
+            for c in bytes(b[:n]):
+                self.ch(c)
+
+    def ch(self, c):
+        if self.mode == "paste":
+            if c == 4:
+                self.out(b"\x04")
+                self.run()
+                self.mode = "raw"
+                return
+            self.code += bytes([c])
+            if len(self.code) % 128 == 0:
+                self.out(b"\x01")               # cấp thêm cửa sổ
+            return
+        if self.mode == "raw":
+            self.buf += bytes([c])
+            if self.buf.endswith(b"\x05A\x01"):
+                self.out(b"R\x01" + struct.pack("<H", 128))
+                self.mode, self.code, self.buf = "paste", b"", b""
+            elif c == 2:
+                self.mode, self.buf = "friendly", b""
+                self.out(b"\r\nMicroPython fake\r\n>>> ")
+            return
+        if c == 1:
+            self.mode, self.buf = "raw", b""
+            self.out(b"raw REPL; CTRL-B to exit\r\n>")
+        elif c == 3:
+            self.out(b"\r\nKeyboardInterrupt\r\n>>> ")
+        else:
+            self.out(bytes([c]))
+
+    def run(self):
+        o, err = io.StringIO(), ""
+        try:
+            with contextlib.redirect_stdout(o):
+                exec(self.code.decode(), {})
+        except Exception as e:
+            err = "Traceback...\r\n%s: %s\r\n" % (type(e).__name__, e)
+        self.out(o.getvalue().replace("\n", "\r\n").encode() + b"\x04" + err.encode() + b"\x04>")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def repl_sim(tmp_path):
+    t = SimTransport(str(tmp_path))
+    rep = FakeREPL()
+    br = t.device.modules["blerepl"]
+    br._dupterm = rep.dupterm
+    return t, rep, br
+
+
+def _pump(t, rep):
+    async def pump():
+        while True:
+            await asyncio.sleep(0.002)
+            t.device.call(rep.step)
+    return asyncio.ensure_future(pump())
+
+
+def test_echo_and_raw_paste_exec(repl_sim):
+    t, rep, br = repl_sim
+    code = "\n".join("x%d = %d" % (i, i) for i in range(300)) + "\nprint('sum', x299 + x1)\n"
+
+    async def go():
+        pump = _pump(t, rep)
+        async with Client(t) as c:
+            assert (await c.repl()).startswith("OK REPL")
+            assert br.attached()
+            await c.term_write(b"hi")
+            assert await c.term_read(0.5) == b"hi"
+            out = await c.exec(code)                # > 128 B: nhiều lần cấp cửa sổ
+            with pytest.raises(ProtocolError, match="ZeroDivisionError"):
+                await c.exec("1/0")
+            banner = await c.term_read(0.5)
+        pump.cancel()
+        return out, banner
+
+    out, banner = run(go())
+    assert out == "sum 300\r\n"
+    assert b">>> " in banner                        # exec trả REPL về chế độ thường
+
+
+def test_prints_are_coalesced_into_few_notifies(repl_sim):
+    t, rep, br = repl_sim
+
+    async def go():
+        async with Client(t) as c:
+            await c.repl()
+            notifies = []
+            notify = t._notify
+            t._notify = lambda d: (notifies.append(d), notify(d))
+            for i in range(100):
+                t.device.call(br._term.write, b"tick %03d\r\n" % i)
+                await asyncio.sleep(0.002)
+            await asyncio.sleep(0.2)
+            got = b""
+            while got.count(b"tick") < 100:
+                got += await c.term_read(1)
+            return got, len(notifies)
+
+    got, n = run(go())
+    assert got == b"".join(b"tick %03d\r\n" % i for i in range(100))
+    assert n < 30
+
+
+def test_repl_off_and_disconnect_detach(repl_sim):
+    t, rep, br = repl_sim
+
+    async def go():
+        async with Client(t) as c:
+            await c.repl()
+            assert rep.stream is not None
+            assert (await c.repl(False)).startswith("OK REPL OFF")
+            assert not br.attached() and rep.stream is None
+            await c.repl()
+            assert br.attached()
+        await asyncio.sleep(0.2)
+        t.device.call(rep.out, b"x")
+        for _ in range(20):
+            t.device.tick()
+
+    run(go())
+    assert not br.attached()
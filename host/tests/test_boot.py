@@ -0,0 +1,58 @@
+# test_boot.py — trình tự khởi động của core/boot.py trên thiết bị giả lập (sim.Device)
+import asyncio
+import shutil
+import sys
+import time
+
+from meblock import Client, SimTransport
+from meblock.sim import CORE_DIR, Device
+
+def _main_files(root):
+    (root / "main.py").write_text("X = 1\n")
+    (root / "__mpy__").mkdir()
+    (root / "__mpy__" / "main.mpy").write_bytes(b"M\x06\x00\x1f")
+
+def test_ble_comes_up_first_and_phases_are_timed(tmp_path):
+    async def go():
+        async with Client(SimTransport(str(tmp_path))) as c:
+            return await c.stats()
+
+    stats = asyncio.run(go())
+    marks = [k for k in stats if k.startswith("boot_")]
+    assert marks == ["boot_start_ms", "boot_ble_ms", "boot_drd_ms", "boot_mpy_ms", "boot_done_ms"]
+    times = [stats[k] for k in marks]
+    assert times == sorted(times)
+
+def test_double_reset_removes_main(tmp_path):
+    _main_files(tmp_path)
+    dev = Device(str(tmp_path))     # boot đầu: đặt cờ DRD trong NVS
+    assert (tmp_path / "main.py").exists()
+    dev.boot()                      # reset lần hai trong cửa sổ
+    assert not (tmp_path / "main.py").exists()
+    assert not (tmp_path / "__mpy__" / "main.mpy").exists()
+
+def test_drd_window_expires_without_blocking(tmp_path):
+    _main_files(tmp_path)
+    t0 = time.monotonic()
+    dev = Device(str(tmp_path), settings={"DRD_TIMEOUT_MS": 200})
+    assert time.monotonic() - t0 < 0.2     # boot không chờ hết cửa sổ
+    assert dev.nvs
+    time.sleep(0.21)
+    dev.tick()                      # timer DRD -> schedule -> gỡ cờ
+    dev.boot()
+    assert (tmp_path / "main.py").exists()
+
+def test_run_falls_back_to_import_without_bytecache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", sys.path[:])  # sim.install() thêm bản core/ này vào đầu
+    core = tmp_path / "core"
+    shutil.copytree(CORE_DIR, core, ignore=shutil.ignore_patterns("__pycache__"))
+    (core / "bytecache.py").write_text("raise ImportError('broken')\n")
+    root = tmp_path / "dev"
+    root.mkdir()
+    (root / "hello.py").write_text("VALUE = 42\n")
+
+    dev = Device(str(root), str(core))
+    assert dev.boot_mod.bytecache is None
+    dev._app_call(dev.boot_mod.run, "hello")
+    assert sys.modules.pop("hello").VALUE == 42
+    assert "[BOOT] bytecache failed:" in " ".join(t for _, t in dev.modules["utility"].logs())
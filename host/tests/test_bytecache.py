@@ -0,0 +1,92 @@
+# test_bytecache.py — bytecode __mpy__/ (core/bytecache.py): stale, sweep lúc boot, rơi về .py
+import asyncio
+import os
+import sys
+
+import pytest
+
+from meblock import Client, SimTransport
+from meblock.sim import Device
+
+# chỉ header được kiểm tra (CPython không có sys.implementation._mpy), nội dung tùy ý
+MPY = b"M\x06\x00\x1f" + bytes(60)
+SRC = b"OK = 1\n"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _stamps(root):
+    try:
+        return (root / "__mpy__" / "stamps").read_text().split("\n")[:-1]
+    except OSError:
+        return None
+
+
+def test_new_source_drops_its_bytecode(tmp_path):
+    async def go():
+        async with Client(SimTransport(str(tmp_path))) as c:
+            name, _ = await c.put_module("prog.py", SRC, code=MPY)
+            assert name == "__mpy__/prog.mpy"
+            assert _stamps(tmp_path) == ["prog.py -1 0"]        # chưa có mã nguồn
+            await c.put("prog.py", SRC)
+            assert not (tmp_path / "__mpy__" / "prog.mpy").exists()
+            assert _stamps(tmp_path) is None
+            await c.put_module("prog.py", SRC, code=MPY)
+            st = os.stat(tmp_path / "prog.py")
+            assert _stamps(tmp_path) == ["prog.py %d %d" % (st.st_size, int(st.st_mtime))]
+
+    run(go())
+
+
+@pytest.mark.parametrize("name, code", [
+    ("junk.py", b"nope" * 10),          # không phải .mpy: từ chối lúc DONE
+    ("pkg/m.py", MPY),                  # module trong gói: từ chối lúc PUT
+])
+def test_rejected_bytecode_falls_back_to_source(tmp_path, name, code):
+    async def go():
+        async with Client(SimTransport(str(tmp_path))) as c:
+            return await c.put_module(name, SRC, code=code)
+
+    written, _ = run(go())
+    assert written == name
+    assert (tmp_path / name).read_bytes() == SRC
+    assert not (tmp_path / "__mpy__" / (name[:-3] + ".mpy")).exists()
+
+
+def test_boot_sweeps_bytecode_of_edited_source(tmp_path):
+    async def go():
+        async with Client(SimTransport(str(tmp_path))) as c:
+            await c.put("a.py", SRC)
+            await c.put("b.py", SRC)
+            await c.put_module("a.py", SRC, code=MPY)
+            await c.put_module("b.py", SRC, code=MPY)
+
+    run(go())
+    # sửa a.py ngoài giao thức (REPL, mpremote): mốc size/mtime không còn khớp
+    (tmp_path / "a.py").write_bytes(SRC + b"# edited\n")
+    os.utime(tmp_path / "a.py", (0, os.stat(tmp_path / "b.py").st_mtime + 5))
+    Device(str(tmp_path))
+    assert not (tmp_path / "__mpy__" / "a.mpy").exists()
+    assert (tmp_path / "__mpy__" / "b.mpy").exists()
+    assert [s.split()[0] for s in _stamps(tmp_path)] == ["b.py"]
+
+
+def test_load_drops_rejected_bytecode_and_imports_source(tmp_path, monkeypatch):
+    # CPython không nạp được .mpy: prog.py tự báo lỗi như MicroPython khi bytecode còn đó
+    (tmp_path / "prog.py").write_text(
+        "import os\ntry:\n    os.stat('__mpy__/prog.mpy')\n"
+        "    raise ValueError('incompatible .mpy file')\nexcept OSError:\n    pass\nOK = 1\n")
+    (tmp_path / "__mpy__").mkdir()
+    (tmp_path / "__mpy__" / "prog.mpy").write_bytes(MPY)
+    dev = Device(str(tmp_path))
+    st = os.stat(tmp_path / "prog.py")
+    (tmp_path / "__mpy__" / "stamps").write_text("prog.py %d %d\n" % (st.st_size, int(st.st_mtime)))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "prog", raising=False)
+
+    m = dev.call(dev.modules["bytecache"].load, "prog")
+    assert m.OK == 1
+    assert not (tmp_path / "__mpy__" / "prog.mpy").exists()
+    assert _stamps(tmp_path) is None
@@ -0,0 +1,61 @@
+# test_fleet.py — nạp nhiều thiết bị mô phỏng cùng lúc (meblock.fleet)
+import asyncio
+import os
+
+from meblock import SimTransport
+from meblock.fleet import ad_fields, discover_sim, program, summary
+
+FILES = [("main.py", b"import asyncio\nasync def main():\n    await asyncio.sleep(1)\n"),
+         ("big.bin", os.urandom(30000))]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _sims(tmp_path, n, **kw):
+    return [SimTransport(str(tmp_path / ("dev%d" % i)), **kw) for i in range(n)]
+
+
+def test_discover_matches_advertised_name_and_service(tmp_path):
+    sims = _sims(tmp_path, 2)
+    name, services = ad_fields(*sims[0].device.radio.advertising[1:])
+    assert name.startswith("MEBLOCK")
+    assert services == ["6e400001-b5a3-f393-e0a9-e50e24dcca9e"]
+    assert [label for label, _ in discover_sim(sims, "MEBLOCK")] == ["dev0", "dev1"]
+    assert discover_sim(sims, "OTHER") == []
+
+
+def test_program_survives_a_dropped_link(tmp_path):
+    sims = _sims(tmp_path, 4)
+    victim = sims[1]
+
+    async def chaos():
+        while not victim.connected:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        victim.device.disconnect()
+
+    async def go():
+        drop = asyncio.ensure_future(chaos())
+        res = await program(discover_sim(sims), FILES, concurrency=2, timeout=0.5, backoff=0.05)
+        await drop
+        return res
+
+    res = run(go())
+    assert all(r.ok and r.files == 2 for r in res), summary(res, 1.0)
+    assert res[1].attempts == 2 and all(r.attempts == 1 for r in res if r is not res[1])
+    for i in range(4):
+        for name, data in FILES:
+            assert (tmp_path / ("dev%d" % i) / name).read_bytes() == data
+    assert summary(res, 1.0)[-1].startswith("[FLEET] 4/4 ok")
+
+
+def test_failed_run_does_not_resend_finished_bundle(tmp_path):
+    # APP_RUNNER tắt: RUN luôn ERR UNKNOWN, các lần thử lại không được gửi lại BUNDLE
+    sims = _sims(tmp_path, 1)
+    res = run(program(discover_sim(sims), FILES, timeout=0.5, retries=2, backoff=0.01, run=True))[0]
+    assert not res.ok and res.attempts == 3
+    assert "ERR UNKNOWN" in res.error
+    assert res.files == 2 and res.sent == sum(len(d) for _, d in FILES)
+    assert (tmp_path / "dev0" / "big.bin").read_bytes() == FILES[1][1]
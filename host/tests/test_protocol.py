@@ -0,0 +1,326 @@
+# test_protocol.py — giao thức file của core/ble.py qua LoopbackTransport / SimTransport
+import asyncio
+import os
+import tracemalloc
+import zlib
+
+import pytest
+
+from meblock import Client, LoopbackTransport, ProtocolError, SimTransport
+from meblock import client as client_mod
+
+def run(coro):
+    return asyncio.run(coro)
+
+# ====== Vòng đệm RX / hàng đợi TX ======
+@pytest.mark.parametrize("mtu", [23, 247])
+def test_heap_does_not_grow_with_transfer_size(tmp_path, mtu):
+    t = SimTransport(str(tmp_path), mtu=mtu)
+    peak, live = {}, {}
+
+    async def go():
+        async with Client(t) as c:
+            await c.put("warm.bin", os.urandom(4096))
+            base = t.device.heap_live()
+            for n in (8192, 65536):
+                t.device.heap_peak = 0
+                await c.put("x%d.bin" % n, os.urandom(n))
+                peak[n] = t.device.heap_peak
+                live[n] = t.device.heap_live() - base
+            return await c.stats()
+
+    tracemalloc.start()
+    try:
+        stats = run(go())
+    finally:
+        tracemalloc.stop()
+    # cấp phát tạm mỗi lượt xử lý không phụ thuộc kích thước file, không giữ lại gì
+    assert peak[65536] <= peak[8192] + 256
+    assert live[65536] < 1024
+    assert stats["rx_overflow"] == 0
+    ble, uart = t.device.ble, t.device.ble.uart
+    assert t.device.rx_peak <= len(ble._rx)
+    assert t.device.txq_peak <= len(uart._txq)
+
+def test_rx_overflow_is_reported(tmp_path):
+    async def go():
+        async with Client(LoopbackTransport(str(tmp_path))) as c:
+            await c.send_line("X" * 5000)
+            line = await c.readline()
+            return line, await c.ping()
+
+    line, pong = run(go())
+    assert line.startswith("ERR OVERFLOW")
+    assert pong == "PONG"
+
+def test_failing_handler_does_not_wedge_rx(tmp_path):
+    t = LoopbackTransport(str(tmp_path))
+
+    def boom(arg):
+        bytes(arg).decode()     # b"\xff" -> UnicodeDecodeError
+    t.device.register("BOOM", boom)
+
+    async def go():
+        async with Client(t) as c:
+            await t.write_stream(b"BOOM \xff\nPING\n")
+            first = await c.readline()
+            return first, await c.readline(), await c.ping()
+
+    first, pong, again = run(go())
+    assert first.startswith("ERR BOOM")
+    assert pong == again == "PONG"
+    assert t.device._rx_head == t.device._rx_tail
+
+# ====== PUT / resume ======
+@pytest.mark.parametrize("binary", [True, False])
+def test_put_roundtrip(tmp_path, binary):
+    data = os.urandom(20000)
+
+    async def go():
+        async with Client(LoopbackTransport(str(tmp_path), mtu=185)) as c:
+            await c.put("lib/x.bin", data, window=8, binary=binary)
+            return await c.get("lib/x.bin")
+
+    assert run(go()) == data
+    assert (tmp_path / "lib" / "x.bin").read_bytes() == data
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_lost_chunk_is_nakked_and_resent_go_back_n(tmp_path, binary):
+    data = os.urandom(20000)
+    t = LoopbackTransport(str(tmp_path))
+    write = t.write
+    n = []
+
+    async def lossy(b):
+        # mất đúng một chunk giữa cửa sổ (chunk thứ 5 sau PUT)
+        n.append(b)
+        if len(n) != 6:
+            await write(b)
+    t.write = lossy
+
+    async def go():
+        async with Client(t) as c:
+            st = await c.put("f.bin", data, window=8, binary=binary)
+            return st, await c.stats()
+
+    st, stats = run(go())
+    assert (tmp_path / "f.bin").read_bytes() == data
+    assert stats["naks"] >= 1
+    # go-back-N: chỉ gửi lại từ chunk bị mất, không phải cả file
+    assert 0 < st.retransmits <= 8
+
+def test_put_rejects_negative_size_and_clamps_window(tmp_path):
+    async def go():
+        async with Client(LoopbackTransport(str(tmp_path))) as c:
+            with pytest.raises(ProtocolError, match="ERR PUT SIZE"):
+                await c.command("PUT x.bin -1")
+            with pytest.raises(ProtocolError, match="ERR PUT SIZE"):
+                await c.command("PUT x.bin 10 OFFSET=-4")
+            reply = await c.command("PUT x.bin 3 WIN=-5")
+            await c.send_line("DATA eHl6")
+            return reply, await c.readline(), await c.command("DONE")
+
+    reply, ack, done = run(go())
+    assert reply.startswith("OK PUT x.bin 3") and "WIN" not in reply
+    assert ack == "OK 0" and done == "OK SAVED"     # dừng-chờ: mỗi DATA một "OK <seq>"
+    assert (tmp_path / "x.bin").read_bytes() == b"xyz"
+
+def test_put_resume_after_disconnect(tmp_path):
+    data = os.urandom(40000)
+    t = LoopbackTransport(str(tmp_path))
+
+    class Cut(Exception):
+        pass
+
+    def cut(stats):
+        if stats.sent > 15000:
+            raise Cut()
+
+    async def go():
+        with pytest.raises(Cut):
+            async with Client(t) as c:
+                await c.put("big.bin", data, progress=cut)
+        async with Client(t) as c:
+            name, size, done = await c.resume()
+            assert (name, size) == ("big.bin", len(data))
+            assert 0 < done < len(data)
+            stats = await c.put("big.bin", data, offset=done)
+            assert stats.sent == len(data) - done
+
+    run(go())
+    assert (tmp_path / "big.bin").read_bytes() == data
+    assert not (tmp_path / "big.bin.part").exists()
+
+def test_disconnect_suspends_upload_outside_irq(tmp_path):
+    data = os.urandom(40000)
+    t = SimTransport(str(tmp_path))
+    ble = t.device.ble
+
+    class Cut(Exception):
+        pass
+
+    def cut(stats):
+        if stats.sent > 15000:
+            raise Cut()
+
+    async def go():
+        with pytest.raises(Cut):
+            async with Client(t) as c:
+                await c.put("big.bin", data, progress=cut)
+        # IRQ mất kết nối chỉ đánh dấu; phiên được dọn ở lượt xử lý đã schedule
+        assert ble._put is not None and ble._rx_lost != ble._rx_closed
+        t.device.tick()
+        assert ble._put is None and ble._rx_lost == ble._rx_closed
+        async with Client(t) as c:
+            name, size, done = await c.resume()
+            assert (name, size) == ("big.bin", len(data)) and done > 0
+            await c.put("big.bin", data, offset=done)
+
+    run(go())
+    assert (tmp_path / "big.bin").read_bytes() == data
+
+def test_put_resends_from_bad_block(tmp_path):
+    data = os.urandom(20000)
+    t = LoopbackTransport(str(tmp_path))
+    write = t.write
+    hit = []
+
+    async def corrupt(b):
+        # lật một byte dữ liệu trong block thứ ba, chỉ ở lượt gửi đầu
+        if not hit and len(b) > 100 and bytes(b[:4]) != b"PUT " and t.device._put["w"].written > 9000:
+            hit.append(len(b))
+            b = bytes(b[:-1]) + bytes([b[-1] ^ 0xFF])
+        await write(b)
+    t.write = corrupt
+
+    async def go():
+        async with Client(t) as c:
+            return await c.put("f.bin", data)
+
+    stats = run(go())
+    assert hit
+    assert (tmp_path / "f.bin").read_bytes() == data
+    # chỉ gửi lại từ đầu block hỏng (4096 * 2), không phải cả file
+    assert stats.sent == len(data) - 8192
+
+# ====== DELTA ======
+@pytest.mark.parametrize("binary", [True, False])
+def test_put_delta_sends_only_changed_blocks(tmp_path, binary):
+    old = os.urandom(32768)
+    new = bytearray(old)
+    new[10000:10004] = b"EDIT"
+    new += b"tail"
+
+    async def go():
+        async with Client(LoopbackTransport(str(tmp_path))) as c:
+            full = await c.put("f.bin", old, binary=binary)
+            delta = await c.put("f.bin", bytes(new), binary=binary, delta=True)
+            return full, delta
+
+    full, delta = run(go())
+    assert (tmp_path / "f.bin").read_bytes() == new
+    assert delta.chunks < full.chunks // 4
+
+def test_put_delta_without_old_file(tmp_path):
+    async def go():
+        async with Client(LoopbackTransport(str(tmp_path))) as c:
+            await c.put("new.bin", b"abc" * 100, delta=True)
+
+    run(go())
+    assert (tmp_path / "new.bin").read_bytes() == b"abc" * 100
+
+def test_hash_reply_is_paged_to_fit_tx_queue(tmp_path):
+    old = os.urandom(200000)
+    (tmp_path / "big.bin").write_bytes(old)
+    t = SimTransport(str(tmp_path), mtu=23)
+    sent = []
+
+    async def go():
+        async with Client(t) as c:
+            send = t.device.ble.uart.send
+            t.device.ble.uart.send = lambda s: (sent.append(len(s)), send(s))[1]
+            return await c.hashes("big.bin", 512)
+
+    size, block, crcs = run(go())
+    assert (size, block) == (len(old), 512)
+    assert crcs == [zlib.crc32(old[i:i + 512]) for i in range(0, len(old), 512)]
+    # 391 CRC không vừa một dòng: nhiều trang, mỗi trang vừa hàng đợi TX
+    assert len(sent) > 1 and max(sent) <= len(t.device.ble.uart._txq)
+
+# ====== BUNDLE ======
+def test_bundle_is_atomic(tmp_path, monkeypatch):
+    (tmp_path / "a.py").write_bytes(b"OLD\n")
+    files = [("a.py", b"A = 1\n" * 100), ("lib/b.py", b"B = 2\n" * 100)]
+    deflate = client_mod.deflate
+
+    def corrupt(data):
+        # luồng zlib hỏng cho file thứ hai: CRC vẫn đúng, chỉ lỗi lúc giải nén trên thiết bị
+        out = deflate(data)
+        return out[:2] + b"\xff" * 8 + out[10:] if data.startswith(b"B") else out
+
+    async def go():
+        async with Client(LoopbackTransport(str(tmp_path))) as c:
+            monkeypatch.setattr(client_mod, "deflate", corrupt)
+            with pytest.raises(ProtocolError):
+                await c.bundle(files, compress=True)
+            assert (tmp_path / "a.py").read_bytes() == b"OLD\n"
+            assert not (tmp_path / "lib" / "b.py").exists()
+            monkeypatch.setattr(client_mod, "deflate", deflate)
+            return await c.bundle(files, compress=True)
+
+    stats = run(go())
+    assert len(stats) == 2
+    for name, data in files:
+        assert (tmp_path / name).read_bytes() == data
+    left = [p.name for p in tmp_path.rglob("*") if p.suffix in (".part", ".inz")]
+    assert left == []
+
+# ====== STATS / LOGS ======
+def test_stats_count_hot_paths_and_reset(tmp_path):
+    async def go():
+        async with Client(SimTransport(str(tmp_path))) as c:
+            await c.put("a.bin", os.urandom(10000))
+            before = await c.stats(reset=True)
+            after = await c.stats()
+            return before, after, await c.logs(4)
+
+    before, after, logs = run(go())
+    assert before["rx_bytes"] > 10000 and before["rx_frames"] > 0
+    assert before["chunks"] > 0 and before["flash_writes"] == 3    # 4096 + 4096 + 1808
+    assert before["tx_bytes"] > 0 and before["rx_overflow"] == 0
+    assert after["chunks"] == after["flash_writes"] == 0
+    assert after["rx_lines"] == 1       # chỉ dòng STATS vừa rồi
+    assert any("Saved a.bin 10000" in text for _, text in logs)
+
+# ====== Phản hồi dài ở MTU nhỏ ======
+@pytest.mark.parametrize("link", [{}, {"notify_queue": 2}])
+def test_logs_long_reply_at_mtu_23(tmp_path, link):
+    async def go():
+        async with Client(SimTransport(str(tmp_path), mtu=23, **link)) as c:
+            for i in range(30):
+                await c.put("f%d.txt" % i, b"x")
+            return await c.logs(32)
+
+    logs = run(go())
+    assert len(logs) == 32
+    assert any("f29.txt" in text for _, text in logs)
+
+# ====== Bytecode (__mpy__) ======
+@pytest.mark.parametrize("runner", [False, True])
+def test_main_bytecode_needs_runner_when_main_py_exists(tmp_path, runner):
+    code = b"M\x06\x00\x1f" + b"\x00" * 60     # chỉ header được kiểm tra trong trình giả lập
+    t = SimTransport(str(tmp_path), settings={"APP_RUNNER": runner})
+
+    async def go():
+        async with Client(t) as c:
+            await c.put("main.py", b"OLD = 1\n")
+            return await c.put_module("main.py", b"NEW = 1\n", code=code)
+
+    saved, _ = run(go())
+    main_mpy = tmp_path / "__mpy__" / "main.mpy"
+    if runner:
+        assert saved == "__mpy__/main.mpy" and main_mpy.read_bytes() == code
+    else:
+        # firmware sẽ chạy main.py: bytecode bị từ chối, mã nguồn mới được gửi thay
+        assert saved == "main.py" and not main_mpy.exists()
+        assert (tmp_path / "main.py").read_bytes() == b"NEW = 1\n"
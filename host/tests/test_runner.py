@@ -0,0 +1,105 @@
+# test_runner.py — RUN/STOP của runner qua SimTransport (APP_RUNNER bật)
+import asyncio
+import sys
+
+import pytest
+
+from meblock import Client, LoopbackTransport, ProtocolError, SimTransport
+
+PROG = b'''import asyncio
+count = 0
+async def main():
+    global count
+    while True:
+        count += 1
+        await asyncio.sleep(0.01)
+'''
+
+RUNNER = {"APP_RUNNER": True}
+
+
+@pytest.fixture(autouse=True)
+def _forget_main():
+    yield
+    sys.modules.pop("main", None)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_run_restarts_with_fresh_module_and_stop_unloads(tmp_path):
+    t = SimTransport(str(tmp_path), settings=RUNNER)
+
+    async def go():
+        async with Client(t, timeout=2) as c:
+            r = t.device.runner
+            assert await c.stop() is None           # chưa chạy gì: STOP NONE
+            await c.put("main.py", PROG)
+            assert await c.run() == "main"
+            await asyncio.sleep(0.1)
+            assert r.running() == "main"
+            first = sys.modules["main"]
+            assert first.count > 0
+
+            # nạp lại không cần reset: module mới, chạy bản mới
+            await c.put("main.py", PROG.replace(b"count += 1", b"count += 2"))
+            assert await c.run() == "main"
+            await asyncio.sleep(0.1)
+            assert sys.modules["main"] is not first
+            assert sys.modules["main"].count % 2 == 0
+
+            assert await c.stop() == "main"
+            assert r.running() is None
+            assert "main" not in sys.modules
+            assert await c.ping() == "PONG"         # BLE vẫn sống sau STOP
+
+    run(go())
+
+
+def test_run_reports_import_errors_and_nomain(tmp_path):
+    (tmp_path / "main.py").write_bytes(b'def run():\n    print("hi")\n')
+    t = SimTransport(str(tmp_path), settings=RUNNER)
+
+    async def go():
+        async with Client(t, timeout=2) as c:
+            with pytest.raises(ProtocolError, match="NOMAIN"):
+                await c.run()
+            with pytest.raises(ProtocolError, match="No module named 'nope'"):
+                await c.run("nope")
+            assert await c.ping() == "PONG"
+            return [text for _, text in await c.logs()]
+
+    logs = run(go())
+    assert "[APP] start failed: main NOMAIN" in logs
+
+
+@pytest.mark.parametrize("make", [
+    lambda root: SimTransport(root),                # APP_RUNNER mặc định tắt
+    lambda root: LoopbackTransport(root),           # không có runner
+])
+def test_run_is_unknown_without_runner(tmp_path, make):
+    async def go():
+        async with Client(make(str(tmp_path)), timeout=2) as c:
+            with pytest.raises(ProtocolError, match="UNKNOWN"):
+                await c.run()
+
+    run(go())
+
+
+def test_run_and_stop_report_norunner_after_supervisor_exits(tmp_path):
+    (tmp_path / "main.py").write_bytes(PROG)
+    t = SimTransport(str(tmp_path), settings=RUNNER)
+
+    async def go():
+        async with Client(t, timeout=2) as c:
+            assert await c.run() == "main"
+            t._app.cancel()                 # như Ctrl-C dừng asyncio.run(supervisor())
+            await asyncio.sleep(0.05)
+            with pytest.raises(ProtocolError, match="NORUNNER"):
+                await c.run()
+            with pytest.raises(ProtocolError, match="NORUNNER"):
+                await c.stop()
+            assert await c.ping() == "PONG"
+
+    run(go())
@@ -0,0 +1,104 @@
+# test_telemetry.py — giải mã frame STREAM và luồng telemetry qua SimTransport
+import asyncio
+import os
+import struct
+import sys
+import time
+
+import pytest
+
+from meblock import Client, ProtocolError, SimTransport, decode_frame
+
+PROG = b'''import asyncio, telemetry
+n = 0
+def count():
+    global n
+    n += 1
+    return n
+telemetry.add("n", count)
+telemetry.add("half", lambda: n / 2, 10)
+telemetry.add("none", lambda: None)
+async def main():
+    while True:
+        await asyncio.sleep(1)
+'''
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _frame(seq, t0, recs, nsrc):
+    body = struct.pack("<BBI", seq, nsrc, t0)
+    for dt, vals in recs:
+        body += struct.pack("<H%dh" % nsrc, dt, *vals)
+    return bytes([0, len(body)]) + body
+
+
+def test_decode_frame_offsets_ticks_and_maps_missing_values():
+    f = _frame(7, 0xFFFFFFF0, [(0, (1, -32768)), (32, (-5, 300))], 2)
+    seq, samples = decode_frame(f)
+    assert seq == 7
+    assert samples == [(0xFFFFFFF0, (1, None)), (0x10, (-5, 300))]     # t0 + dt quấn 32 bit
+
+
+@pytest.mark.parametrize("frame", [
+    b"\x00\x06\x01\x01\x00\x00",                        # ngắn hơn header
+    b"\x01\x06\x01\x01\x00\x00\x00\x00",                 # sai byte đánh dấu
+    b"\x00\x09\x01\x01\x00\x00\x00\x00",                 # len không khớp
+])
+def test_decode_frame_rejects_malformed(frame):
+    with pytest.raises(ProtocolError):
+        decode_frame(frame)
+
+
+def test_stream_delivers_every_sample_while_uploading(tmp_path):
+    t = SimTransport(str(tmp_path), settings={"APP_RUNNER": True})
+    data = os.urandom(50000)
+
+    async def go():
+        async with Client(t, timeout=2) as c:
+            await c.put("main.py", PROG)
+            await c.run()
+            hz, names = await c.stream(100)
+            assert names == ["n", "half", "none"]
+            st = await c.put("big.bin", data)       # upload chen giữa luồng
+            got = []
+            end = time.monotonic() + 0.3
+            while time.monotonic() < end:
+                got += await c.samples()
+            n, dropped = await c.stream_off()
+            return hz, got, n, dropped, st
+
+    try:
+        hz, got, n, dropped, st = run(go())
+    finally:
+        sys.modules.pop("main", None)
+    assert hz == 100
+    assert (tmp_path / "big.bin").read_bytes() == data
+    assert st.retransmits == 0 and dropped == 0
+    ns = [v[0] for _, v in got]
+    assert len(ns) > 10 and ns == list(range(ns[0], ns[0] + len(ns)))     # không mất mẫu
+    assert all(half == n * 5 and none is None for n, half, none in (v for _, v in got))
+    ticks = [tk for tk, _ in got]
+    assert ticks == sorted(ticks)
+
+
+def test_stream_stops_when_link_drops(tmp_path):
+    t = SimTransport(str(tmp_path), settings={"APP_RUNNER": True})
+
+    async def go():
+        async with Client(t, timeout=2) as c:
+            await c.put("main.py", PROG)
+            await c.run()
+            await c.stream(20)
+            assert t.device.boot_mod.telemetry.streaming()
+        await asyncio.sleep(0.1)
+        t.device.tick()
+        t.device.tick()
+
+    try:
+        run(go())
+    finally:
+        sys.modules.pop("main", None)
+    assert not t.device.boot_mod.telemetry.streaming()
@@ -0,0 +1,100 @@
+# test_ultrasonic.py — bộ lọc trung vị và SonarScheduler của Lib/ultrasonic.py qua TraceSource
+import asyncio
+import random
+import statistics
+import time
+
+import pytest
+
+import ultrasonic
+from ultrasonic import HCSR04, SonarScheduler, TraceSource
+
+
+def _us(mm):
+    return mm * 582 // 100
+
+
+def _sensor(trace, **kw):
+    return HCSR04(None, None, pulse_source=TraceSource(trace), **kw)
+
+
+def test_filter_is_running_median_over_size_and_window():
+    rnd = random.Random(1)
+    trace, t = [], 0
+    for _ in range(2000):
+        t += rnd.choice((10, 20, 50, 300))
+        trace.append((t, rnd.randint(100, 14000) if rnd.random() < 0.9 else 60000))
+    s = _sensor(trace, filter_gate_mm=0)        # gate 0: luôn là trung vị
+    win = []
+    for t, us in trace:
+        mm = HCSR04._to_mm(us)
+        win = [(w, v) for w, v in win if t - w <= 500][-4:] + [(t, mm)]
+        assert abs(s.distance_mm() - statistics.median(v for _, v in win)) <= 0.5
+
+
+def test_gate_passes_motion_and_rejects_spikes():
+    s = _sensor([(i * 20, _us(mm)) for i, mm in enumerate((200, 200, 2000, 205, 260, 320))])
+    got = [s.distance_mm() for _ in range(6)]
+    assert got[2] == 200                        # vọng sai -> trung vị
+    assert got[3] == 205                        # lệch ít -> mẫu mới, không trễ
+    assert got[4:] == [260, 320]                # vật ra xa dần: mẫu mới vẫn được dùng ngay
+    assert s.latest() == 32.0
+
+
+def test_latest_ages_out_and_lost_echo_raises():
+    src = TraceSource([(0, _us(500)), (100, -1), (700, _us(500))])
+    s = HCSR04(None, None, pulse_source=src)
+    assert s.latest() is None
+    assert s.distance_cm() == 50.0
+    with pytest.raises(OSError, match="Out of range"):
+        s.distance_cm()
+    assert s.latest(max_age_ms=50) is None      # đồng hồ của bộ lọc chạy theo vết
+    assert s.latest(max_age_ms=200) == 50.0
+    assert s.distance_cm(filter=False) == pytest.approx(500 * 582 // 100 / 58.2, abs=0.1)
+
+
+def test_filter_window_survives_tick_wrap():
+    wrap = 0x40000000
+    s = _sensor([(wrap - 40, _us(300)), (wrap - 20, _us(300)), (wrap, _us(900)),
+                 (wrap + 20, _us(900)), (wrap + 40, _us(900))], filter_gate_mm=0)
+    got = [s.distance_mm() for _ in range(5)]
+    assert got == [300, 300, 300, 600, 900]     # mẫu trước khi quấn vẫn trong cửa sổ
+
+
+def test_ticks_wrap_at_30_bits_like_micropython():
+    # fallback CPython hoặc time.ticks_* của trình giả lập: cùng miền 30 bit
+    assert 0 <= ultrasonic.ticks_ms() < 0x40000000
+    assert ultrasonic.ticks_diff(5, 0x3FFFFFFB) == 10
+    assert ultrasonic.ticks_diff(0x3FFFFFFB, 5) == -10
+
+
+def test_scheduler_spaces_pings_and_counts_misses(monkeypatch):
+    # CPython asyncio không có sleep_ms
+    monkeypatch.setattr(asyncio, "sleep_ms", lambda ms: asyncio.sleep(ms / 1000), raising=False)
+    pings = []
+
+    class Source(TraceSource):
+        def __init__(self, us):
+            super().__init__([(0, us)] * 1000)
+
+        def pulse_us(self):
+            pings.append((self, time.monotonic()))
+            return super().pulse_us()
+
+    near, far, lost = Source(_us(300)), Source(_us(1500)), Source(-1)
+    sensors = [HCSR04(None, None, pulse_source=src) for src in (near, far, lost)]
+
+    async def go():
+        sonar = SonarScheduler(sensors, spacing_ms=30)
+        sonar.start()
+        await asyncio.sleep(0.4)
+        sonar.stop()
+        return sonar.misses
+
+    misses = asyncio.run(go())
+    assert [s.latest() for s in sensors] == [30.0, 150.0, None]
+    order = [src for src, _ in pings]
+    assert order[:6] == [near, far, lost] * 2              # lần lượt, từng cảm biến một
+    assert misses == order.count(lost) > 0
+    gaps = [b - a for (_, a), (_, b) in zip(pings, pings[1:])]
+    assert min(gaps) >= 0.028